@@ -29,7 +29,7 @@ from pyeit.eit.utils import eit_scan_lines
 import pyeit.eit.jac as jac
 import sys
 sys.path.append( '../' )
-from util.sparse_geeklet import csr_trim0,sparse_cholesky
+from util.sparse_geeklet import csr_trim0,sparse_cholesky,sparse_expker
 import os,pickle
 try:
     from joblib import Parallel, delayed
@@ -142,13 +142,14 @@ class EIT:
 #             pDist=np.load(os.path.join(folder,fname+'.npz'))['ker_dist']
 #             print('Pairwise distance '+fname+' loaded!')
 #         except:
-        pDist=spd.pdist(self.pts)
+#         pDist=spd.pdist(self.pts)
 #             if not os.path.exists(folder): os.makedirs(folder)
 #             np.savez_compressed(file=os.path.join(folder,fname),ker_dist=pDist)
         sigma=kwargs.pop('sigma',1.)
         rho=kwargs.pop('rho',.05)
-        K = sps.csr_matrix(sigma**2*np.exp(-spd.squareform(pDist)/(2*rho)))
-        csr_trim0(K,1e-8)
+#         K = sps.csr_matrix(sigma**2*np.exp(-spd.squareform(pDist)/(2*rho)))
+#         csr_trim0(K,1e-8)
+        K = sparse_expker(self.pts,sigma,rho,threshold=kwargs.pop('threshold',1e-8))
         return K
     
     def get_obs(self,**kwargs):
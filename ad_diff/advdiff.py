@@ -254,8 +254,26 @@ class advdiff(TimeDependentAD,SpaceTimePointwiseStateObservation):
             self_.R = self.prior.R
             self_.applyR = self.prior.applyR
         HessApply = ReducedHessian(self_, misfit_only=MF_only)
+        if MF_only:
+            HessApply.matmat = self._get_HessApply_block # block action used by randomized eigensolvers
         return HessApply
     
+    def _get_HessApply_block(self, dM):
+        """
+        Compute the (Gauss-Newton) Hessian apply of misfit on multiple vectors (columns of dM) at once,
+        solving the 2nd order forward/adjoint equations for all columns with the same factorizations.
+        """
+        u_hat = self.pde.solveFwdIncremental_block(dM)
+        # apply Wuu at observation times
+        times = np.array(self.simulation_times[1:])
+        rhs_adj = [np.zeros(u_t.shape) for u_t in u_hat]
+        for t in self.misfit.observation_times:
+            i = np.argmin(abs(times-t))
+            Bu_t = mat_blockmult(self.misfit.B, u_hat[i])/self.misfit.noise_variance
+            rhs_adj[i] = mat_blockmult(self.misfit.B, Bu_t, transp=True)
+        p_hat = self.pde.solveAdjIncremental_block(rhs_adj)
+        return -mat_blockmult(self.pde.Mt_stab, p_hat)
+    
     def get_geom(self,parameter=None,geom_ord=[0],whitened=False,log_level=dl.LogLevel.ERROR,**kwargs):
         """
         Get necessary geometric quantities including log-likelihood (0), adjusted gradient (1), 
@@ -264,6 +282,7 @@ class advdiff(TimeDependentAD,SpaceTimePointwiseStateObservation):
         if parameter is None:
             parameter=self.prior.mean
         loglik=None; agrad=None; HessApply=None; eigs=None;
+        eigs0=kwargs.pop('eigs0',None) # eigen-pairs at a nearby parameter to warm-start the eigen-decomposition
         # set log level: DBG(10), TRACE(13), PROGRESS(16), INFO(20,default), WARNING(30), ERROR(40), or CRITICAL(50)
         dl.set_log_level(log_level)
         
@@ -306,24 +325,42 @@ class advdiff(TimeDependentAD,SpaceTimePointwiseStateObservation):
                 kwargs['k']=k
 #             if self.rank == 0:
 #                 print('Double Pass Algorithm. Requested eigenvectors: {0}; Oversampling {1}.'.format(k,p))
-            Omega = MultiVector(parameter, k+p)
-            parRandom.normal(1., Omega)
-            if whitened:
-                eigs = singlePassGx(HessApply, self.prior.M, self.prior.Msolver, Omega, **kwargs)
-            else:
-                eigs = doublePassG(HessApply, self.prior.R, self.prior.Rsolver, Omega, **kwargs)
+            if eigs0 is not None and 'k' in kwargs:
+                # recycle the previous eigen-vectors with a few fresh random directions
+                B, Binv = (self.prior.M, self.prior.Msolver) if whitened else (self.prior.R, self.prior.Rsolver)
+                eigs = singlePassG_warm(HessApply, B, Binv, eigs0[1], k)
+            if eigs is None:
+                Omega = MultiVector(parameter, k+p)
+                parRandom.normal(1., Omega)
+                if whitened:
+                    eigs = singlePassGx(HessApply, self.prior.M, self.prior.Msolver, Omega, **kwargs)
+                else:
+                    eigs = doublePassG(HessApply, self.prior.R, self.prior.Rsolver, Omega, **kwargs)
             if any(s>1.5 for s in geom_ord):
                 # adjust the gradient using low-rank approximation
                 self.post_Ga = GaussianLRPosterior(getattr(self,{True:'wht',False:''}[whitened]+'prior'), eigs[0], eigs[1])
-                Hu = self.generate_vector(PARAMETER)
-                self.post_Ga.Hlr.mult(parameter,Hu) # post_Ga.Hlr=posterior precision
-                agrad.axpy(1.,Hu)
-                Ru = self.generate_vector(PARAMETER)
-                getattr(self,{True:'wht',False:''}[whitened]+'prior').grad(parameter,Ru)
-                agrad.axpy(-1.,Ru)
+                self.adjust_grad(parameter,agrad)
         
         return loglik,agrad,HessApply,eigs
     
+    def adjust_grad(self,parameter,agrad,post_Ga=None,whitened=False):
+        """
+        Adjust the gradient with the low-rank approximate posterior post_Ga (self.post_Ga by default).
+        Hlr of hIPPYlib's GaussianLRPosterior is the posterior precision, so the prior gradient is removed: agrad + Hlr*parameter - prior.grad(parameter);
+        otherwise (e.g. post_Ga of emulated geometry) Hlr approximates the misfit Hessian only: agrad + Hlr*parameter.
+        """
+        if post_Ga is None: post_Ga=self.post_Ga
+        if whitened:
+            parameter=self.whtprior.v2u(parameter)
+        Hu = self.generate_vector(PARAMETER)
+        post_Ga.Hlr.mult(parameter,Hu)
+        agrad.axpy(1.,Hu)
+        if isinstance(post_Ga,GaussianLRPosterior):
+            Ru = self.generate_vector(PARAMETER)
+            post_Ga.prior.grad(parameter,Ru)
+            agrad.axpy(-1.,Ru)
+        return agrad
+    
     def get_eigs(self,parameter=None,whitened=False,**kwargs):
         """
         Get the eigen-decomposition of Hessian action directly using randomized algorithm.
@@ -575,6 +612,9 @@ if __name__ == '__main__':
     adif = advdiff(mesh=meshsz, eldeg=eldeg, gamma=gamma, delta=delta, rel_noise=rel_noise, nref=nref, seed=seed)
     # test
     adif.test(1e-8)
+    # check the gradient with fixed low-rank approximate posterior
+    from sampler.fixed_post_Ga import check_fixed
+    check_fixed(adif,adif.prior.sample(),k=20)
     # obtain MAP
     map_v = adif.get_MAP(rand_init=False)
     fig=dl.plot(vector2Function(map_v,adif.pde.Vh[PARAMETER]))
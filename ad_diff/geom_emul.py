@@ -13,8 +13,23 @@ from util.Eigen import *
 from posterior import *
 
 
+def _get_ll_f(bip):
+    """
+    Log-likelihood function of emulator outputs, kept on bip so that its compiled kernels are reused
+    and rebuilt (with the data as constants) when the data change
+    """
+    obs,nz_var=bip.misfit.obs,bip.misfit.noise_variance
+    ll_f=getattr(bip,'_ll_f',None)
+    if ll_f is None or not (np.array_equal(ll_f.obs,obs) and np.array_equal(ll_f.nz_var,nz_var)):
+        obs,nz_var=np.array(obs),np.array(nz_var)
+        ll_f=lambda y: -0.5*tf.math.reduce_sum((y-obs)**2/nz_var,axis=1)
+        ll_f.obs,ll_f.nz_var=obs,nz_var
+        bip._ll_f=ll_f
+    return ll_f
+
 def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
     loglik=None; gradlik=None; metact=None; rtmetact=None; eigs=None
+    eigs0=kwargs.pop('eigs0',None) # eigen-pairs at a nearby parameter to warm-start the eigen-decomposition
     
     # un-whiten if necessary
     if whitened:
@@ -23,14 +38,17 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
     eldeg = bip.prior.V.ufl_element().degree()
     u_input = {'DNN':unknown.get_local()[None,:] if eldeg==1 else vinP1(unknown,bip.prior.V).get_local()[None,:], 'CNN':bip.vec2img(unknown)[None,:,:,None]}[type(emulator).__name__]
     
-    ll_f = lambda x: -0.5*tf.math.reduce_sum((emulator.model(x)-bip.misfit.obs)**2/bip.misfit.noise_variance,axis=1)
+    # log-likelihood function of emulator output
+    ll_f = _get_ll_f(bip)
     
-    if any(s>=0 for s in geom_ord):
-        loglik = ll_f(u_input).numpy()
+    if any(s>=1 for s in geom_ord):
+        # loglik and its gradient from one forward and backward pass
+        loglik, gradlik_ = emulator.value_and_gradient(u_input, ll_f)
+    elif any(s>=0 for s in geom_ord):
+        loglik = ll_f(emulator.model(u_input)).numpy()
     
     if any(s>=1 for s in geom_ord):
         inP1 = kwargs.pop('inP1',False)
-        gradlik_ = emulator.gradient(u_input, ll_f)
         if type(emulator).__name__=='DNN':
             gradlik = vec2fun(gradlik_,df.FunctionSpace(bip.prior.V.mesh(), 'Lagrange', 1)).vector() if eldeg==1 or inP1 else vinPn(gradlik_, bip.prior.V)
         elif type(emulator).__name__=='CNN':
@@ -39,26 +57,47 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
             gradlik = bip.prior.C_act(gradlik,.5)
     
     if any(s>=1.5 for s in geom_ord):
-        jac_ = emulator.jacobian(u_input)
-        n_obs = len(bip.misfit.obs)
-        jac = MultiVector(unknown,n_obs)
-        [jac[i].set_local({'DNN':jac_[i] if eldeg==1 else vinPn(jac_[i],bip.prior.V),'CNN':bip.img2vec(jac_[i], bip.prior.V if eldeg>1 else None)}[type(emulator).__name__]) for i in range(n_obs)]
+        # emulated Gauss-Newton metric J' Gamma^(-1) J acting by JVP followed by VJP through the emulator, without forming J
+        if type(emulator).__name__=='DNN':
+            if eldeg==1:
+                to_in = lambda U: U.T
+                to_out = lambda G: G.T
+            else:
+                # P1->Pn interpolation matrix P (the linear map of vinPn) on the output and its transpose on the input so that the metric P J' Gamma^(-1) J P' is symmetric
+                if not hasattr(bip,'_P1toPn'):
+                    bip._P1toPn = df.PETScDMCollection.create_transfer_matrix(df.FunctionSpace(bip.prior.V.mesh(), 'Lagrange', 1), bip.prior.V)
+                to_in = lambda U: mat_blockmult(bip._P1toPn,U,transp=True).T
+                to_out = lambda G: mat_blockmult(bip._P1toPn,G.T)
+        elif type(emulator).__name__=='CNN':
+            if eldeg==1 and hasattr(bip,'meshsz'):
+                # index map between dofs and image pixels
+                def to_in(U):
+                    im = np.zeros((U.shape[1],np.prod(u_input.shape[1:])))
+                    im[:,bip.marker] = U.T
+                    return im.reshape((-1,)+u_input.shape[1:])
+                to_out = lambda G: G.reshape((G.shape[0],-1))[:,bip.marker].T
+            else:
+                to_in = lambda U: np.stack([bip.vec2img(bip.prior.gen_vector(u)) for u in U.T])[:,:,:,None]
+                to_out = lambda G: np.array([bip.img2vec(np.squeeze(g), bip.prior.V if eldeg>1 else None).get_local() for g in G]).T
+        def _get_metact_misfit_block(U_actedon): # GNH on columns of U_actedon
+            JU = emulator.jvp(u_input,to_in(U_actedon))
+            return mat_blockmult(bip.prior.M,to_out(emulator.vjp(u_input,JU/bip.misfit.noise_variance)))
         def _get_metact_misfit(u_actedon): # GNH
-            if type(u_actedon) is not df.Vector:
-                u_actedon = bip.prior.gen_vector(u_actedon)
-            v = bip.prior.gen_vector()
-            jac.reduce(v,jac.dot(u_actedon)/bip.misfit.noise_variance)
-            return bip.prior.M*v
+            if type(u_actedon) is not np.ndarray:
+                u_actedon = u_actedon.get_local()
+            return bip.prior.gen_vector(_get_metact_misfit_block(u_actedon[:,None])[:,0])
         def _get_rtmetact_misfit(u_actedon):
-            if type(u_actedon) is df.Vector:
+            if type(u_actedon) is not np.ndarray:
                 u_actedon = u_actedon.get_local()
-            v = bip.prior.gen_vector()
-            jac.reduce(v,u/np.sqrt(bip.misfit.noise_variance))
+            v = bip.prior.gen_vector(to_out(emulator.vjp(u_input,u_actedon[None,:]/np.sqrt(bip.misfit.noise_variance)))[:,0])
             return bip.prior.rtM*v
         metact = _get_metact_misfit
+        metact.matmat = _get_metact_misfit_block
         rtmetact = _get_rtmetact_misfit
         if whitened:
             metact = lambda u: bip.prior.C_act(_get_metact_misfit(bip.prior.C_act(u,.5)),.5) # ppGNH
+            metact.matmat = lambda U: np.array([bip.prior.C_act(Ma,.5).get_local() for Ma in
+                                                _get_metact_misfit_block(np.array([bip.prior.C_act(u,.5).get_local() for u in U.T]).T).T]).T
             rtmetact = lambda u: bip.prior.C_act(_get_rtmetact_misfit(u),.5)
     
     if any(s>1 for s in geom_ord) and len(kwargs)!=0:
@@ -69,10 +108,10 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
                 invMa=bip.prior.gen_vector()
                 bip.prior.Msolver.solve(invMa,a)
                 return invMa
-            eigs = geigen_RA(metact, lambda u: bip.prior.M*u, invM, dim=bip.pde.V.dim(),**kwargs)
+            eigs = geigen_RA(metact, lambda u: bip.prior.M*u, invM, dim=bip.pde.V.dim(),eigs0=eigs0,**kwargs)
         else:
             # generalized eigen-decomposition (F, _C^(-1)), i.e. F = _C^(-1) U D U^(-1), U' _C^(-1) U = I, V = _C^(-1/2) U
-            eigs = geigen_RA(metact,lambda u: bip.prior.C_act(u,-1),lambda u: bip.prior.C_act(u),dim=bip.pde.V.dim(),**kwargs)
+            eigs = geigen_RA(metact,lambda u: bip.prior.C_act(u,-1),lambda u: bip.prior.C_act(u),dim=bip.pde.V.dim(),eigs0=eigs0,**kwargs)
         if any(s>1.5 for s in geom_ord):
             # adjust the gradient
             # update low-rank approximate Gaussian posterior
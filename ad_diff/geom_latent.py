@@ -53,6 +53,7 @@ def geom(unknown_lat,bip_lat,bip,autoencoder,geom_ord=[0],whitened=False,**kwarg
     
     emul_geom=kwargs.pop('emul_geom',None)
     full_geom=kwargs.pop('full_geom',None)
+    eigs0=kwargs.pop('eigs0',None) # eigen-pairs (in latent space) at a nearby parameter to warm-start the eigen-decomposition
     try:
         if len(kwargs)==0:
             loglik,gradlik,metact_,rtmetact_ = emul_geom(unknown,geom_ord,whitened=='emulated',inP1=True)
@@ -111,10 +112,10 @@ def geom(unknown_lat,bip_lat,bip,autoencoder,geom_ord=[0],whitened=False,**kwarg
                 invMa=bip_lat.prior.gen_vector()
                 bip_lat.prior.Msolver.solve(invMa,a)
                 return invMa
-            eigs = geigen_RA(metact, lambda u: bip_lat.prior.M*u, invM, dim=bip_lat.prior.V.dim(),**kwargs)
+            eigs = geigen_RA(metact, lambda u: bip_lat.prior.M*u, invM, dim=bip_lat.prior.V.dim(),eigs0=eigs0,**kwargs)
         else:
             # generalized eigen-decomposition (F, _C^(-1)), i.e. F = _C^(-1) U D U^(-1), U' _C^(-1) U = I, V = _C^(-1/2) U
-            eigs = geigen_RA(metact,lambda u: bip_lat.prior.C_act(u,-1),lambda u: bip_lat.prior.C_act(u),dim=bip_lat.prior.V.dim(),**kwargs)
+            eigs = geigen_RA(metact,lambda u: bip_lat.prior.C_act(u,-1),lambda u: bip_lat.prior.C_act(u),dim=bip_lat.prior.V.dim(),eigs0=eigs0,**kwargs)
         if any(s>1.5 for s in geom_ord):
             # adjust the gradient
             # update low-rank approximate Gaussian posterior
@@ -12,6 +12,7 @@ import numpy as np
 import sys
 sys.path.append( "../" )
 from util.bayesianStats import effectiveSampleSize as ess
+from util.sample_store import load_samples
 from joblib import Parallel, delayed
 
 # def restore_each_sample(f,samp_f,s):
@@ -19,6 +20,13 @@ from joblib import Parallel, delayed
 #     return samp_f.vector()
 
 def restore_sample(mpi_comm,V,dir_name,f_name,num_samp):
+    try:
+        # bulk read of samples stored in one chunked dataset
+        samp=load_samples(os.path.join(dir_name,f_name),stop=num_samp)
+        print(f_name+' has been read!')
+        return samp
+    except KeyError:
+        pass # samples stored in separate groups 'sample_{s}' by older versions
     f=df.HDF5File(mpi_comm,os.path.join(dir_name,f_name),"r")
     samp_f=df.Function(V,name="parameter")
     samp=np.zeros((num_samp,V.dim()))
@@ -35,7 +43,8 @@ def restore_sample(mpi_comm,V,dir_name,f_name,num_samp):
     return samp
 
 def get_ESS(samp):
-    ESS=Parallel(n_jobs=4)(map(delayed(ess), np.transpose(samp)))
+#     ESS=Parallel(n_jobs=4)(map(delayed(ess), np.transpose(samp)))
+    ESS=ess(samp) # all coordinates at once
     return ESS
 
 if __name__ == '__main__':
@@ -7,6 +7,7 @@ Modified for DREAM December 2020 @ ASU
 
 import os,pickle
 import numpy as np
+import h5py
 import dolfin as df
 import tensorflow as tf
 
@@ -17,8 +18,10 @@ from nn.ae import AutoEncoder
 from nn.cae import ConvAutoEncoder
 from nn.vae import VAE
 from tensorflow.keras.models import load_model
-from util.dolfin_gadget import vec2fun
+from util.dolfin_gadget import vec2fun,vinPn
 from util.multivector import *
+from util.latent_decoder import LatentDecoder, summarize
+from get_ESS_dolfin import restore_sample
 
 
 # functions needed to make even image size
@@ -138,7 +141,17 @@ std_v=MultiVector(adif.prior.gen_vector(),num_algs)
 hdf5_files=[f for f in os.listdir(folder) if f.endswith('.h5')]
 pckl_files=[f for f in os.listdir(folder) if f.endswith('.pckl')]
 num_samp=5000
-prog=np.ceil(num_samp*(.1+np.arange(0,1,.1)))
+# latent-to-full decoder with precomputed index maps
+if 'c' in AE:
+    width=tuple(np.mod(i,2) for i in adif_latent.vec2img(adif_latent.prior.gen_vector()).shape)
+    def lat2in(v):
+        im=adif_latent.vec2img(adif_latent.prior.gen_vector(v))
+        return chop(im,width)[:,:,None] if autoencoder.activations['latent'] is None else im.flatten()
+    out2full=lambda y: adif.img2vec(pad(np.squeeze(y),width),adif.prior.V if eldeg>1 else None).get_local()
+else:
+    lat2in=None
+    out2full=None if eldeg==1 else lambda y: vinPn(y.flatten(), adif.prior.V).get_local()
+decoder=LatentDecoder(autoencoder,adif_latent.prior.V.dim(),lat2in,out2full)
 for i in range(num_algs):
     print('Getting estimates for '+algs[i]+' algorithm...')
     # obtain weights
@@ -158,47 +171,27 @@ for i in range(num_algs):
     bip=adif_latent if 'DREAM' in algs[i] else adif
     # calculate posterior estimates
     found=False
-    samp_f=df.Function(bip.prior.V,name="parameter")
-    samp_mean=adif.prior.gen_vector(); samp_mean.zero()
-    samp_std=adif.prior.gen_vector(); samp_std.zero()
-#     num_read=0
     for f_i in hdf5_files:
         if '_'+algs[i]+'_' in f_i:
             try:
-                f=df.HDF5File(bip.pde.mpi_comm,os.path.join(folder,f_i),"r")
-                samp_mean.zero(); samp_std.zero(); num_read=0
-                for s in range(num_samp):
-                    if s+1 in prog:
-                        print('{0:.0f}% has been completed.'.format(np.float(s+1)/num_samp*100))
-                    f.read(samp_f,'sample_{0}'.format(s))
-                    u=samp_f.vector()
-                    if '_whitened_latent' in f_i: u=bip.prior.v2u(u)
-                    if 'DREAM' in algs[i]:
-                        if 'c' in AE:
-                            u_latin=adif_latent.vec2img(u)
-                            width=tuple(np.mod(i,2) for i in u_latin.shape)
-                            u_latin=chop(u_latin,width)[None,:,:,None] if autoencoder.activations['latent'] is None else u_latin.flatten()[None,:]
-                            u=adif.img2vec(pad(np.squeeze(autoencoder.decode(u_latin)),width),adif.prior.V if eldeg>1 else None)
-                        else:
-                            u_latin=u.get_local()[None,:]
-                            u_decoded=autoencoder.decode(u_latin).flatten()
-                            u=adif.prior.gen_vector(u_decoded) if eldeg==1 else vinPn(u_decoded, adif.prior.V)
-#                     else:
-#                         u=u_
-                    if '_whitened_emulated' in f_i: u=adif.prior.v2u(u)
-                    samp_mean.axpy(wts[s],u)
-                    samp_std.axpy(wts[s],u*u)
-#                     num_read+=1
-                f.close()
+                samp=os.path.join(folder,f_i)
+                with h5py.File(samp,'r') as f:
+                    if 'samples' not in f: samp=restore_sample(bip.pde.mpi_comm,bip.prior.V,folder,f_i,num_samp) # samples stored in separate groups by older versions
+                pre=(lambda U: np.array([bip.prior.v2u(bip.prior.gen_vector(u)).get_local() for u in U])) if '_whitened_latent' in f_i else (lambda U: U)
+                post=(lambda U: np.array([adif.prior.v2u(adif.prior.gen_vector(u)).get_local() for u in U])) if '_whitened_emulated' in f_i else (lambda U: U)
+                # read (and decode) samples in chunks
+                if 'DREAM' in algs[i]:
+                    samp_mean,samp_std=decoder.summarize(samp,wts,pre=pre,post=post,num_samp=num_samp)
+                else:
+                    samp_mean,samp_std=summarize(samp,wts,transform=lambda U: post(pre(U)),num_samp=num_samp)
                 print(f_i+' has been read!')
                 f_read=f_i
                 found=True
             except:
                 pass
     if found:
-#         samp_mean=samp_mean/num_read; samp_std=samp_std/num_read
         mean_v[i].set_local(samp_mean)
-        std_v[i].set_local(np.sqrt((samp_std - samp_mean*samp_mean).get_local()))
+        std_v[i].set_local(samp_std)
 # save
 samp_f=df.Function(adif.prior.V,name="mv")
 with df.HDF5File(adif.mpi_comm,os.path.join(folder,'mcmc_mean.h5'),"w") as f:
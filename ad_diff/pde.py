@@ -26,6 +26,7 @@ from hippylib import *
 
 sys.path.append( "../" )
 from util.common_colorbar import common_colorbar
+from util.dolfin_gadget import mat_blockmult,solve_blockrhs
 
 class codomain(dl.SubDomain):
     """
@@ -299,6 +300,32 @@ class TimeDependentAD:
             sol.store(p, t)  
         self.soln_count[3] += 1
     
+    def solveFwdIncremental_block(self, dM):
+        """
+        Solve the 2nd order forward equation for multiple directions (columns of dM) at once,
+        with the incremental source given by applyC; return the solutions at simulation_times[1:]
+        """
+        sol = []
+        myrhs = -mat_blockmult(self.M_stab, dM)
+        for t in self.simulation_times[1::]:
+            u = solve_blockrhs(self.solver, myrhs)
+            sol.append(u)
+            myrhs = mat_blockmult(self.M_stab, u)
+        self.soln_count[2] += dM.shape[1]
+        return sol
+    
+    def solveAdjIncremental_block(self, rhs):
+        """
+        Solve the 2nd order adjoint equation for multiple right hand sides at once,
+        rhs: list of blocks at simulation_times[1:]; return the solution at simulation_times[1]
+        (the solution at the initial time is not needed by applyCt)
+        """
+        p = np.zeros(rhs[0].shape)
+        for rhs_t in rhs[::-1]:
+            p = solve_blockrhs(self.solvert, mat_blockmult(self.Mt_stab, p)+rhs_t)
+        self.soln_count[3] += p.shape[1]
+        return p
+    
     def applyC(self, dm, out):
         out.zero()
         myout = dl.Vector()
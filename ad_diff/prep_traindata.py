@@ -6,7 +6,10 @@ Shiwei Lan @ ASU, November 2020
 import dolfin as df
 import numpy as np
 
-import os, pickle
+import os, sys, pickle
+sys.path.append( "../" )
+from util.latent_decoder import _linmap,_apply
+from optimizer.ensemble_store import is_ensemble_store,read_ensemble
 
 TRAIN={0:'XimgY',1:'XY'}[1]
 whiten=False
@@ -42,6 +45,25 @@ def retrieve_ensemble(bip,dir_name,f_name,ensbl_sz,max_iter,img_out=False,whiten
     f.close()
     return out
 
+def read_ensemble_store(bip,dir_name,f_name,max_iter,img_out=False,whiten=False):
+    """
+    Read ensembles (and forward outputs) streamed by EnsembleStore with one contiguous read;
+    the (linear) conversion of members, e.g. whitening and to images, is precomputed once and applied to all
+    """
+    ensbl_f=df.Function(bip.prior.V)
+    eldeg=bip.prior.V.ufl_element().degree()
+    if eldeg>1: d2v = df.dof_to_vertex_map(df.FunctionSpace(bip.mesh,'Lagrange',1))
+    def vec2out(x):
+        ensbl_f.vector().set_local(x)
+        ensbl_v=bip.prior.u2v(ensbl_f.vector()) if whiten else ensbl_f.vector()
+        if img_out:
+            return bip.vec2img(ensbl_v) # convert to images
+        else:
+            return ensbl_f.compute_vertex_values(bip.mesh)[d2v] if eldeg>1 else ensbl_v.get_local() # convert to P1 space (keep dof order) if necessary
+    out_shape,out_map=_linmap(vec2out,ensbl_f.vector().size())
+    transform=lambda X: _apply(out_map,X).reshape((-1,)+out_shape)
+    return read_ensemble(os.path.join(dir_name,f_name),max_iter,'Y' in TRAIN,transform)
+
 if __name__ == '__main__':
     from advdiff import advdiff
     # define the inverse problem
@@ -71,12 +93,16 @@ if __name__ == '__main__':
     # prepare data
     for a in range(num_algs):
         print('Working on '+algs[a]+' algorithm...')
-        found=False
+        found=False; fwdout=None
         # ensembles
         for f_i in hdf5_files:
             if algs[a]+'_ensbl'+str(ensbl_sz)+'_' in f_i:
                 try:
-                    out=retrieve_ensemble(adif,folder,f_i,ensbl_sz,max_iter,img_out,whiten)
+                    if is_ensemble_store(os.path.join(folder,f_i)):
+                        out=read_ensemble_store(adif,folder,f_i,max_iter,img_out,whiten)
+                        if 'Y' in TRAIN: out,fwdout=out
+                    else:
+                        out=retrieve_ensemble(adif,folder,f_i,ensbl_sz,max_iter,img_out,whiten)
                     print(f_i+' has been read!')
                     found=True; break
                 except Exception as e:
@@ -103,7 +129,7 @@ if __name__ == '__main__':
                 plt.show()
                 plt.pause(1.0/10.0)
         # forward outputs
-        if 'Y' in TRAIN:
+        if 'Y' in TRAIN and fwdout is None:
             for f_i in pckl_files:
                 if algs[a]+'_ensbl'+str(ensbl_sz)+'_' in f_i:
                     try:
@@ -25,6 +25,18 @@ sys.path.append( "../../" )
 from hippylib import *
 
 
+def _MatMvMult(A,X,Y):
+    """
+    Action of A on MultiVector X: block action A.matmat on all vectors at once if available,
+    otherwise vector by vector as in MatMvMult of hIPPYlib
+    """
+    if hasattr(A,'matmat'):
+        AX=A.matmat(np.array([X[i].get_local() for i in range(X.nvec())]).T)
+        for i in range(Y.nvec()):
+            Y[i].set_local(AX[:,i]); Y[i].apply('insert')
+    else:
+        MatMvMult(A,X,Y)
+
 def _lr_eig(Omega,T,k,Q):
     """
     The low-rank eigen-decomposition based on projected matrix T
@@ -46,6 +58,83 @@ def _lr_eig(Omega,T,k,Q):
     
     return d, U
 
+def singlePassG_rank(A,B,Binv,Omega,k,s=1,check=False):
+    """
+    Get partial generalized eigen-pairs of pencile (A,B) using randomized algorithms for fixed rank.
+    Same as singlePassG in hIPPYlib but A is applied to all random vectors in one block if possible.
+    """
+    nvec  = Omega.nvec()
+    
+    assert(nvec >= k )
+    
+    Ybar = MultiVector(Omega[0], nvec)
+    Y_pr = MultiVector(Omega)
+    Q = MultiVector(Omega)
+    for i in range(s):
+        Y_pr.swap(Q)
+        _MatMvMult(A, Y_pr, Ybar)
+        MatMvMult(Solver2Operator(Binv), Ybar, Q)
+    
+    BQ, _ = Q.Borthogonalize(B)
+    
+    Xt = Y_pr.dot_mv(BQ)
+    Wt = Ybar.dot_mv(Q)
+    Tt = np.linalg.solve(Xt,Wt)
+                
+    T = .5*Tt + .5*Tt.T
+    
+    d, U = _lr_eig(Omega,T,k,Q)
+    
+    if check:
+        check_g(A,B, U, d)
+    
+    return d, U
+
+def singlePassG_warm(A,B,Binv,U0,k,q=3,tol=0.1,check=False):
+    """
+    Get partial generalized eigen-pairs of pencile (A,B) for fixed rank, warm-started from (B-orthonormal) eigen-vectors U0 of a nearby pencile.
+    The sketch consists of U0 and q fresh random vectors, so k+q instead of k+p actions of A are needed.
+    Return None if the relative residual of U0 at their Rayleigh quotients exceeds tol, in which case a full recompute is needed.
+    """
+    if U0.nvec()<k:
+        return None
+    Omega = MultiVector(U0[0], k+q)
+    parRandom.normal(1., Omega)
+    for i in range(k):
+        Omega[i].zero(); Omega[i].axpy(1., U0[i])
+    
+    Ybar = MultiVector(Omega[0], k+q)
+    Q = MultiVector(Omega)
+    _MatMvMult(A, Omega, Ybar)
+    MatMvMult(Solver2Operator(Binv), Ybar, Q)
+    
+    # residual check of the recycled eigen-vectors: |A u_i - rho_i B u_i|_{Binv}
+    rho = np.array([U0[i].inner(Ybar[i]) for i in range(k)])
+    BU0 = MultiVector(U0)
+    MatMvMult(B, U0, BU0)
+    res2 = 0.
+    for i in range(k):
+        r_bar = Ybar[i].copy(); r_bar.axpy(-rho[i], BU0[i])
+        r = Q[i].copy(); r.axpy(-rho[i], U0[i])
+        res2 += r_bar.inner(r)
+    if np.sqrt(max(res2,0)/np.sum(rho**2))>tol:
+        return None
+    
+    BQ, _ = Q.Borthogonalize(B)
+    
+    Xt = Omega.dot_mv(BQ)
+    Wt = Ybar.dot_mv(Q)
+    Tt = np.linalg.solve(Xt,Wt)
+                
+    T = .5*Tt + .5*Tt.T
+    
+    d, U = _lr_eig(Omega,T,k,Q)
+    
+    if check:
+        check_g(A,B, U, d)
+    
+    return d, U
+
 def singlePassG_prec(A,B,Binv,Omega,incr_k=20,s=1,check=False,dim=None,thld=.01):
     """
     Get partial generalized eigen-pairs of pencile (A,B) based on the threshold using randomized algorithms for fixed precision.
@@ -66,7 +155,7 @@ def singlePassG_prec(A,B,Binv,Omega,incr_k=20,s=1,check=False,dim=None,thld=.01)
     Q = MultiVector(Omega)
     for i in range(s):
         Y_pr.swap(Q)
-        MatMvMult(A, Y_pr, Ybar)
+        _MatMvMult(A, Y_pr, Ybar)
         MatMvMult(Solver2Operator(Binv), Ybar, Q)
     
     BQ, _ = Q.Borthogonalize(B)
@@ -128,7 +217,7 @@ def singlePassGx(A,B,invB,Omega,**kwargs):
     Get partial generalized eigen-pairs of pencile (A,B) using singlePass randomized algorithm.
     """
     if 'k' in kwargs:
-        eigs = singlePassG(A,B,invB,Omega,**kwargs)
+        eigs = singlePassG_rank(A,B,invB,Omega,**kwargs)
     elif 'thld' in kwargs:
         eigs = singlePassG_prec(A,B,invB,Omega,**kwargs)
     else:
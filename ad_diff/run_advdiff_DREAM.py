@@ -23,6 +23,7 @@ from nn.ae import AutoEncoder
 from nn.cae import ConvAutoEncoder
 from nn.vae import VAE
 from sampler.DREAM_dolfin import DREAM
+from util.latent_decoder import LatentDecoder
 
 # relevant geometry
 import geom_emul
@@ -202,7 +203,19 @@ def main():
     print("Preparing %s sampler with step size %g for %d step(s)..."
           % (args.algs[args.algNO],args.step_sizes[args.algNO],args.step_nums[args.algNO]))
     
-    dream=DREAM(u0,adif_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,log_wts=False)#,AE=autoencoder)#,k=5) # uncomment for manifold algorithms
+    # latent-to-full decoder with precomputed index maps for online summaries in the original space
+    if 'c' in args.aes[args.aeNO]:
+        width=tuple(np.mod(i,2) for i in adif_latent.vec2img(adif_latent.prior.gen_vector()).shape)
+        def lat2in(v):
+            im=adif_latent.vec2img(adif_latent.prior.gen_vector(v))
+            return chop(im,width)[:,:,None] if autoencoder.activations['latent'] is None else im.flatten()
+        out2full=lambda y: adif.img2vec(pad(np.squeeze(y),width),adif.prior.V if eldeg>1 else None).get_local()
+    else:
+        lat2in=None
+        out2full=None if eldeg==1 else lambda y: vinPn(y.flatten(), adif.prior.V).get_local()
+    decoder=LatentDecoder(autoencoder,adif_latent.prior.V.dim(),lat2in,out2full)
+    decode=lambda q: decoder.decode(q.get_local())[0]
+    dream=DREAM(u0,adif_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,log_wts=False,decode=decode)#,AE=autoencoder)#,k=5) # uncomment for manifold algorithms
     mc_fun=dream.sample
     mc_args=(args.num_samp,args.num_burnin)
     mc_fun(*mc_args)
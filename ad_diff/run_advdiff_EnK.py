@@ -15,12 +15,24 @@ from advdiff import advdiff
 import sys
 sys.path.append( "../" )
 from optimizer.EnK_dolfin import *
+from optimizer.ensemble_eval import PoolEval
+from optimizer.localization import taper
+from util.dolfin_gadget import get_dof_coords
 from util.multivector import *
+from functools import partial
 
 np.set_printoptions(precision=3, suppress=True)
 seed=2020
 np.random.seed(seed)
 
+def fwd_setup(meshsz=(61,61),eldeg=1,gamma=2.,delta=10.,rel_noise=.5,nref=1):
+    """
+    build a copy of the advection-diffusion inverse problem in a worker and return its forward mapping of numpy arrays
+    """
+    adif = advdiff(mesh=meshsz, eldeg=eldeg, gamma=gamma, delta=delta, rel_noise=rel_noise, nref=nref, seed=seed)
+    adif.prior.V=adif.prior.Vh
+    return lambda u, IP=adif: np.array([dat.get_local() for dat in IP.misfit.get_observations(pde=IP.pde, init=IP.prior.gen_vector(u)).data]).flatten()
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('algNO', nargs='?', type=int, default=0)
@@ -28,6 +40,9 @@ def main():
     parser.add_argument('max_iter', nargs='?', type=int, default=50)
     parser.add_argument('step_sizes', nargs='?', type=float, default=[1.,.1]) # SNR10: [1,.01];SNR100: [1,.01]
     parser.add_argument('algs', nargs='?', type=str, default=('EKI','EKS'))
+    parser.add_argument('num_workers', nargs='?', type=int, default=1) # number of processes to evaluate ensemble members
+    parser.add_argument('loc_rad', nargs='?', type=float, default=0) # radius of Gaspari-Cohn localization, none if 0
+    parser.add_argument('infl', nargs='?', type=float, default=1.) # multiplicative inflation factor
     args = parser.parse_args()
 
     ## define Advection-Diffusion inverse problem ##
@@ -49,6 +64,14 @@ def main():
     y=np.array([dat.get_local() for dat in adif.misfit.d.data]).flatten()
     data={'obs':y,'size':y.size,'cov':adif.misfit.noise_variance*np.eye(y.size)}
     
+    # localization
+    if args.loc_rad>0:
+        obs_coords=np.tile(adif.misfit.targets,(len(adif.misfit.d.data),1)) # observations ordered by time
+        loc_up=taper(get_dof_coords(adif.prior.V),obs_coords,args.loc_rad)
+        loc_pp=taper(obs_coords,obs_coords,args.loc_rad)
+    else:
+        loc_up=loc_pp=None
+    
     # EnK parameters
     nz_lvl=1
     err_thld=1e-1
@@ -56,10 +79,12 @@ def main():
     # run EnK to generate ensembles
     print("Preparing %s with step size %g ..."
           % (args.algs[args.algNO],args.step_sizes[args.algNO]))
-    ek=EnK(unknown,G,data,adif.prior,stp_sz=args.step_sizes[args.algNO],nz_lvl=nz_lvl,err_thld=err_thld,alg=args.algs[args.algNO],adpt=True)
+    fwd_eval=PoolEval(partial(fwd_setup,meshsz=meshsz,eldeg=eldeg,gamma=gamma,delta=delta,rel_noise=rel_noise,nref=nref),args.num_workers) if args.num_workers>1 else None
+    ek=EnK(unknown,G,data,adif.prior,stp_sz=args.step_sizes[args.algNO],nz_lvl=nz_lvl,err_thld=err_thld,alg=args.algs[args.algNO],adpt=True,fwd_eval=fwd_eval,loc_up=loc_up,loc_pp=loc_pp,infl=args.infl)
     ek_fun=ek.run
     ek_args=(args.max_iter,True)
     savepath,filename=ek_fun(*ek_args)
+    if fwd_eval is not None: fwd_eval.close()
     
     # append PDE information including the count of solving
     filename_=os.path.join(savepath,filename+'.pckl')
@@ -38,6 +38,7 @@ def main():
     parser.add_argument('step_nums', nargs='?', type=int, default=[1,1,5,1,5])
     parser.add_argument('algs', nargs='?', type=str, default=['e'+a for a in ('pCN','infMALA','infHMC','DRinfmMALA','DRinfmHMC')])
     parser.add_argument('emus', nargs='?', type=str, default=['dnn','cnn'])
+    parser.add_argument('DA', nargs='?', type=int, default=0) # 1 to correct emulation with full geometry by delayed acceptance
     args = parser.parse_args()
 
     ##------ define the inverse problem ------##
@@ -122,7 +123,7 @@ def main():
     print("Preparing %s sampler with step size %g for %d step(s)..."
           % (args.algs[args.algNO],args.step_sizes[args.algNO],args.step_nums[args.algNO]))
     
-    e_infGMC=einfGMC(u0,adif,emul_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO])#,k=5) # uncomment for manifold algorithms
+    e_infGMC=einfGMC(u0,adif,emul_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],full_geom=adif.get_geom if args.DA else None)#,k=5) # uncomment for manifold algorithms
     mc_fun=e_infGMC.sample
     mc_args=(args.num_samp,args.num_burnin)
     mc_fun(*mc_args)
@@ -60,7 +60,7 @@ kernel=gpf.kernels.SquaredExponential() + gpf.kernels.Linear()
 # kernel=gpf.kernels.Matern32()
 # kernel=gpf.kernels.Matern52(lengthscales=np.random.rand(x_train.shape[1]))
 gp=GP(x_train.shape[1], y_train.shape[1], latent_dim=latent_dim,
-      kernel=kernel, shared_kernel=True)
+      kernel=kernel, shared_kernel=True, frozen=True) # freeze the predictor after training
 loglik = lambda y: -0.5*tf.math.reduce_sum((y-adif.misfit.obs)**2/adif.misfit.noise_variance,axis=1)
 savepath=folder+'/GP/saved_model'
 if not os.path.exists(savepath): os.makedirs(savepath)
@@ -127,8 +127,7 @@ for n in range(n_dif):
     t_used[0] += timeit.default_timer()-t_start
     # emulate gradient
     t_start=timeit.default_timer()
-    ll_emul = logLik(u[None,:]).numpy()
-    dll_emul = gp.gradient(u[None,:], logLik)
+    ll_emul, dll_emul = gp.value_and_gradient(u[None,:], loglik)
     t_used[1] += timeit.default_timer()-t_start
     # test difference
     dif_fun = np.abs(ll_xact - ll_emul)
@@ -214,7 +213,7 @@ else:
 # calculate gradient
 dll_xact = adif.get_geom(u,[0,1])[1]
 # emulate gradient
-dll_emul = gp.gradient(u_f.compute_vertex_values(adif.mesh)[d2v][None,:] if eldeg>1 else u.get_local()[None,:], logLik)
+dll_emul = gp.value_and_gradient(u_f.compute_vertex_values(adif.mesh)[d2v][None,:] if eldeg>1 else u.get_local()[None,:], loglik)[1]
 
 # plot
 import matplotlib.pyplot as plt
@@ -132,6 +132,8 @@ class wht_Hessian:
     def __init__(self,whtprior,HessApply):
         self.whtprior=whtprior
         self.HessApply=HessApply
+        if hasattr(self.HessApply,'matmat'):
+            self.matmat=self._matmat
     
     def mult(self,x,y):
         rtCx = self.whtprior.generate_vector(dim=1)
@@ -140,6 +142,24 @@ class wht_Hessian:
         self.HessApply.mult(rtCx,HrtCx)
         self.whtprior.C_act(HrtCx,y,comp=0.5,transp=True)
     
+    def _matmat(self,X):
+        """
+        Block action on the columns of X
+        """
+        x = self.whtprior.generate_vector(dim=1); y = self.whtprior.generate_vector()
+        rtCX = np.zeros(X.shape)
+        for i in range(X.shape[1]):
+            x.set_local(X[:,i])
+            self.whtprior.C_act(x,y,comp=0.5)
+            rtCX[:,i] = y.get_local()
+        HrtCX = self.HessApply.matmat(rtCX)
+        Y = np.zeros(HrtCX.shape)
+        for i in range(X.shape[1]):
+            x.set_local(HrtCX[:,i])
+            self.whtprior.C_act(x,y,comp=0.5,transp=True)
+            Y[:,i] = y.get_local()
+        return Y
+    
     def inner(self,x,y):
         Hy = self.whtprior.generate_vector()
         Hy.zero()
@@ -128,6 +128,23 @@ class Elliptic:
 #         return Ma_unknown
         return Ma_unknown_vec
     
+    def _get_metact_misfit_block(self,U_actedon,whitened=False):
+        """
+        Get the metric-action of misfit on multiple vectors (columns of U_actedon) at once: A--> MA,
+        with 2nd forward/adjoint equations solved for all columns against one factorization.
+        """
+        if whitened:
+            U_actedon = np.array([self.prior.C_act(u,.5,op='C').get_local() for u in U_actedon.T]).T
+        # solve 2nd forward/adjoint equations
+        states_fwd2 = self.pde.soln_fwd2_block(U_actedon)
+        states_adj2 = self.pde.soln_adj2_block(self.misfit,states_fwd2)
+        # compute the metric action d2J/dunknown = < adj_dFdunknown, states_adj2 >
+        MA_unknown = mat_blockmult(self.pde.adj_dFdunknown_assemb,states_adj2)
+        if whitened:
+            MA_unknown = np.array([self.prior.C_act(Ma,.5,op='C',transp=True).get_local() for Ma in MA_unknown.T]).T
+        
+        return MA_unknown
+    
     def _get_rtmetact_misfit(self,u_actedon):
         """
         Get the rootmetric-action of misfit: a--> rtMa.
@@ -157,6 +174,7 @@ class Elliptic:
         eigs: first (k) eigenpairs of met.
         """
         loglik=None; gradlik=None; metact=None; rtmetact=None; eigs=None
+        eigs0=kwargs.pop('eigs0',None) # eigen-pairs at a nearby parameter to warm-start the eigen-decomposition
         # set log level: DBG(10), TRACE(13), PROGRESS(16), INFO(20,default), WARNING(30), ERROR(40), or CRITICAL(50)
         df.set_log_level(log_level)
         
@@ -195,6 +213,9 @@ class Elliptic:
                 rtmetact = lambda u: self.prior.C_act(self._get_rtmetact_misfit(u),.5,op='C',transp=True)
             
         if any(s>1 for s in geom_ord) and len(kwargs)!=0:
+            # block action of metric on multiple vectors for randomized algorithms
+            GNH = lambda u: metact(u)
+            GNH.matmat = lambda U: self._get_metact_misfit_block(U,whitened)
             # compute eigen-decomposition using randomized algorithms
             if whitened:
                 # generalized eigen-decomposition (_C^(1/2) F _C^(1/2), M), i.e. _C^(1/2) F _C^(1/2) = M V D V', V' M V = I
@@ -203,25 +224,35 @@ class Elliptic:
                     invMa=self.prior.gen_vector()
                     self.prior.Msolver.solve(invMa,a)
                     return invMa
-                eigs = geigen_RA(metact, lambda u: self.prior.M*u, invM, dim=self.pde.V.dim(),**kwargs)
+                eigs = geigen_RA(GNH, lambda u: self.prior.M*u, invM, dim=self.pde.V.dim(),eigs0=eigs0,**kwargs)
             else:
                 # generalized eigen-decomposition (F, _C^(-1)), i.e. F = _C^(-1) U D U^(-1), U' _C^(-1) U = I, V = _C^(-1/2) U
-                eigs = geigen_RA(metact,lambda u: self.prior.C_act(u,-1,op='K'),lambda u: self.prior.C_act(u,op='K'),dim=self.pde.V.dim(),**kwargs)
+                eigs = geigen_RA(GNH,lambda u: self.prior.C_act(u,-1,op='K'),lambda u: self.prior.C_act(u,op='K'),dim=self.pde.V.dim(),eigs0=eigs0,**kwargs)
             if any(s>1.5 for s in geom_ord):
                 # adjust the gradient
 #                 gradlik.axpy(1.0,GNH(unknown))
                 # update low-rank approximate Gaussian posterior
                 self.post_Ga = Gaussian_apx_posterior(self.prior,eigs=eigs)
-                Hu = self.prior.gen_vector()
-#                 self.post_Ga.Hlr.mult(unknown.vector(), Hu)
-                self.post_Ga.Hlr.mult(unknown, Hu)
-                gradlik.axpy(1.0,Hu)
+                self.adjust_grad(unknown,gradlik)
         
         if len(kwargs)==0:
             return loglik,gradlik,metact,rtmetact
         else:
             return loglik,gradlik,metact,eigs
     
+    def adjust_grad(self,unknown,gradlik,post_Ga=None,whitened=False):
+        """
+        Adjust the gradient of log-likelihood with the low-rank approximate posterior post_Ga (self.post_Ga by default):
+        gradlik + H_lr * unknown, where H_lr is the low-rank approximation of misfit Hessian.
+        """
+        if post_Ga is None: post_Ga=self.post_Ga
+        if whitened:
+            unknown=self.prior.v2u(unknown)
+        Hu = self.prior.gen_vector()
+        post_Ga.Hlr.mult(unknown, Hu)
+        gradlik.axpy(1.0,Hu)
+        return gradlik
+    
     def _logpost(self,x):
         """
         Logarithm of posterior density evaluated at x.
@@ -493,6 +524,9 @@ if __name__ == '__main__':
     SNR=50
     elliptic = Elliptic(nx=40,ny=40,SNR=SNR)
 #     elliptic.test(SAVE=False,PLOT=True,chk_fd=True,h=1e-4)
+    # check the gradient with fixed low-rank approximate posterior
+    from sampler.fixed_post_Ga import check_fixed
+    check_fixed(elliptic,elliptic.prior.sample(),k=20)
     MAP=elliptic.get_MAP(SAVE=True)
 #     df.plot(MAP)
 #     df.interactive()
@@ -33,10 +33,11 @@ class ana_samp(object):
 
     def cal_ESS(self,samp):
         num_samp,dim=np.shape(samp)
-        if dim==1:
-            ESS=ess(samp)
-        else:
-            ESS=Parallel(n_jobs=4)(map(delayed(ess), np.transpose(samp)))
+#         if dim==1:
+#             ESS=ess(samp)
+#         else:
+#             ESS=Parallel(n_jobs=4)(map(delayed(ess), np.transpose(samp)))
+        ESS=ess(samp) # all coordinates at once
         return num_samp,ESS
 
     def plot_samp(self,samp,loglik,alg_no):
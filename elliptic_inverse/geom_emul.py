@@ -7,13 +7,28 @@ import dolfin as df
 import tensorflow as tf
 import sys,os
 sys.path.append( "../" )
-from util.dolfin_gadget import vec2fun,fun2img,img2fun
+from util.dolfin_gadget import vec2fun,fun2img,img2fun,mat_blockmult
 from util.multivector import *
 from util.Eigen import *
 from posterior import *
 
+def _get_ll_f(bip):
+    """
+    Log-likelihood function of emulator outputs, kept on bip so that its compiled kernels are reused
+    and rebuilt (with the data as constants) when the data change
+    """
+    obs,nz_var=bip.misfit.obs,1./bip.misfit.prec
+    ll_f=getattr(bip,'_ll_f',None)
+    if ll_f is None or not (np.array_equal(ll_f.obs,obs) and np.array_equal(ll_f.nz_var,nz_var)):
+        obs,nz_var=np.array(obs),np.array(nz_var)
+        ll_f=lambda y: -0.5*tf.math.reduce_sum((y-obs)**2/nz_var,axis=1)
+        ll_f.obs,ll_f.nz_var=obs,nz_var
+        bip._ll_f=ll_f
+    return ll_f
+
 def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
     loglik=None; gradlik=None; metact=None; rtmetact=None; eigs=None
+    eigs0=kwargs.pop('eigs0',None) # eigen-pairs at a nearby parameter to warm-start the eigen-decomposition
     
     # un-whiten if necessary
     if whitened:
@@ -21,13 +36,16 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
     
     u_input = {'DNN':unknown.get_local()[None,:], 'CNN':fun2img(vec2fun(unknown,bip.pde.V))[None,:,:,None]}[type(emulator).__name__]
     
-    ll_f = lambda x: -0.5*bip.misfit.prec*tf.math.reduce_sum((emulator.model(x)-bip.misfit.obs)**2,axis=1)
+    # log-likelihood function of emulator output
+    ll_f = _get_ll_f(bip)
     
-    if any(s>=0 for s in geom_ord):
-        loglik = ll_f(u_input).numpy()
+    if any(s>=1 for s in geom_ord):
+        # loglik and its gradient from one forward and backward pass
+        loglik, gradlik_ = emulator.value_and_gradient(u_input, ll_f)
+    elif any(s>=0 for s in geom_ord):
+        loglik = ll_f(emulator.model(u_input)).numpy()
     
     if any(s>=1 for s in geom_ord):
-        gradlik_ = emulator.gradient(u_input, ll_f)
 #         gradlik = {'DNN':bip.prior.gen_vector(gradlik_), 'CNN':img2fun(gradlik_, bip.pde.V).vector()}[type(emulator).__name__] # not working
         if type(emulator).__name__=='DNN':
             gradlik = bip.prior.gen_vector(gradlik_)
@@ -37,26 +55,34 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
             gradlik = bip.prior.C_act(gradlik,.5,op='C',transp=True)
     
     if any(s>=1.5 for s in geom_ord):
-        jac_ = emulator.jacobian(u_input)
-        n_obs = len(bip.misfit.idx)
-        jac = MultiVector(unknown,n_obs)
-        [jac[i].set_local({'DNN':jac_[i],'CNN':img2fun(jac_[i], bip.pde.V).vector()}[type(emulator).__name__]) for i in range(n_obs)]
+        # emulated Gauss-Newton metric J' Gamma^(-1) J acting by JVP followed by VJP through the emulator, without forming J
+        if type(emulator).__name__=='DNN':
+            to_in = lambda U: U.T
+            to_out = lambda G: G.T
+        elif type(emulator).__name__=='CNN':
+            # index maps between dofs and image pixels (P1)
+            v2d = df.vertex_to_dof_map(bip.pde.V); d2v = df.dof_to_vertex_map(bip.pde.V)
+            to_in = lambda U: U[v2d].T.reshape((-1,)+u_input.shape[1:])
+            to_out = lambda G: G.reshape((G.shape[0],-1))[:,d2v].T
+        def _get_metact_misfit_block(U_actedon): # GNH on columns of U_actedon
+            JU = emulator.jvp(u_input,to_in(U_actedon))
+            return mat_blockmult(bip.prior.M,to_out(emulator.vjp(u_input,bip.misfit.prec*JU)))
         def _get_metact_misfit(u_actedon): # GNH
-            if type(u_actedon) is not df.Vector:
-                u_actedon = bip.prior.gen_vector(u_actedon)
-            v = bip.prior.gen_vector()
-            jac.reduce(v,bip.misfit.prec*jac.dot(u_actedon))
-            return bip.prior.M*v
+            if type(u_actedon) is df.Vector:
+                u_actedon = u_actedon.get_local()
+            return bip.prior.gen_vector(_get_metact_misfit_block(u_actedon[:,None])[:,0])
         def _get_rtmetact_misfit(u_actedon):
             if type(u_actedon) is df.Vector:
                 u_actedon = u_actedon.get_local()
-            v = bip.prior.gen_vector()
-            jac.reduce(v,np.sqrt(bip.misfit.prec)*u)
+            v = bip.prior.gen_vector(to_out(emulator.vjp(u_input,np.sqrt(bip.misfit.prec)*u_actedon[None,:]))[:,0])
             return bip.prior.rtM*v
         metact = _get_metact_misfit
+        metact.matmat = _get_metact_misfit_block
         rtmetact = _get_rtmetact_misfit
         if whitened:
             metact = lambda u: bip.prior.C_act(_get_metact_misfit(bip.prior.C_act(u,.5,op='C')),.5,op='C',transp=True) # ppGNH
+            metact.matmat = lambda U: np.array([bip.prior.C_act(Ma,.5,op='C',transp=True).get_local() for Ma in
+                                                _get_metact_misfit_block(np.array([bip.prior.C_act(u,.5,op='C').get_local() for u in U.T]).T).T]).T
             rtmetact = lambda u: bip.prior.C_act(_get_rtmetact_misfit(u),.5,op='C',transp=True)
     
     if any(s>1 for s in geom_ord) and len(kwargs)!=0:
@@ -67,10 +93,10 @@ def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
                 invMa=bip.prior.gen_vector()
                 bip.prior.Msolver.solve(invMa,a)
                 return invMa
-            eigs = geigen_RA(metact, lambda u: bip.prior.M*u, invM, dim=bip.pde.V.dim(),**kwargs)
+            eigs = geigen_RA(metact, lambda u: bip.prior.M*u, invM, dim=bip.pde.V.dim(),eigs0=eigs0,**kwargs)
         else:
             # generalized eigen-decomposition (F, _C^(-1)), i.e. F = _C^(-1) U D U^(-1), U' _C^(-1) U = I, V = _C^(-1/2) U
-            eigs = geigen_RA(metact,lambda u: bip.prior.C_act(u,-1,op='K'),lambda u: bip.prior.C_act(u,op='K'),dim=bip.pde.V.dim(),**kwargs)
+            eigs = geigen_RA(metact,lambda u: bip.prior.C_act(u,-1,op='K'),lambda u: bip.prior.C_act(u,op='K'),dim=bip.pde.V.dim(),eigs0=eigs0,**kwargs)
         if any(s>1.5 for s in geom_ord):
             # adjust the gradient
             # update low-rank approximate Gaussian posterior
@@ -24,6 +24,11 @@ import ufl
 import numpy as np
 import scipy.sparse as sps
 
+# self defined modules
+import sys
+sys.path.append( "../" )
+from util.dolfin_gadget import mat_blockmult,solve_blockrhs
+
 # set to warn only once for the same warnings
 import warnings
 warnings.simplefilter('once')
@@ -77,6 +82,8 @@ class ellipticPDE:
         # count PDE solving times
         self.soln_count = np.zeros(4)
         # 0-3: number of solving (forward,adjoint,2ndforward,2ndadjoint) equations respectively
+        self.fact_count = 0
+        # number of factorizations of the forward operator (one per parameter value)
 
     def set_FEM(self):
         """
@@ -115,6 +122,8 @@ class ellipticPDE:
             bc_copy.homogenize()
             return bc_copy
         self.adj_bcs = [homogenize(bc) for bc in self.ess_bc]
+        # dofs of (homogeneous) boundary conditions, for block solves
+        self.adj_bc_dofs = np.array(sum([list(bc.get_boundary_values().keys()) for bc in self.adj_bcs],[]),dtype=int)
     
     def set_forms(self,unknown,geom_ord=[0]):
         """
@@ -133,6 +142,8 @@ class ellipticPDE:
             # variational forms
             if 'true' in str(type(unknown)):
                 unknown = df.interpolate(unknown, self.V)
+            # the forward operator changes with the parameter; refactorize at the next solve
+            self.solver = None
             self.F = df.exp(unknown)*df.inner(df.grad(u), df.grad(v))*df.dx + (u*m + v*l)*self.ds - f*v*df.dx + self.nugg*l*m*df.dx
 #             self.dFdstates = df.derivative(self.F, self.states_fwd) # Jacobian
 #             self.a = unknown*df.inner(df.grad(u), df.grad(v))*df.dx + (u*m + v*l)*self.ds + self.nugg*l*m*df.dx
@@ -166,21 +177,47 @@ class ellipticPDE:
         Assemble some forms required for calculating geometric quantities.
         """
         # do some assembling here to avoid repetition
+        # (adj_)dFdstates need not be assembled: the linearized forward operator of this linear PDE
+        # is the operator of the forward equation, whose factorization is kept in self.solver
         if any(s>=1 for s in geom_ord):
-            # for adjoints:
-            self.adj_dFdstates_assemb = df.PETScMatrix();
-            df.assemble(self.adj_dFdstates, tensor=self.adj_dFdstates_assemb)
             # for grad and metact:
             self.adj_dFdunknown_assemb = df.PETScMatrix()
             df.assemble(self.adj_dFdunknown, tensor=self.adj_dFdunknown_assemb)
         if any(s>1 for s in geom_ord):
-            # for fwd2 (and fwd for nonlinear problem):
-            self.dFdstates_assemb = df.PETScMatrix()
-            df.assemble(self.dFdstates, tensor=self.dFdstates_assemb)
-            [bc.apply(self.dFdstates_assemb) for bc in self.adj_bcs]
+            # for fwd2:
             self.dFdunknown_assemb = df.PETScMatrix()
             df.assemble(self.dFdunknown, tensor=self.dFdunknown_assemb)
     
+    def _get_solver(self):
+        """
+        Assemble the forward operator and set up its LU factorization once for the current parameter.
+        The factorization is reused by the forward, adjoint, 2nd forward and 2nd adjoint solves.
+        """
+        if getattr(self,'solver',None) is None:
+            self.fwd_assemb = df.PETScMatrix()
+            df.assemble(df.lhs(self.F), tensor=self.fwd_assemb)
+            [bc.apply(self.fwd_assemb) for bc in self.ess_bc]
+            self.solver = df.PETScLUSolver(self.mpi_comm, self.fwd_assemb, 'mumps' if df.has_lu_solver_method('mumps') else 'default')
+            try:
+                self.solver.parameters['reuse_factorization'] = True # needed for FEniCS < 2018; later versions reuse by default
+            except (KeyError, RuntimeError, AttributeError):
+                pass
+            self.fact_count += 1
+        return self.solver
+    
+    def _solve_adj(self, x, rhs):
+        """
+        Solve an adjoint system with the transpose of the factorized forward operator.
+        Transposing the bc-applied (row-zeroed) operator keeps the interior equations intact
+        and only perturbs the values on bc dofs, which are then reset to (homogeneous) zeros.
+        """
+        solver = self._get_solver()
+        if hasattr(solver, 'solve_transpose'):
+            solver.solve_transpose(x, rhs)
+            [bc.apply(x) for bc in self.adj_bcs]
+        else:
+            solver.solve(x, rhs) # the forward operator is symmetric
+    
     def soln_fwd(self):
         """
         Solve the forward equation.
@@ -189,7 +226,10 @@ class ellipticPDE:
         # 5. Solve (non)linear variational problem
 #         df.solve(self.F==0,self.states_fwd,self.ess_bc,J=self.dFdstates)
 #         self.states_fwd = df.Function(self.W)
-        df.solve(df.lhs(self.F)==df.rhs(self.F),self.states_fwd,self.ess_bc)
+#         df.solve(df.lhs(self.F)==df.rhs(self.F),self.states_fwd,self.ess_bc)
+        rhs_fwd = df.assemble(df.rhs(self.F))
+        [bc.apply(rhs_fwd) for bc in self.ess_bc]
+        self._get_solver().solve(self.states_fwd.vector(), rhs_fwd)
 #         df.solve(self.a==self.L,self.states_fwd,self.ess_bc)
         self.soln_count[0] += 1
         u_fwd, l_fwd = df.split(self.states_fwd)
@@ -222,9 +262,10 @@ class ellipticPDE:
         rhs_adj[idx_dirac_1] = val_dirac_1
 #             np.allclose(rhs_adj.get_local(),rhs_adj1.vec())
         
-        [bc.apply(self.adj_dFdstates_assemb,rhs_adj) for bc in self.adj_bcs]
+        [bc.apply(rhs_adj) for bc in self.adj_bcs]
 
-        df.solve(self.adj_dFdstates_assemb, self.states_adj.vector(), rhs_adj)
+#         df.solve(self.adj_dFdstates_assemb, self.states_adj.vector(), rhs_adj)
+        self._solve_adj(self.states_adj.vector(), rhs_adj)
         self.soln_count[1] += 1
         u_adj, l_adj = df.split(self.states_adj)
         return u_adj, l_adj
@@ -246,7 +287,8 @@ class ellipticPDE:
 
         [bc.apply(rhs_fwd2) for bc in self.adj_bcs]
 
-        df.solve(self.dFdstates_assemb, self.states_fwd2.vector(), rhs_fwd2)
+#         df.solve(self.dFdstates_assemb, self.states_fwd2.vector(), rhs_fwd2)
+        self._get_solver().solve(self.states_fwd2.vector(), rhs_fwd2)
         self.soln_count[2] += 1
         u_fwd2, l_fwd2 = df.split(self.states_fwd2)
         return u_fwd2, l_fwd2
@@ -283,11 +325,74 @@ class ellipticPDE:
 
         [bc.apply(rhs_adj2) for bc in self.adj_bcs]
 
-        df.solve(self.adj_dFdstates_assemb, self.states_adj2.vector(), rhs_adj2)
+#         df.solve(self.adj_dFdstates_assemb, self.states_adj2.vector(), rhs_adj2)
+        self._solve_adj(self.states_adj2.vector(), rhs_adj2)
         self.soln_count[3] += 1
         u_adj2, l_adj2 = df.split(self.states_adj2)
         return u_adj2, l_adj2
     
+    def soln_fwd2_block(self,U_actedon):
+        """
+        Solve the 2nd order forward equation for multiple directions (columns of U_actedon) at once.
+        < dFdstates, states_fwd2 > = < dFdunknown, U_actedon >
+        """
+        rhs_fwd2 = mat_blockmult(self.dFdunknown_assemb, U_actedon)
+        rhs_fwd2[self.adj_bc_dofs] = 0
+        states_fwd2 = solve_blockrhs(self._get_solver(), rhs_fwd2)
+        self.soln_count[2] += U_actedon.shape[1]
+        return states_fwd2
+    
+    def soln_adj2_block(self,obj,states_fwd2):
+        """
+        Solve the 2nd order adjoint equation for multiple 2nd forward states (columns of states_fwd2) at once.
+        < adj_dFdstates, states_adj2 > = < d2Jdstates, states_fwd2 >
+        """
+        # observations are taken at dofs of u (CG1) so point evaluation amounts to indexing
+        idx_dirac = obj.idx_dirac_global
+        rhs_adj2 = np.zeros(states_fwd2.shape)
+        rhs_adj2[idx_dirac] = obj.prec*states_fwd2[idx_dirac]
+        rhs_adj2[self.adj_bc_dofs] = 0
+        states_adj2 = solve_blockrhs(self._get_solver(), rhs_adj2, transp=True)
+        states_adj2[self.adj_bc_dofs] = 0
+        self.soln_count[3] += states_fwd2.shape[1]
+        return states_adj2
+
+    def soln_fwd_ensemble(self,U,obj=None):
+        """
+        Solve the forward equation for an ensemble of parameters (rows of U, dofs in V).
+        The parameter-dependent form is compiled once and the operator of each member is assembled into the same matrix,
+        so the sparsity pattern and the symbolic factorization of one LU solver are reused across members;
+        the right hand side does not depend on the parameter and is assembled once.
+        Return (J,m) observations if the misfit obj is given (taken at dofs of u), otherwise (J,W.dim()) solutions.
+        """
+        if not hasattr(self, '_ensbl'):
+            ensbl = {'unknown':df.Function(self.V), 'A':df.PETScMatrix(), 'solver':None, 'x':df.Function(self.W).vector()}
+            u, l = df.TrialFunctions(self.W)
+            v, m = df.TestFunctions(self.W)
+            f = _source_term(degree=2)
+            ensbl['a'] = df.Form(df.exp(ensbl['unknown'])*df.inner(df.grad(u), df.grad(v))*df.dx + (u*m + v*l)*self.ds + self.nugg*l*m*df.dx)
+            ensbl['b'] = df.assemble(f*v*df.dx)
+            [bc.apply(ensbl['b']) for bc in self.ess_bc]
+            self._ensbl = ensbl
+        ensbl = self._ensbl
+        U = np.atleast_2d(U)
+        out = []
+        for u_j in U:
+            ensbl['unknown'].vector().set_local(u_j)
+            ensbl['unknown'].vector().apply('insert')
+            df.assemble(ensbl['a'], tensor=ensbl['A']) # same sparsity pattern
+            [bc.apply(ensbl['A']) for bc in self.ess_bc]
+            if ensbl['solver'] is None:
+                ensbl['solver'] = df.PETScLUSolver(self.mpi_comm, ensbl['A'], 'mumps' if df.has_lu_solver_method('mumps') else 'default')
+            else:
+                ensbl['solver'].set_operator(ensbl['A']) # numeric factorization only
+            ensbl['solver'].solve(ensbl['x'], ensbl['b'])
+            self.soln_count[0] += 1
+            self.fact_count += 1
+            x = ensbl['x'].get_local()
+            out.append(x if obj is None else x[obj.idx_dirac_global])
+        return np.array(out)
+
     def plot_soln(self,soln_f):
         """
         Plot solution function.
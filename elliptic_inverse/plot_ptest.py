@@ -5,12 +5,15 @@ Shiwei Lan @ ASU, 2020
 
 # import modules
 import numpy as np
+import h5py
 import dolfin as df
 from Elliptic import Elliptic
 import sys
 sys.path.append( "../" )
 from nn.autoencoder import AutoEncoder
 from tensorflow.keras.models import load_model
+from util.latent_decoder import summarize
+from get_ESS_dolfin import restore_sample
 import os,pickle
 
 # np.random.seed(2020)
@@ -107,23 +110,18 @@ for i,ax in enumerate(axes.flat):
         samp_v=elliptic.prior.gen_vector(); samp_v.zero()
         if algs[i]=='pCN':
             found=False
-            num_read=0
             for f_i in hdf5_files:
                 if '_'+algs[i]+'_' in f_i:
                     try:
-                        f=df.HDF5File(elliptic.pde.mpi_comm,os.path.join(folder,f_i),"r")
-                        samp_v.zero()
-                        for s in range(num_samp):
-                            f.read(samp_f,'sample_{0}'.format(s))
-                            samp_v.axpy(1.,samp_f.vector())
-                            num_read+=1
-                        f.close()
+                        samp=os.path.join(folder,f_i)
+                        with h5py.File(samp,'r') as f:
+                            if 'samples' not in f: samp=restore_sample(elliptic.pde.mpi_comm,elliptic.pde.V,folder,f_i,num_samp) # samples stored in separate groups by older versions
+                        samp_mean,_=summarize(samp,num_samp=num_samp) # read in chunks
                         print(f_i+' has been read!')
                         found=True
                     except:
                         pass
             if found:
-                samp_mean=samp_v/num_read
                 samp_f.vector().set_local(samp_mean)
                 sub_fig=matplot.plot(samp_f)
                 ax.set_title(algs[i])
@@ -91,6 +91,7 @@ class Gaussian_prior:
         self.dof_coords=get_dof_coords(V)
         self.sigma=sigma
         self.s=s
+        self.ker_thld=kwargs.pop('ker_thld',1e-10) # threshold to trim the kernel matrix
         self.mean=mean
 #         self.mpi_comm=kwargs['mpi_comm'] if 'mpi_comm' in kwargs else df.mpi_comm_world()
         self.mpi_comm=kwargs.pop('mpi_comm',df.mpi_comm_world() if df.__version__<='1.6.0' else df.MPI.comm_world)
@@ -108,15 +109,23 @@ class Gaussian_prior:
         # square root of mass matrix
         self.rtM=self._get_rtmass()
         
-        # kernel matrix and its square root
+        # kernel matrix
         self.K=self._get_ker()
-        self.rtK = _get_sqrtm(self.K,'K',mpi_comm=self.mpi_comm)
-        
-        # set solvers
-        for op in ['K']:
-            operator=getattr(self, op)
-            solver=self._set_solver(operator,op)
-            setattr(self, op+'solver', solver)
+        # truncated Karhunen-Loeve mode
+        self.KL=kwargs.pop('KL',False)
+        if self.KL:
+            self.KL_k=kwargs.pop('KL_k',100) # number of eigen-pairs computed
+            self.KL_var=kwargs.pop('KL_var',.99) # proportion of prior variance to be retained
+            self.eigs=self._get_KL()
+        else:
+            # square root of kernel
+            self.rtK = _get_sqrtm(self.K,'K',mpi_comm=self.mpi_comm)
+            
+            # set solvers
+            for op in ['K']:
+                operator=getattr(self, op)
+                solver=self._set_solver(operator,op)
+                setattr(self, op+'solver', solver)
         
         if mean is None:
             self.mean=df.Vector()
@@ -155,6 +164,12 @@ class Gaussian_prior:
             csr_trim0(rtM,1e-12)
         return rtM
     
+    def _ker_id(self):
+        """
+        Identifier of the kernel (sigma, s and threshold) in the names of the files caching it.
+        """
+        return '_sigma'+str(self.sigma)+'_s'+str(self.s)+'_thld'+str(self.ker_thld)
+    
     def _get_ker(self,output_petsc=True):
         """
         Get the kernel matrix K with K_ij = k(x_i,x_j).
@@ -162,7 +177,7 @@ class Gaussian_prior:
         load_success=False
         if output_petsc and df.has_petsc4py():
             from petsc4py import PETSc
-            K_f=os.path.join(os.getcwd(),'K_petsc_dim'+str(self.dim)+'.dat')
+            K_f=os.path.join(os.getcwd(),'K_petsc_dim'+str(self.dim)+self._ker_id()+'.dat')
             try:
                 viewer = PETSc.Viewer().createBinary(K_f, 'r',comm=self.mpi_comm)
                 K=df.PETScMatrix(PETSc.Mat().load(viewer))
@@ -171,7 +186,7 @@ class Gaussian_prior:
                 pass
         else:
             import cPickle
-            K_f=os.path.join(os.getcwd(),'K_sps_dim'+str(self.dim)+'.dat')
+            K_f=os.path.join(os.getcwd(),'K_sps_dim'+str(self.dim)+self._ker_id()+'.dat')
             try:
                 f = open(K_f, 'rb')
                 K = cPickle.load(f)
@@ -183,9 +198,10 @@ class Gaussian_prior:
             print('Read the kernel successfully!')
             return K
         else:
-            import scipy.spatial.distance
-            K_sps = sps.csr_matrix(self.sigma**2*np.exp(-sp.spatial.distance.squareform(sp.spatial.distance.pdist(self.dof_coords))/(2*self.s)))
-            csr_trim0(K_sps,1e-10)
+#             import scipy.spatial.distance
+#             K_sps = sps.csr_matrix(self.sigma**2*np.exp(-sp.spatial.distance.squareform(sp.spatial.distance.pdist(self.dof_coords))/(2*self.s)))
+#             csr_trim0(K_sps,1e-10)
+            K_sps = sparse_expker(self.dof_coords,self.sigma,self.s,threshold=self.ker_thld) # only entries above threshold are computed
             if output_petsc and df.has_petsc4py():
                 K_petsc = df.PETScMatrix(csr2petscmat(K_sps,comm=self.mpi_comm))
                 viewer = PETSc.Viewer().createBinary(K_f, 'w',comm=self.mpi_comm)
@@ -229,6 +245,32 @@ class Gaussian_prior:
                 f.close()
             return C_sps
     
+    def _get_KL(self):
+        """
+        Get the leading eigen-pairs of the kernel K, K ~ V D V', truncated to retain KL_var of the prior variance.
+        The eigen-pairs are computed once (using randomized algorithm) and stored on disk.
+        """
+        K_sps=petscmat2csr(self.K) if type(self.K) is df.PETScMatrix else self.K
+        KL_f=os.path.join(os.getcwd(),'K_KL_dim'+str(self.dim)+self._ker_id()+'_k'+str(self.KL_k)+'.npz')
+        try:
+            f=np.load(KL_f)
+            eigv,eigf=f['eigv'],f['eigf']
+            print('Read the KL basis successfully!')
+        except:
+            K_op=lambda u: K_sps.dot(u)
+            K_op.matmat=K_sps.dot
+            eigv,eigf=eigen_RA_rank(K_op,dim=self.dim,k=self.KL_k,p=max(10,self.KL_k//5))
+            np.savez(KL_f,eigv=eigv,eigf=eigf)
+        eigv,eigf=eigv[eigv>0],eigf[:,eigv>0]
+        # truncate by the proportion of prior variance
+        var_tot=K_sps.diagonal().sum()
+        var_prop=np.cumsum(eigv)/var_tot
+        r=min(np.searchsorted(var_prop,self.KL_var)+1,len(eigv))
+        if var_prop[-1]<self.KL_var:
+            warnings.warn('%d eigen-pairs retain only %.2f%% of the prior variance; increase KL_k to retain more.' % (len(eigv),100*var_prop[-1]))
+        print('%d KL modes are kept, dropping %.2f%% of the prior variance.' % (r,100*(1-var_prop[r-1])))
+        return eigv[:r],eigf[:,:r]
+    
     def _set_solver(self,operator,op_name=None):
         """
         Set the solver of an operator
@@ -289,6 +331,7 @@ class Gaussian_prior:
         """
         Sample a random function u ~ N(0,_C)
         vector u ~ N(0,K): C=VDV^(-1), u=V sqrt(D) z ~ N(0, VDV'=CM^(-1)=K)
+        in KL mode, u=V_r sqrt(D_r) z with the leading r eigen-pairs of K
         """
         # whiten if asked
         if whiten:
@@ -297,6 +340,9 @@ class Gaussian_prior:
             v_vec=self.gen_vector(self.rtM*noise)
             u_vec=self.gen_vector()
             self.Msolver.solve(u_vec,v_vec)
+        elif self.KL:
+            eigv,eigf=self.eigs
+            u_vec=self.gen_vector(eigf.dot(np.sqrt(eigv)*np.random.randn(len(eigv))))
         else:
             noise=self.gen_vector(np.random.randn(self.dim))
 #             import pydevd; pydevd.settrace()
@@ -341,6 +387,12 @@ class Gaussian_prior:
           
         if comp==0:
             return u_actedon
+        elif self.KL and op=='K':
+            # K^comp ~ V D^comp V' (pseudo-inverse for comp<0) on the truncated KL basis
+            eigv,eigf=self.eigs
+            Ca=self.gen_vector()
+            Ca.set_local(eigf.dot(eigv**comp*eigf.T.dot(u_actedon.get_local()))); Ca.apply('insert')
+            return Ca
         else:
             Ca=self.gen_vector()
             if comp in [1,0.5]:
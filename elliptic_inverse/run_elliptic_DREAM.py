@@ -25,6 +25,7 @@ from nn.ae import AutoEncoder
 from nn.cae import ConvAutoEncoder
 from nn.vae import VAE
 from sampler.DREAM_dolfin import DREAM
+from util.latent_decoder import LatentDecoder
 
 # relevant geometry
 import geom_emul
@@ -202,7 +203,18 @@ def main():
     
     emul_geom=lambda q,geom_ord=[0],whitened=False,**kwargs:geom_emul.geom(q,elliptic,emulator,geom_ord,whitened,**kwargs)
     latent_geom=lambda q,geom_ord=[0],whitened=False,**kwargs:geom(q,elliptic_latent.pde.V,elliptic.pde.V,autoencoder,geom_ord,whitened,emul_geom=emul_geom,bip_lat=elliptic_latent,bip=elliptic,**kwargs)
-    dream=DREAM(unknown,elliptic_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,log_wts=False)#,AE=autoencoder)#,k=5,bip_lat=elliptic_latent) # uncomment for manifold algorithms
+    # latent-to-full decoder with precomputed index maps for online summaries in the original space
+    if 'c' in args.aes[args.aeNO]:
+        width=tuple(np.mod(i,2) for i in fun2img(df.Function(elliptic_latent.pde.V)).shape)
+        def lat2in(v):
+            im=fun2img(vec2fun(v, elliptic_latent.pde.V))
+            return chop(im,width)[:,:,None] if autoencoder.activations['latent'] is None else im.flatten()
+        out2full=lambda y: img2fun(pad(np.squeeze(y),width),elliptic.pde.V).vector().get_local()
+    else:
+        lat2in=out2full=None
+    decoder=LatentDecoder(autoencoder,elliptic_latent.pde.V.dim(),lat2in,out2full)
+    decode=lambda q: decoder.decode(q.get_local())[0]
+    dream=DREAM(unknown,elliptic_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,log_wts=False,decode=decode)#,AE=autoencoder)#,k=5,bip_lat=elliptic_latent) # uncomment for manifold algorithms
     mc_fun=dream.sample
     mc_args=(args.num_samp,args.num_burnin)
     mc_fun(*mc_args)
@@ -17,11 +17,22 @@ from Elliptic import Elliptic
 import sys
 sys.path.append( "../" )
 from optimizer.EnK_dolfin import *
+from optimizer.ensemble_eval import PoolEval
+from optimizer.localization import taper
+from util.dolfin_gadget import get_dof_coords
 from util.multivector import *
+from functools import partial
 
 np.set_printoptions(precision=3, suppress=True)
 np.random.seed(2020)
 
+def fwd_setup(nx=40,ny=40,sigma=1.25,s=0.0625,SNR=50):
+    """
+    build a copy of the elliptic inverse problem in a worker and return its forward mapping of numpy arrays
+    """
+    elliptic=Elliptic(nx=nx,ny=ny,SNR=SNR,sigma=sigma,s=s)
+    return lambda u, IP=elliptic: IP.pde.soln_fwd_ensemble(u,IP.misfit)[0]
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('algNO', nargs='?', type=int, default=0)
@@ -29,6 +40,9 @@ def main():
     parser.add_argument('max_iter', nargs='?', type=int, default=50)
     parser.add_argument('step_sizes', nargs='?', type=float, default=[1.,.1]) # SNR10: [1,.01];SNR100: [1,.01]
     parser.add_argument('algs', nargs='?', type=str, default=('EKI','EKS'))
+    parser.add_argument('num_workers', nargs='?', type=int, default=1) # number of processes to evaluate ensemble members
+    parser.add_argument('loc_rad', nargs='?', type=float, default=0) # radius of Gaspari-Cohn localization, none if 0
+    parser.add_argument('infl', nargs='?', type=float, default=1.) # multiplicative inflation factor
     args = parser.parse_args()
 
     ## define the inverse elliptic problem ##
@@ -55,6 +69,14 @@ def main():
     y=elliptic.misfit.obs
     data={'obs':y,'size':y.size,'cov':1./elliptic.misfit.prec*np.eye(y.size)}
     
+    # localization
+    if args.loc_rad>0:
+        obs_coords=elliptic.misfit.loc
+        loc_up=taper(get_dof_coords(elliptic.prior.V),obs_coords,args.loc_rad)
+        loc_pp=taper(obs_coords,obs_coords,args.loc_rad)
+    else:
+        loc_up=loc_pp=None
+    
     # EnK parameters
     nz_lvl=1
     err_thld=1e-1
@@ -62,10 +84,15 @@ def main():
     # run EnK to generate ensembles
     print("Preparing %s with step size %g ..."
           % (args.algs[args.algNO],args.step_sizes[args.algNO]))
-    ek=EnK(unknown,G,data,elliptic.prior,stp_sz=args.step_sizes[args.algNO],nz_lvl=nz_lvl,err_thld=err_thld,alg=args.algs[args.algNO],adpt=True)
+    if args.num_workers>1:
+        fwd_eval=PoolEval(partial(fwd_setup,nx=nx,ny=ny,sigma=sigma,s=s,SNR=SNR),args.num_workers)
+    else:
+        fwd_eval=lambda U, IP=elliptic: IP.pde.soln_fwd_ensemble(U,IP.misfit) # batched forward solves with reused factorization
+    ek=EnK(unknown,G,data,elliptic.prior,stp_sz=args.step_sizes[args.algNO],nz_lvl=nz_lvl,err_thld=err_thld,alg=args.algs[args.algNO],adpt=True,fwd_eval=fwd_eval,loc_up=loc_up,loc_pp=loc_pp,infl=args.infl)
     ek_fun=ek.run
     ek_args=(args.max_iter,True)
     savepath,filename=ek_fun(*ek_args)
+    if args.num_workers>1: fwd_eval.close()
     
     # append PDE information including the count of solving
     filename_=os.path.join(savepath,filename+'.pckl')
@@ -5,12 +5,15 @@ Shiwei Lan @ ASU, 2020
 
 # import modules
 import numpy as np
+import h5py
 import dolfin as df
 from Elliptic import Elliptic
 import sys
 sys.path.append( "../" )
 from nn.autoencoder import AutoEncoder
 from tensorflow.keras.models import load_model
+from util.latent_decoder import summarize
+from get_ESS_dolfin import restore_sample
 import os,pickle
 from scipy.stats import norm
 import timeit
@@ -104,28 +107,20 @@ for i in seq:
         u_m=elliptic.prior.gen_vector()
         u_sd=elliptic.prior.gen_vector()
         if algs[i]=='pCN':
-            num_read=0
             found=False
             for f_i in hdf5_files:
                 if '_'+algs[i]+'_' in f_i:
                     try:
-                        f=df.HDF5File(elliptic.pde.mpi_comm,os.path.join(folder,f_i),"r")
-                        u_m.zero(); u_sd.zero()
-                        for s in range(num_samp):
-                            f.read(samp_f,'sample_{0}'.format(s))
-                            u_m.axpy(1.,samp_f.vector())
-                            u_sd.axpy(1.,samp_f.vector()*samp_f.vector())
-                            num_read+=1
-                        f.close()
+                        samp=os.path.join(folder,f_i)
+                        with h5py.File(samp,'r') as f:
+                            if 'samples' not in f: samp=restore_sample(elliptic.pde.mpi_comm,elliptic.pde.V,folder,f_i,num_samp) # samples stored in separate groups by older versions
+                        u_m,u_sd=summarize(samp,num_samp=num_samp) # read in chunks
                         print(f_i+' has been read!')
                         found=True
                         break
                     except:
                         pass
-            if found:
-                u_m=u_m.get_local()/num_read
-                u_sd=np.sqrt(u_sd.get_local()/num_read-u_m**2)
-            else:
+            if not found:
                 u_m=np.zeros(elliptic.prior.dim)
                 u_sd=np.zeros(elliptic.prior.dim)
             MCMC_est=u_m
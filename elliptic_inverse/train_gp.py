@@ -55,7 +55,7 @@ kernel=gpf.kernels.SquaredExponential() + gpf.kernels.Linear()
 # kernel=gpf.kernels.Matern32()
 # kernel=gpf.kernels.Matern52(lengthscales=np.random.rand(x_train.shape[1]))
 gp=GP(x_train.shape[1], y_train.shape[1], latent_dim=latent_dim,
-      kernel=kernel)
+      kernel=kernel, frozen=True) # freeze the predictor after training
 loglik = lambda y: -0.5*elliptic.misfit.prec*tf.math.reduce_sum((y-elliptic.misfit.obs)**2,axis=1)
 # folder='./saved_model'
 f_name='gp_'+algs[alg_no]+str(ensbl_sz)+'-'+ifwhiten
@@ -97,8 +97,7 @@ for n in range(20):
     t_used[0] += timeit.default_timer()-t_start
     # emulate gradient
     t_start=timeit.default_timer()
-    ll_emul = logLik(u.get_local()[None,:]).numpy()
-    dll_emul = gp.gradient(u.get_local()[None,:], logLik) #* grad_scalfctr
+    ll_emul, dll_emul = gp.value_and_gradient(u.get_local()[None,:], loglik) #* grad_scalfctr
     t_used[1] += timeit.default_timer()-t_start
     # test difference
     dif_fun = np.abs(ll_xact - ll_emul)
@@ -152,7 +151,7 @@ u=u_f.vector()
 # calculate gradient
 dll_xact = elliptic.get_geom(u,[0,1],whiten)[1]
 # emulate gradient
-dll_emul = gp.gradient(u.get_local()[None,:], logLik)
+dll_emul = gp.value_and_gradient(u.get_local()[None,:], loglik)[1]
 
 # plot
 plt.rcParams['image.cmap'] = 'jet'
@@ -16,11 +16,42 @@ __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
 import tensorflow as tf
+from nn.kernel_cache import get_kernel
 import gpflow as gpf
 from gpflow.ci_utils import ci_niter
 from scipy.cluster.vq import kmeans
 gpf.config.set_default_float(np.float64)
 
+def _kern_comps(kernel):
+    """
+    Extract (type, hyper-parameters) of (a sum of) supported kernels as numpy arrays
+    """
+    if isinstance(kernel,gpf.kernels.Sum):
+        return [c for k in kernel.kernels for c in _kern_comps(k)]
+    elif isinstance(kernel,gpf.kernels.SquaredExponential):
+        return [('SE',kernel.variance.numpy(),kernel.lengthscales.numpy())]
+    elif isinstance(kernel,gpf.kernels.Linear):
+        return [('Lin',kernel.variance.numpy())]
+    else:
+        raise NotImplementedError('Kernel {} not supported by the frozen predictor!'.format(type(kernel).__name__))
+
+def _K(comps, X, Z):
+    """
+    Kernel matrix k(X,Z) and its components
+    """
+    Ks=[]
+    for c in comps:
+        if c[0]=='SE':
+            Xs, Zs = X/c[2], Z/c[2]
+            sqd = np.maximum(np.sum(Xs**2,axis=1)[:,None]+np.sum(Zs**2,axis=1)[None,:]-2*Xs.dot(Zs.T),0)
+            Ks.append(c[1]*np.exp(-.5*sqd))
+        elif c[0]=='Lin':
+            Ks.append((X*c[1]).dot(Z.T))
+    return sum(Ks),Ks
+
+def _Kdiag(comps, X):
+    return sum(c[1]*np.ones(X.shape[0]) if c[0]=='SE' else np.sum(X**2*c[1],axis=1) for c in comps)
+
 class multiGP:
     def __init__(self, input_dim, output_dim, latent_dim, **kwargs):
         """
@@ -36,6 +67,7 @@ class multiGP:
         kernel: the specification of GP kernel(s)
         shared_kernel: indicator whether kernel is shared among multiple outputs
         shared_induce: indicator whether inducing locations are shared among multiple outputs
+        frozen: indicator whether to freeze the predictor (cache predictive factors) after training
         """
         self.input_dim=input_dim
         self.output_dim=output_dim
@@ -44,6 +76,7 @@ class multiGP:
         self.kernel=kwargs.pop('kernel',gpf.kernels.SquaredExponential() + gpf.kernels.Linear())
         self.shared_kernel=kwargs.pop('shared_kernel',False)
         self.shared_induce=kwargs.pop('shared_induce',True)
+        self.frozen=kwargs.pop('frozen',False)
         # build Gaussian Process Model
         self.kwargs=kwargs
         if 'x_train' in self.kwargs:
@@ -175,24 +208,103 @@ class multiGP:
             self._optimize_model_with_gradienttape(train_data=(x_train,y_train),test_data=(x_test,y_test),**kwargs)
         else:
             self._optimize_model_with_scipy(train_data=(x_train,y_train),**kwargs)
+        if self.frozen: self.freeze()
+    
+    def freeze(self, variance=True):
+        """
+        Cache the predictive factors of the trained SVGP so that predictions (and input gradients) are numpy matrix products
+        -------------------------------------------------------------------------------------------------------------------
+        For each latent GP with inducing points Z and L L'=Kuu, mean(x) = k(x,Z) alpha and
+        var(x) = k(x,x) + diag(k(x,Z) B k(Z,x)), where alpha=L^(-T) q_mu, B=L^(-T) (S-I) L^(-1) (whitened)
+        or alpha=Kuu^(-1) q_mu, B=Kuu^(-1) (S-Kuu) Kuu^(-1) (non-whitened), S=q_sqrt q_sqrt'.
+        Latent GPs sharing kernel and inducing points are grouped to be predicted together.
+        It needs the trained SVGP, e.g. frozen=True freezes it after train; a model loaded by tf.saved_model
+        only keeps predict_f, so it cannot be frozen and predictions fall back to TF.
+        """
+        kernel=self.model.kernel; iv=self.model.inducing_variable
+        L=self.model.num_latent_gps
+        # kernels and inducing points of latent GPs
+        kerns=[kernel.kernel]*L if isinstance(kernel,gpf.kernels.SharedIndependent) else list(kernel.kernels)
+        Zs=[iv.inducing_variable.Z]*L if hasattr(iv,'inducing_variable') else [iv.inducing_variable_list[l].Z for l in range(L)]
+        q_mu=self.model.q_mu.numpy(); q_sqrt=self.model.q_sqrt.numpy()
+        if isinstance(self.model.mean_function,gpf.mean_functions.Zero):
+            mean_const=0
+        elif isinstance(self.model.mean_function,gpf.mean_functions.Constant):
+            mean_const=self.model.mean_function.c.numpy()
+        else:
+            raise NotImplementedError('Mean function not supported by the frozen predictor!')
+        groups={}
+        for l in range(L): groups.setdefault((id(kerns[l]),id(Zs[l])),[]).append(l)
+        self._frozen={'groups':[],'W':kernel.W.numpy() if isinstance(kernel,gpf.kernels.LinearCoregionalization) else None,'mean_const':mean_const}
+        for idx in groups.values():
+            comps=_kern_comps(kerns[idx[0]]); Z=Zs[idx[0]].numpy()
+            Kuu=_K(comps,Z,Z)[0]+gpf.config.default_jitter()*np.eye(Z.shape[0])
+            cholK=np.linalg.cholesky(Kuu)
+            S=np.stack([q_sqrt[l].dot(q_sqrt[l].T) if q_sqrt.ndim==3 else np.diag(q_sqrt[:,l]**2) for l in idx]) if variance else None
+            if self.model.whiten:
+                alpha=np.linalg.solve(cholK.T,q_mu[:,idx])
+                if variance:
+                    invL=np.linalg.solve(cholK,np.eye(Z.shape[0]))
+                    B=np.einsum('ij,ljk,km->lim',invL.T,S-np.eye(Z.shape[0]),invL)
+            else:
+                alpha=np.linalg.solve(Kuu,q_mu[:,idx])
+                if variance:
+                    invK=np.linalg.inv(Kuu)
+                    B=np.einsum('ij,ljk,km->lim',invK,S-Kuu,invK)
+            self._frozen['groups'].append({'idx':idx,'comps':comps,'Z':Z,'alpha':alpha,'B':B if variance else None})
+        self.frozen=True
+    
+    def _frozen_predict(self, input, variance=False, jacobian=False):
+        """
+        Prediction (mean, optionally marginal variance and Jacobian of mean wrt input) by the frozen predictor
+        """
+        X=np.atleast_2d(input).reshape((-1,self.input_dim))
+        L=self.model.num_latent_gps
+        mean=np.zeros((X.shape[0],L)); var=np.zeros((X.shape[0],L)) if variance else None
+        jac=np.zeros((X.shape[0],L,X.shape[1])) if jacobian else None
+        for g in self._frozen['groups']:
+            K,Ks=_K(g['comps'],X,g['Z'])
+            mean[:,g['idx']]=K.dot(g['alpha'])
+            if variance:
+                var[:,g['idx']]=_Kdiag(g['comps'],X)[:,None]+np.einsum('nm,lmk,nk->nl',K,g['B'],K)
+            if jacobian:
+                for c,Kc in zip(g['comps'],Ks):
+                    if c[0]=='SE':
+                        jac[:,g['idx']]-=(X[:,None,:]*Kc.dot(g['alpha'])[:,:,None]-np.matmul(Kc[:,None,:]*g['alpha'].T[None,:,:],g['Z']))/c[2]**2
+                    elif c[0]=='Lin':
+                        jac[:,g['idx']]+=(g['alpha'].T.dot(g['Z'])*c[1])[None,:,:]
+        W=self._frozen['W']
+        if W is not None:
+            mean=mean.dot(W.T)
+            if variance: var=var.dot((W**2).T)
+            if jacobian: jac=np.einsum('pl,nld->npd',W,jac)
+        mean+=self._frozen['mean_const']
+        return mean,var,jac
     
-    def evaluate(self, input):
+    def evaluate(self, input, variance=False):
         """
-        Output model prediction
+        Output model prediction (and marginal variance)
         """
         assert input.shape[1]==self.input_dim, 'Wrong input dimension!'
-        return self.model.predict_f(input)[0]
+        if self.frozen and hasattr(self,'_frozen'):
+            mean,var,_=self._frozen_predict(input,variance=variance)
+            return (mean,var) if variance else mean
+        mean,var=self.model.predict_f(input)
+        return (mean,var) if variance else mean
     
     def gradient(self, input, objf=None):
         """
         Obtain gradient of objective function wrt input
         """
+        objf_key = objf # the default objective is traced once, not per call
         if objf is None: objf = lambda x: self.model.training_loss(x)
-        x = tf.Variable(input, trainable=True)
-        with tf.GradientTape(watch_accessed_variables=False) as tape:
-            tape.watch(x)
-            obj = objf(x)
-        grad = tape.gradient(obj,x).numpy()
+        def _grad(x):
+            with tf.GradientTape(watch_accessed_variables=False) as tape:
+                tape.watch(x)
+                obj = objf(x)
+            return tape.gradient(obj,x)
+        x = tf.convert_to_tensor(input)
+        grad = get_kernel(self,('gradient',self.model,objf_key),_grad,x)(x).numpy()
         return np.squeeze(grad)
     
     def stochastic_gradient(self, batch):
@@ -205,16 +317,72 @@ class multiGP:
         grads = tape.gradient(loss,self.model.trainable_variables)
         return grads
     
+    def value_and_gradient(self, input, objf, jacobian=False):
+        """
+        Obtain objective value, its gradient wrt input and optionally Jacobian of output wrt input from one forward pass
+        ---------------------------------------------------------------------------------------------------------------
+        objf: objective as a function of model output, e.g. log-likelihood
+        """
+        if self.frozen and hasattr(self,'_frozen'):
+            # model output and its Jacobian by the frozen predictor; only the objective is differentiated by TF
+            y,_,jac = self._frozen_predict(input,jacobian=True)
+            def _obj_grad(y):
+                with tf.GradientTape(watch_accessed_variables=False) as g:
+                    g.watch(y)
+                    obj = objf(y)
+                return obj,g.gradient(obj,y)
+            y = tf.convert_to_tensor(y)
+            obj,dobj = get_kernel(self,('obj_grad',objf),_obj_grad,y)(y)
+            grad = np.einsum('np,npd->nd',dobj.numpy(),jac)
+            return (obj.numpy(),np.squeeze(grad))+((np.squeeze(jac),) if jacobian else ())
+        def _fused(x):
+            with tf.GradientTape(watch_accessed_variables=False, persistent=jacobian) as g:
+                g.watch(x)
+                y = self.model.predict_f(x)[0]
+                obj = objf(y)
+            grad = g.gradient(obj,x)
+            return (obj,grad,g.jacobian(y,x)) if jacobian else (obj,grad)
+        x = tf.convert_to_tensor(input)
+        outs = get_kernel(self,('value_and_gradient',self.model,objf,jacobian),_fused,x)(x)
+        return (outs[0].numpy(),)+tuple(np.squeeze(o.numpy()) for o in outs[1:])
+    
+    def jvp(self, input, v):
+        """
+        Obtain Jacobian-vector products J v of output wrt a single input for a batch of directions v
+        --------------------------------------------------------------------------------------------
+        Note: forward mode does not pass through the tf.map_fn over latent GPs in the SVGP conditional, so J is formed first
+        """
+        return np.asarray(v).dot(np.reshape(self.jacobian(input),(self.output_dim,self.input_dim)).T)
+    
+    def vjp(self, input, w):
+        """
+        Obtain vector-Jacobian products J' w of output wrt a single input for a batch of vectors w (reverse mode)
+        """
+        if self.frozen and hasattr(self,'_frozen'):
+            return np.asarray(w).dot(self._frozen_predict(input,jacobian=True)[2][0])
+        def _vjp(x, w):
+            xs = tf.repeat(x, tf.shape(w)[0], axis=0)
+            with tf.GradientTape() as g:
+                g.watch(xs)
+                y = self.model.predict_f(xs)[0]
+            return g.gradient(y,xs,output_gradients=w)
+        x = tf.convert_to_tensor(input)
+        w = tf.convert_to_tensor(w, dtype=x.dtype)
+        return get_kernel(self,('vjp',self.model),_vjp,x,w)(x,w).numpy()
+    
     def jacobian(self, input):
         """
         Obtain Jacobian matrix of output wrt input
         """
-#         x = tf.constant(input)
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            y = self.model(x)
-        jac = g.jacobian(y,x).numpy()
+        if self.frozen and hasattr(self,'_frozen'):
+            return np.squeeze(self._frozen_predict(input,jacobian=True)[2])
+        def _jac(x):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = self.model.predict_f(x)[0]
+            return g.jacobian(y,x)
+        x = tf.convert_to_tensor(input, dtype=gpf.config.default_float())
+        jac = get_kernel(self,('jacobian',self.model),_jac,x)(x).numpy()
         return np.squeeze(jac)
     
     def batch_jacobian(self, input=None):
@@ -319,6 +487,18 @@ if __name__ == '__main__':
 #         if not os.path.exists(save_dir): os.makedirs(save_dir)
 #         gp.save(save_dir)
     
+    # check the frozen predictor against TF
+    if isinstance(gp.model,gpf.models.SVGP):
+        x=x_test[:1]; v=np.random.randn(2,D); w=np.random.randn(2,P)
+        objf=lambda y: -0.5*tf.math.reduce_sum((y-y_test[:1])**2,axis=1)
+        outs=lambda: [np.asarray(o) for o in gp.evaluate(x_test,variance=True)]+[gp.jacobian(x),gp.jvp(x,v),gp.vjp(x,w)]+list(gp.value_and_gradient(x,objf))
+        outs_tf=outs()
+        gp.freeze()
+        outs_frz=outs()
+        for name,o_tf,o_frz in zip(['mean','variance','jacobian','jvp','vjp','value','gradient'],outs_tf,outs_frz):
+            print('Difference between TF and frozen {}: {:.2e}'.format(name,np.max(np.abs(o_tf-o_frz))))
+            assert np.allclose(o_tf,o_frz,rtol=1e-5,atol=1e-8), 'Frozen {} does not match TF!'.format(name)
+    
     # print summary
     from gpflow.utilities import print_summary
     print_summary(gp.model)
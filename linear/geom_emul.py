@@ -11,30 +11,48 @@ def vec2img(v):
     im_shape=(-1,)+(imsz,)*(gdim-1)
     return v.reshape(im_shape)
 
+def _get_ll_f(bip):
+    """
+    Log-likelihood function of emulator outputs, kept on bip so that its compiled kernels are reused
+    and rebuilt (with the data as constants) when the data change
+    """
+    obs,nz_var=bip.y,bip.nz_var
+    ll_f=getattr(bip,'_ll_f',None)
+    if ll_f is None or not (np.array_equal(ll_f.obs,obs) and np.array_equal(ll_f.nz_var,nz_var)):
+        obs,nz_var=np.array(obs),np.array(nz_var)
+        ll_f=lambda y: -0.5*tf.math.reduce_sum((y-obs[None,:])**2/nz_var[None,:],axis=1)
+        ll_f.obs,ll_f.nz_var=obs,nz_var
+        bip._ll_f=ll_f
+    return ll_f
+
 def geom(unknown,bip,emulator,geom_ord=[0],whitened=False,**kwargs):
     loglik=None; gradlik=None; metact=None; rtmetact=None; eigs=None
     
     # un-whiten if necessary
     if whitened:
-        unknown=bip.prior['cov'].dot(unknown)
+        unknown=unknown.dot(bip.prior['cov'].T) # unknown can be a batch of shape (K,d) for lockstep chains
     
-    u_input = {'DNN':unknown[None,:], 'CNN':vec2img(unknown)[None,:,:,None]}[type(emulator).__name__]
+    u_input = np.atleast_2d(unknown) if type(emulator).__name__=='DNN' else np.stack([vec2img(u) for u in np.atleast_2d(unknown)])[:,:,:,None]
     
-    ll_f = lambda x: -0.5*tf.math.reduce_sum((emulator.model(x)-bip.y[None,:])**2/bip.nz_var[None,:],axis=1)
+    # log-likelihood function of emulator output
+    ll_f = _get_ll_f(bip)
     
-    if any(s>=0 for s in geom_ord):
-        loglik = ll_f(u_input).numpy()
+    if any(s>=1 for s in geom_ord):
+        # loglik, its gradient and (if needed) the Jacobian of emulator output from one forward and backward pass
+        outs = emulator.value_and_gradient(u_input, ll_f, jacobian=any(s>=1.5 for s in geom_ord))
+        loglik, gradlik = outs[:2]
+    elif any(s>=0 for s in geom_ord):
+        loglik = ll_f(emulator.model(u_input)).numpy()
     
     if any(s>=1 for s in geom_ord):
-        gradlik = emulator.gradient(u_input, ll_f)
         if type(emulator).__name__=='CNN':
-            gradlik = img2vec(gradlik)
+            gradlik = np.squeeze(gradlik.reshape((u_input.shape[0],-1)))
         if whitened:
             cholC = np.linalg.cholesky(bip.prior['cov'])
-            gradlik = cholC.T.dot(gradlik)
+            gradlik = gradlik.dot(cholC)
     
     if any(s>=1.5 for s in geom_ord):
-        jac = emulator.jacobian(u_input)
+        jac = outs[2]
         if type(emulator).__name__=='CNN':
             jac = jac.reshape((jac.shape[0],-1))
         _get_metact_misfit=lambda u_actedon: jac.T.dot(jac.dot(u_actedon)/bip.nz_var) # GNH
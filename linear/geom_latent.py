@@ -35,17 +35,20 @@ def geom(unknown_lat,autoencoder,geom_ord=[0],whitened=False,**kwargs):
     # un-whiten if necessary
     if whitened=='latent':
         bip_lat=kwargs.get('bip_lat')
-        unknown_lat=bip_lat.prior['cov'].dot(unknown_lat)
+        unknown_lat=unknown_lat.dot(bip_lat.prior['cov'].T) # unknown_lat can be a batch of shape (K,d) for lockstep chains
     
 #     u_latin={'AutoEncoder':unknown_lat[None,:],'ConvAutoEncoder':chop(vec2img(unknown_lat))[None,:,:,None]}[type(autoencoder).__name__]
     if 'Conv' in type(autoencoder).__name__:
-        u_latin=vec2img(unknown_lat)
-        width=tuple(np.mod(i,2) for i in u_latin.shape)
-        u_latin=chop(u_latin,width)[None,:,:,None] if autoencoder.activations['latent'] is None else u_latin.flatten()[None,:]
-        unknown=img2vec(pad(np.squeeze(autoencoder.decode(u_latin)),width))
+        U_lat=np.atleast_2d(unknown_lat)
+        width=tuple(np.mod(i,2) for i in vec2img(U_lat[0]).shape)
+        # map each chain to an image and decode the batch (K,h,w,1) at once
+        u_latin=np.stack([chop(vec2img(u),width) for u in U_lat])[:,:,:,None] if autoencoder.activations['latent'] is None else U_lat
+        unknown=np.stack([pad(np.squeeze(u),width).flatten() for u in autoencoder.decode(u_latin)])
+        if np.ndim(unknown_lat)==1: unknown=unknown[0]
     else:
-        u_latin=unknown_lat[None,:]
-        unknown=autoencoder.decode(u_latin).flatten()
+        u_latin=np.atleast_2d(unknown_lat)
+        unknown=autoencoder.decode(u_latin)
+        if np.ndim(unknown_lat)==1: unknown=unknown.flatten()
     
     emul_geom=kwargs.pop('emul_geom',None)
     full_geom=kwargs.pop('full_geom',None)
@@ -68,14 +71,20 @@ def geom(unknown_lat,autoencoder,geom_ord=[0],whitened=False,**kwargs):
     if any(s>=1 for s in geom_ord):
         if whitened=='latent':
             cholC = cholC = np.linalg.cholesky(bip.prior['cov'])
-            gradlik = cholC.T.dot(gradlik)
+            gradlik = gradlik.dot(cholC)
 #         jac=autoencoder.jacobian(u_latin,'decode')
         if 'Conv' in type(autoencoder).__name__:
-            jac=autoencoder.jacobian(u_latin,'decode')
-            jac=pad(jac,width*2 if autoencoder.activations['latent'] is None else width+(0,))
-            jac=jac.reshape((np.prod(jac.shape[:2]),np.prod(jac.shape[2:])))
+            # Jacobians of decoder for all chains at once, (K,h,w)+latent shape
+            jacs=autoencoder.batch_jacobian(u_latin,'decode')
+            jacs=jacs.reshape((u_latin.shape[0],)+jacs.shape[1:3]+u_latin.shape[1:3])
+            jacs=pad(jacs,(0,)+(width*2 if autoencoder.activations['latent'] is None else width+(0,)))
+            jacs=jacs.reshape((jacs.shape[0],np.prod(jacs.shape[1:3]),np.prod(jacs.shape[3:])))
+            gradlik=np.einsum('kij,ki->kj',jacs,np.atleast_2d(gradlik))
+            if np.ndim(unknown_lat)==1: gradlik=gradlik[0]
+            jac=jacs[0]
+        else:
 #         gradlik=jac.T.dot(gradlik)
-        gradlik=autoencoder.jacvec(u_latin,gradlik[None,:])
+            gradlik=autoencoder.jacvec(u_latin,np.atleast_2d(gradlik))
 #         print('time consumed:{}'.format(timeit.default_timer()-t_start))
     
     if any(s>=1.5 for s in geom_ord):
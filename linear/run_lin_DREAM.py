@@ -23,6 +23,7 @@ from nn.ae import AutoEncoder
 from nn.cae import ConvAutoEncoder
 from nn.vae import VAE
 from sampler.DREAM import DREAM
+from sampler.batchMC import batchMC
 
 # relevant geometry
 import geom_emul
@@ -46,6 +47,7 @@ def main():
     parser.add_argument('algs', nargs='?', type=str, default=['DREAM'+a for a in ('pCN','infMALA','infHMC','infmMALA','infmHMC')])
     parser.add_argument('emus', nargs='?', type=str, default=['dnn','cnn'])
     parser.add_argument('aes', nargs='?', type=str, default=['ae','cae','vae'])
+    parser.add_argument('num_chains', nargs='?', type=int, default=1) # >1 to run chains in lockstep
     args = parser.parse_args()
     
     ##------ define the linear-Gaussian inverse problem ------##
@@ -215,7 +217,11 @@ def main():
     print("Preparing %s sampler with step size %g for %d step(s)..."
           % (args.algs[args.algNO],args.step_sizes[args.algNO],args.step_nums[args.algNO]))
     
-    dream=DREAM(u0,lin_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,vol_wts='adjust',AE=autoencoder)#,k=5,bip_lat=lin_latent) # uncomment for manifold algorithms
+    if args.num_chains>1:
+        u0=lin_latent.prior['sample'](args.num_chains)
+        dream=batchMC(u0,lin_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,vol_wts='adjust',AE=autoencoder)
+    else:
+        dream=DREAM(u0,lin_latent,latent_geom,args.step_sizes[args.algNO],args.step_nums[args.algNO],args.algs[args.algNO],whitened=False,vol_wts='adjust',AE=autoencoder)#,k=5,bip_lat=lin_latent) # uncomment for manifold algorithms
     mc_fun=dream.sample
     mc_args=(args.num_samp,args.num_burnin)
     mc_fun(*mc_args)
@@ -63,7 +63,7 @@ kernel=gpf.kernels.SquaredExponential(lengthscales=np.random.rand(x_train.shape[
 # kernel=gpf.kernels.Matern32()
 # kernel=gpf.kernels.Matern52(lengthscales=np.random.rand(x_train.shape[1]))
 gp=GP(x_train.shape[1], y_train.shape[1], latent_dim=latent_dim,
-      kernel=kernel)
+      kernel=kernel, frozen=True) # freeze the predictor after training
 loglik = lambda y: -0.5*tf.math.reduce_sum((y-lin.y[None,:])**2/lin.nz_var[None,:],axis=1)
 folder='./train_NN/GP/saved_model'
 if not os.path.exists(folder): os.makedirs(folder)
@@ -113,8 +113,7 @@ for n in range(n_dif):
     t_used[0] += timeit.default_timer()-t_start
     # emulate gradient
     t_start=timeit.default_timer()
-    ll_emul = logLik(u[None,:]).numpy()
-    dll_emul = gp.gradient(u[None,:], logLik)
+    ll_emul, dll_emul = gp.value_and_gradient(u[None,:], loglik)
     t_used[1] += timeit.default_timer()-t_start
     # test difference
     dif_fun = np.abs(ll_xact - ll_emul)
@@ -191,7 +190,7 @@ if grad:
 #     Input=np.zeros((X_.size,lin.input_dim))
     Input=np.tile(lin.true_input,(X_.size,1))
     Input[:,dim[0]],Input[:,dim[1]]=X_.flatten(),Y_.flatten()
-    G=gp.gradient(Input, logLik)
+    G=gp.value_and_gradient(Input, loglik)[1]
     U,V=G[:,dim[0]].reshape(X_.shape),G[:,dim[1]].reshape(X_.shape)
 sub_figs[1]=axes.flat[1].contourf(X,Y,Z,levels)
 axes.flat[1].set_xlabel('$u_{}$'.format(dim[0]+1))
@@ -16,6 +16,10 @@ __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
 import tensorflow as tf
+try:
+    from .kernel_cache import get_kernel
+except ImportError:
+    from kernel_cache import get_kernel
 from tensorflow.keras.layers import Input,Dense,Dropout
 from tensorflow.keras.models import Model
 # from tensorflow.keras.models import load_model
@@ -175,15 +179,20 @@ class AutoEncoder:
         Obtain Jacobian matrix of encoder (coding encode) or decoder (coding decode)
         """
         model = getattr(self,coding+'r')
-#         x = tf.constant(input, dtype=tf.float32)
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            y = model(x)
-        try:
-            jac = g.jacobian(y,x).numpy()
-        except:
-            jac = g.jacobian(y,x,experimental_use_pfor=False).numpy() # use this for some problematic activations e.g. LeakyReLU
+        def _jac(x, use_pfor=True):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = model(x)
+            return g.jacobian(y,x,experimental_use_pfor=use_pfor)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jac = None
+        if getattr(self,'_use_pfor',True):
+            try:
+                jac = get_kernel(self,('jacobian',model),lambda x: _jac(x),x)(x).numpy()
+            except:
+                self._use_pfor = False # use this for some problematic activations e.g. LeakyReLU
+        if jac is None:
+            jac = get_kernel(self,('jacobian_nopfor',model),lambda x: _jac(x,False),x)(x).numpy()
         return np.squeeze(jac)
     
     def jacvec(self, input, v):
@@ -192,11 +201,13 @@ class AutoEncoder:
         """
         if not tf.is_tensor(v): v=tf.convert_to_tensor(v, dtype=tf.float32)
         model = getattr(self,{self.dim:'decoder',self.latent_dim:'encoder'}[v.shape[1]])
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            obj = tf.reduce_sum(model(x)*v)
-        jv = g.gradient(obj,x).numpy()
+        def _jv(x, v):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                obj = tf.reduce_sum(model(x)*v)
+            return g.gradient(obj,x)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jv = get_kernel(self,('jacvec',model),_jv,x,v)(x,v).numpy()
         return np.squeeze(jv)
     
     def logvol(self, input, coding='encode'):
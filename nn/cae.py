@@ -16,6 +16,10 @@ __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
 import tensorflow as tf
+try:
+    from .kernel_cache import get_kernel
+except ImportError:
+    from kernel_cache import get_kernel
 from tensorflow.keras.layers import Input,Conv2D,Conv2DTranspose,MaxPooling2D,UpSampling2D,Flatten,Reshape,Dense
 from tensorflow.keras.models import Model
 # from tensorflow.keras.models import load_model
@@ -191,15 +195,20 @@ class ConvAutoEncoder:
         Obtain Jacobian matrix of encoder (coding encode) or decoder (coding decode)
         """
         model = getattr(self,coding+'r')
-#         x = tf.constant(input, dtype=tf.float32)
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            y = model(x)
-        try:
-            jac = g.jacobian(y,x).numpy()
-        except:
-            jac = g.jacobian(y,x,experimental_use_pfor=False).numpy() # use this for some problematic activations e.g. LeakyReLU
+        def _jac(x, use_pfor=True):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = model(x)
+            return g.jacobian(y,x,experimental_use_pfor=use_pfor)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jac = None
+        if getattr(self,'_use_pfor',True):
+            try:
+                jac = get_kernel(self,('jacobian',model),lambda x: _jac(x),x)(x).numpy()
+            except:
+                self._use_pfor = False # use this for some problematic activations e.g. LeakyReLU
+        if jac is None:
+            jac = get_kernel(self,('jacobian_nopfor',model),lambda x: _jac(x,False),x)(x).numpy()
         return np.squeeze(jac)
     
     def logvol(self, input, coding='encode'):
@@ -211,6 +220,37 @@ class ConvAutoEncoder:
         d = np.abs(np.linalg.svd(jac,compute_uv=False))
         return np.sum(np.log(d[d>0]))
 
+    def batch_jacobian(self, input, coding='encode'):
+        """
+        Obtain Jacobian matrices of encoder (coding encode) or decoder (coding decode) for a batch of inputs,
+        of shape (batch size,)+output shape+input shape
+        """
+        model = getattr(self,coding+'r')
+        def _jac(x, use_pfor=True):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = model(x)
+            return g.batch_jacobian(y,x,experimental_use_pfor=use_pfor)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jac = None
+        if getattr(self,'_use_pfor',True):
+            try:
+                jac = get_kernel(self,('batch_jacobian',model),lambda x: _jac(x),x)(x).numpy()
+            except:
+                self._use_pfor = False # use this for some problematic activations e.g. LeakyReLU
+        if jac is None:
+            jac = get_kernel(self,('batch_jacobian_nopfor',model),lambda x: _jac(x,False),x)(x).numpy()
+        return jac
+
+    def batch_logvol(self, input, coding='encode'):
+        """
+        Obtain the log-volume defined by Gram matrix determinant in batch mode
+        """
+        jac = self.batch_jacobian(input, coding)
+        jac = jac.reshape((jac.shape[0],-1,np.prod(np.shape(input)[1:])))
+        d = np.abs(np.linalg.svd(jac,compute_uv=False))
+        return np.sum(np.log(np.where(d>0,d,1)),axis=1)
+
 if __name__ == '__main__':
     # set random seed
     np.random.seed(2020)
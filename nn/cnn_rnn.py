@@ -16,6 +16,10 @@ __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
 import tensorflow as tf
+try:
+    from .kernel_cache import get_kernel
+except ImportError:
+    from kernel_cache import get_kernel
 from tensorflow.keras.layers import Input,Conv2D,MaxPooling2D,Dropout,Flatten,Dense,Reshape,SimpleRNN,GRU,LSTM
 from tensorflow.keras.models import Model
 # from tensorflow.keras.models import load_model
@@ -152,26 +156,74 @@ class CNN_RNN:
         """
         Obtain gradient of objective function wrt input
         """
+        objf_key = objf if objf else None # the default objective is traced once, not per call
         if not objf:
             #where do we define self.y_train
             objf = lambda x: tf.keras.losses.MeanSquaredError(self.y_train,self.model(x))
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as tape:
-            tape.watch(x)
-            obj = objf(x)
-        grad = tape.gradient(obj,x).numpy()
+        def _grad(x):
+            with tf.GradientTape() as tape:
+                tape.watch(x)
+                obj = objf(x)
+            return tape.gradient(obj,x)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        grad = get_kernel(self,('gradient',self.model,objf_key),_grad,x)(x).numpy()
         return np.squeeze(grad)
     
+    def value_and_gradient(self, input, objf, jacobian=False):
+        """
+        Obtain objective value, its gradient wrt input and optionally Jacobian of output wrt input from one forward pass
+        ---------------------------------------------------------------------------------------------------------------
+        objf: objective as a function of model output, e.g. log-likelihood
+        """
+        def _fused(x):
+            with tf.GradientTape(persistent=jacobian) as g:
+                g.watch(x)
+                y = self.model(x)
+                obj = objf(y)
+            grad = g.gradient(obj,x)
+            return (obj,grad,g.jacobian(y,x)) if jacobian else (obj,grad)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        outs = get_kernel(self,('value_and_gradient',self.model,objf,jacobian),_fused,x)(x)
+        return (outs[0].numpy(),)+tuple(np.squeeze(o.numpy()) for o in outs[1:])
+    
+    def jvp(self, input, v):
+        """
+        Obtain Jacobian-vector products J v of output wrt a single input for a batch of directions v (forward mode)
+        """
+        def _jvp(x, v):
+            xs = tf.repeat(x, tf.shape(v)[0], axis=0)
+            with tf.autodiff.ForwardAccumulator(xs, v) as acc:
+                y = self.model(xs)
+            return acc.jvp(y)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        v = tf.convert_to_tensor(v, dtype=x.dtype)
+        return get_kernel(self,('jvp',self.model),_jvp,x,v)(x,v).numpy()
+    
+    def vjp(self, input, w):
+        """
+        Obtain vector-Jacobian products J' w of output wrt a single input for a batch of vectors w (reverse mode)
+        """
+        def _vjp(x, w):
+            xs = tf.repeat(x, tf.shape(w)[0], axis=0)
+            with tf.GradientTape() as g:
+                g.watch(xs)
+                y = self.model(xs)
+            return g.gradient(y,xs,output_gradients=w)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        w = tf.convert_to_tensor(w, dtype=x.dtype)
+        return get_kernel(self,('vjp',self.model),_vjp,x,w)(x,w).numpy()
+    
     def jacobian(self, input):
         """
         Obtain Jacobian matrix of output wrt input
         """
-#         x = tf.constant(input)
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            y = self.model(x)
-        jac = g.jacobian(y,x).numpy()
+        def _jac(x):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = self.model(x)
+            return g.jacobian(y,x)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jac = get_kernel(self,('jacobian',self.model),_jac,x)(x).numpy()
         return np.squeeze(jac)
     
     def batch_jacobian(self, input=None):
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+"""
+Cache of compiled (tf.function) kernels of emulators and autoencoders
+Shiwei Lan @ ASU, 2021
+--------------------------------------
+Kernels (gradient, Jacobian, jvp/vjp etc.) are compiled once per model and input shapes (and dtypes), with the batch size left free,
+and kept on the object that owns the model so that they are released together with it.
+--------------------
+Created Jan. 6, 2021 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import tensorflow as tf
+
+def get_kernel(obj, key, fn, *inputs, max_size=10):
+    """
+    Get fn compiled as tf.function, cached on obj per key (kernel, model) and input shapes and dtypes with batch size left free
+    """
+    if not hasattr(obj,'_kernels'): obj._kernels={}
+    key+=tuple((tuple(x.shape[1:]),x.dtype) for x in inputs)
+    if key not in obj._kernels:
+        if len(obj._kernels)>=max_size: obj._kernels.pop(next(iter(obj._kernels))) # drop the oldest
+        obj._kernels[key]=tf.function(fn,input_signature=[tf.TensorSpec(shape=(None,)+tuple(x.shape[1:]),dtype=x.dtype) for x in inputs])
+    return obj._kernels[key]
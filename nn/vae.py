@@ -16,6 +16,10 @@ __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
 import tensorflow as tf
+try:
+    from .kernel_cache import get_kernel
+except ImportError:
+    from kernel_cache import get_kernel
 from tensorflow.keras.layers import Input,Dense
 from tensorflow.keras.models import Model
 # from tensorflow.keras.models import load_model
@@ -210,15 +214,20 @@ class VAE:
         Obtain Jacobian matrix of encoder (coding encode) or decoder (coding decode)
         """
         model = getattr(self,coding+'r')
-#         x = tf.constant(input, dtype=tf.float32)
-        x = tf.Variable(input, trainable=True, dtype=tf.float32)
-        with tf.GradientTape(persistent=True) as g:
-            g.watch(x)
-            y = model(x)
-        try:
-            jac = g.jacobian(y,x).numpy()
-        except:
-            jac = g.jacobian(y,x,experimental_use_pfor=False).numpy() # use this for some problematic activations e.g. LeakyReLU
+        def _jac(x, use_pfor=True):
+            with tf.GradientTape() as g:
+                g.watch(x)
+                y = model(x)
+            return g.jacobian(y,x,experimental_use_pfor=use_pfor)
+        x = tf.convert_to_tensor(input, dtype=tf.float32)
+        jac = None
+        if getattr(self,'_use_pfor',True):
+            try:
+                jac = get_kernel(self,('jacobian',model),lambda x: _jac(x),x)(x).numpy()
+            except:
+                self._use_pfor = False # use this for some problematic activations e.g. LeakyReLU
+        if jac is None:
+            jac = get_kernel(self,('jacobian_nopfor',model),lambda x: _jac(x,False),x)(x).numpy()
         return np.squeeze(jac)
     
     def logvol(self, input, coding='encode'):
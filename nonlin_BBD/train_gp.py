@@ -63,7 +63,7 @@ kernel=gpf.kernels.SquaredExponential(lengthscales=np.random.rand(x_train.shape[
 # kernel=gpf.kernels.Matern32()
 # kernel=gpf.kernels.Matern52(lengthscales=np.random.rand(x_train.shape[1]))
 gp=GP(x_train.shape[1], y_train.shape[1], latent_dim=latent_dim,
-      kernel=kernel)
+      kernel=kernel, frozen=True) # freeze the predictor after training
 loglik = lambda y: -0.5*tf.math.reduce_sum((y-bbd.y[None,:])**2/bbd.nz_var[None,:],axis=1)
 folder='./train_NN/GP/saved_model'
 import time
@@ -112,8 +112,7 @@ for n in range(n_dif):
     t_used[0] += timeit.default_timer()-t_start
     # emulate gradient
     t_start=timeit.default_timer()
-    ll_emul = logLik(u[None,:]).numpy()
-    dll_emul = gp.gradient(u[None,:], logLik)
+    ll_emul, dll_emul = gp.value_and_gradient(u[None,:], loglik)
     t_used[1] += timeit.default_timer()-t_start
     # test difference
     dif_fun = np.abs(ll_xact - ll_emul)
@@ -187,7 +186,7 @@ if grad:
     X_,Y_=np.meshgrid(x,y)
     Input=np.zeros((X_.size,bbd.input_dim))
     Input[:,dim[0]],Input[:,dim[1]]=X_.flatten(),Y_.flatten()
-    G=gp.gradient(Input, logLik)
+    G=gp.value_and_gradient(Input, loglik)[1]
     U,V=G[:,dim[0]].reshape(X_.shape),G[:,dim[1]].reshape(X_.shape)
 sub_figs[1]=axes.flat[1].contourf(X,Y,Z,levels)
 axes.flat[1].set_xlabel('$u_{}$'.format(dim[0]+1))
@@ -22,7 +22,12 @@ __maintainer__ = "Shiwei Lan"
 __email__ = "slan@caltech.edu; lanzithinking@gmail.com; slan@asu.edu"
 
 import numpy as np
+import scipy.linalg as spla
+import scipy.sparse as sps
 import timeit,time
+import sys
+sys.path.append( "../" )
+from optimizer.localization import loc_cov
 
 class EnK(object):
     def __init__(self,u,G,data,prior=None,stp_sz=None,nz_lvl=1,alg='EKI',**kwargs):
@@ -48,6 +53,13 @@ class EnK(object):
         err_thld: threshold factor for stopping criterion
         reg_thld: threshold factor for finding regularizing parameter
         adpt_par: parameter in time-step adaptation to avoid overfloating
+        loc_up: sparse (D,m) taper to localize C_up, e.g. by taper in optimizer.localization
+        loc_pp: (m,m) taper to localize C_pp
+        infl: multiplicative inflation factor of ensemble anomalies, applied after the analysis step
+        adpt_J: indicator of whether to adapt the ensemble size, starting from J and doubling it with new prior samples
+                (up to J_max) when the error plateaus (relative decrease less than plateau_tol over plateau_win iterations)
+                or the spread of forward outputs, tr(C_pp)/tr(Gamma), falls below spread_thld
+        discard_collapsed: indicator of whether to discard members collapsed onto the ensemble mean (in data space) when growing
         '''
         # ensemble states
         self.u=u
@@ -70,6 +82,21 @@ class EnK(object):
         self.adpt=kwargs.pop('adpt',True) # default to be true
         if self.adpt:
             self.eps=kwargs.pop('adpt_par',self.tau)
+        # localization and inflation
+        self.loc_up=kwargs.pop('loc_up',None)
+        self.loc_pp=kwargs.pop('loc_pp',None)
+        if sps.issparse(self.loc_pp): self.loc_pp=self.loc_pp.toarray()
+        self.infl=kwargs.pop('infl',1.) # default to be 1 (no inflation)
+        # adaptive ensemble size
+        self.adpt_J=kwargs.pop('adpt_J',False) # default to be false
+        if self.adpt_J:
+            self.J_max=kwargs.pop('J_max',8*self.J)
+            self.plateau_win=kwargs.pop('plateau_win',5)
+            self.plateau_tol=kwargs.pop('plateau_tol',.05)
+            self.spread_thld=kwargs.pop('spread_thld',None)
+            self.discard_collapsed=kwargs.pop('discard_collapsed',False)
+            self.collapse_tol=kwargs.pop('collapse_tol',1e-3)
+        self.n_fwd=0 # number of forward solves
     
     # update ensemble sates
     def update(self):
@@ -78,6 +105,7 @@ class EnK(object):
         '''
         # prediction step
         p=self.G(self.u) # (J,m) where m is the data (observation) dimension
+        self.n_fwd+=self.J
         p_m=np.mean(p,axis=0,keepdims=True)
         
         # discrepancy principle
@@ -88,7 +116,8 @@ class EnK(object):
         # analysis step
         p_tld=p-p_m
         C_pp=p_tld.T.dot(p_tld)/(self.J-1) # (m,m)
-        C_up=self.u.T.dot(p_tld)/(self.J-1) # (D,m)
+        C_up=self.u.T.dot(p_tld)/(self.J-1) if self.loc_up is None else loc_cov(self.loc_up,self.u,p) # (D,m)
+        if self.loc_pp is not None: C_pp*=self.loc_pp
         alpha={'EKI':1./self.h,'EKS':self.h}[self.alg]
         while self.reg and self.alg=='EKI':
             alpha*=2
@@ -103,7 +132,8 @@ class EnK(object):
 #             self.u=u_
             self.u+=(C_up.dot(d)).T
         elif self.alg=='EKS':
-            C_uu=np.cov(self.u,rowvar=False)
+            # ensemble anomalies A with C_uu = A A', rank(C_uu) <= J-1
+            A=(self.u-np.mean(self.u,axis=0)).T/np.sqrt(self.J-1) # (D,J)
             if self.adpt: alpha/=np.sqrt(np.sum(d*C_pp.dot(d))*(self.J-1))*alpha+self.eps
 #             print(alpha)
 #             try:
@@ -111,11 +141,42 @@ class EnK(object):
 # #             self.u=np.linalg.solve(np.eye(self.D)+alpha*C_uu.dot(np.linalg.inv(self.prior['cov'])),self.u.T+C_up.dot(d/alpha*self.h)).T
 #                 self.u=np.linalg.solve(np.eye(self.D)+alpha*C_uu.dot(np.linalg.inv(self.prior['cov'])),self.u.T+C_up.dot(d)).T
 #             except:
-            self.u=self.prior['cov'].dot(np.linalg.solve(self.prior['cov']+alpha*C_uu,self.u.T+C_up.dot(d))).T
-            self.u+=np.random.multivariate_normal(np.zeros(self.D),2*alpha*C_uu,self.J)
+#             self.u=self.prior['cov'].dot(np.linalg.solve(self.prior['cov']+alpha*C_uu,self.u.T+C_up.dot(d))).T
+            # C (C+alpha A A')^(-1) X = X - alpha A (I_J + alpha A' C^(-1) A)^(-1) A' C^(-1) X by Woodbury identity
+            if not hasattr(self,'_prior_chol'): self._prior_chol=spla.cho_factor(self.prior['cov']) # factorize prior covariance once
+            invCA=spla.cho_solve(self._prior_chol,A) # (D,J)
+            X=self.u.T+C_up.dot(d) # (D,J)
+            self.u=(X-alpha*A.dot(np.linalg.solve(np.eye(self.J)+alpha*A.T.dot(invCA),invCA.T.dot(X)))).T
+            # noise N(0,2*alpha*C_uu) generated as anomalies times J-dimensional standard normals
+            self.u+=np.sqrt(2*alpha)*np.random.randn(self.J,self.J).dot(A.T)
+        
+        # inflate ensemble anomalies (posterior inflation) so that the recorded ensemble is the one evaluated next
+        if np.any(self.infl!=1):
+            u_m=np.mean(self.u,axis=0)
+            self.u=u_m+self.infl*(self.u-u_m)
         
         return err,p
     
+    # grow the ensemble
+    def grow(self,p=None):
+        '''
+        Double the ensemble size (up to J_max) with new prior samples, discarding collapsed members if requested
+        '''
+        u=self.u
+        if self.discard_collapsed and p is not None:
+            # members whose forward outputs collapse onto the ensemble mean
+            p_tld=p-np.mean(p,axis=0)
+            dist=np.sqrt(np.sum(p_tld*np.linalg.solve(self.data['cov'],p_tld.T).T,axis=1)/self.data['size'])
+            keep=dist>=self.collapse_tol
+            if keep.sum()<2: keep[np.argsort(dist)[-2:]]=True
+            u=u[keep]
+        n_disc=self.J-u.shape[0]
+        J_new=min(2*self.J,self.J_max)
+        if J_new>u.shape[0]:
+            u=np.vstack([u,np.reshape(self.prior['sample'](num_samp=J_new-u.shape[0]),(-1,self.D))])
+        print('Ensemble size changes from %d to %d with %d collapsed members discarded.' % (self.J,u.shape[0],n_disc))
+        self.u=u; self.J=u.shape[0]
+    
     # run EnK
     def run(self,max_iter=100,SAVE=False):
         '''
@@ -124,30 +185,49 @@ class EnK(object):
         print('\nRunning '+self.alg+' now...\n')
         if self.h is None: self.h=1./max_iter
         errs=np.zeros(max_iter)
-        fwdouts=np.zeros((max_iter,self.J,self.data['size']))
-        ensbls=np.zeros((max_iter+1,self.J,self.D))
-        ensbls[0]=self.u # record the initial ensemble
+        if self.adpt_J:
+            # lists of arrays as the ensemble size varies
+            fwdouts=[]
+            ensbls=[self.u.copy()] # record the initial ensemble
+            n_grow=0
+        else:
+            fwdouts=np.zeros((max_iter,self.J,self.data['size']))
+            ensbls=np.zeros((max_iter+1,self.J,self.D))
+            ensbls[0]=self.u # record the initial ensemble
         u_est=np.zeros((max_iter,self.D))
         # start the timer
         tic=timeit.default_timer()
         r=self.r if self.r>0 else 1
         for n in range(max_iter):
             # update the Kalman filter
-            errs[n],fwdouts[n]=self.update()
+            errs[n],p=self.update()
             # record the ensemble
-            ensbls[n+1]=self.u
+            if self.adpt_J:
+                fwdouts.append(p); ensbls.append(self.u.copy())
+            else:
+                fwdouts[n]=p; ensbls[n+1]=self.u
             # estimate unknown parameters
             u_est[n]=np.mean(self.u,axis=0)
 #             p_n=self.G(u_est[n]); err_n=np.sqrt((self.data['obs']-p_n).dot(np.linalg.solve(self.data['cov'],(self.data['obs']-p_n).T))) # compute post error
             print('Estimated unknown parameters: '+(min(self.D,10)*"%.4f ") % tuple(u_est[n,:min(self.D,10)]) )
-            print(self.alg+' at iteration %d, with error %.8f.\n' % (n+1,errs[n]) )
+            print(self.alg+' at iteration %d, with error %.8f, using %d forward solves.\n' % (n+1,errs[n],self.n_fwd) )
 #             print(self.alg+' at iteration %d, with error %.8f.\n' % (n+1,err_n) )
             # terminate if discrepancy principle satisfied
             if errs[n]<=self.tau*r: break
+            # grow the ensemble if the error plateaus or the ensemble collapses in data space
+            if self.adpt_J:
+                plateau=n-n_grow>=self.plateau_win and errs[n]>(1-self.plateau_tol)*errs[n-self.plateau_win]
+                collapse=self.spread_thld is not None and np.sum(np.var(p,axis=0,ddof=1))/np.trace(self.data['cov'])<self.spread_thld
+                if self.J<self.J_max and (plateau or collapse):
+                    self.grow(p); n_grow=n
+                    ensbls[-1]=self.u.copy()
+                elif plateau:
+                    print('Error stagnates with the maximal ensemble size %d; terminate early.' % self.J)
+                    break
         # stop timer
         toc=timeit.default_timer()
         t_used=toc-tic
-        print('EnK terminates at iteration %d, with error %.4f, using time %.4f.' % (n+1,errs[n],t_used) )
+        print('EnK terminates at iteration %d, with error %.4f, using %d forward solves and time %.4f.' % (n+1,errs[n],self.n_fwd,t_used) )
         
         return_list=u_est,errs,fwdouts,ensbls,n,t_used
         if SAVE:
@@ -200,7 +280,7 @@ if __name__=='__main__':
     # define prior
     sigma2_u=4
     pri_m=np.zeros(D); pri_cov=sigma2_u*np.eye(D)
-    pri_samp=lambda n=1: np.random.multivariate_normal(pri_m,pri_cov,n)
+    pri_samp=lambda num_samp=1: np.random.multivariate_normal(pri_m,pri_cov,num_samp)
     prior={'mean':pri_m,'cov':pri_cov,'sample':pri_samp}
     # initial ensemble
     J=100
@@ -22,11 +22,13 @@ __maintainer__ = "Shiwei Lan"
 __email__ = "slan@asu.edu; lanzithinking@gmail.com"
 
 import numpy as np
+import scipy.sparse as sps
 import timeit,time
 import dolfin as df
 import sys
 sys.path.append( "../" )
 from util.multivector import *
+from optimizer.ensemble_store import EnsembleStore
 
 class _ImpLinOp(df.LinearOperator):
     def __init__(self,prior,u,alpha):
@@ -110,6 +112,19 @@ class EnK(object):
         err_thld: threshold factor for stopping criterion
         reg_thld: threshold factor for finding regularizing parameter
         adpt_par: parameter in time-step adaptation to avoid overfloating
+        fwd_eval: backend evaluating the forward mapping on all members given as rows of a numpy array,
+                  e.g. PoolEval/MPIEval in optimizer.ensemble_eval; G is applied to members one by one if None;
+                  members are passed in full, so the prior should live on one process (MPIEval parallelizes across members)
+        loc_up: sparse (D,m) taper to localize C_up with rows in the (local) dof order, e.g. by taper in optimizer.localization
+        loc_pp: (m,m) taper to localize C_pp
+        infl: multiplicative inflation factor of ensemble anomalies, applied after the analysis step
+        stream_ensbl: indicator of whether to stream ensembles and forward outputs to one (iterations,J,D) dataset
+                      by EnsembleStore in optimizer.ensemble_store, otherwise each member is written as a dolfin function
+        adpt_J: indicator of whether to adapt the ensemble size, starting from J and doubling it with new prior samples
+                (up to J_max) when the error plateaus (relative decrease less than plateau_tol over plateau_win iterations)
+                or the spread of forward outputs, tr(C_pp)/tr(Gamma), falls below spread_thld;
+                streamed ensembles of each size go to a new store named after the size
+        discard_collapsed: indicator of whether to discard members collapsed onto the ensemble mean (in data space) when growing
         '''
         # ensemble states
         self.u=u
@@ -133,6 +148,35 @@ class EnK(object):
         self.adpt=kwargs.pop('adpt',True) # default to be true
         if self.adpt:
             self.eps=kwargs.pop('adpt_par',self.tau)
+        self.fwd_eval=kwargs.pop('fwd_eval',None)
+        if self.fwd_eval is not None:
+            assert self.prior.mpi_comm.size==1, 'fwd_eval takes full ensemble members; build the prior on one process!'
+        self.stream_ensbl=kwargs.pop('stream_ensbl',True) # default to be true
+        # localization and inflation
+        self.loc_up=kwargs.pop('loc_up',None)
+        if self.loc_up is not None: self.loc_up=sps.csc_matrix(self.loc_up)
+        self.loc_pp=kwargs.pop('loc_pp',None)
+        if sps.issparse(self.loc_pp): self.loc_pp=self.loc_pp.toarray()
+        self.infl=kwargs.pop('infl',1.) # default to be 1 (no inflation)
+        # adaptive ensemble size
+        self.adpt_J=kwargs.pop('adpt_J',False) # default to be false
+        if self.adpt_J:
+            self.J_max=kwargs.pop('J_max',8*self.J)
+            self.plateau_win=kwargs.pop('plateau_win',5)
+            self.plateau_tol=kwargs.pop('plateau_tol',.05)
+            self.spread_thld=kwargs.pop('spread_thld',None)
+            self.discard_collapsed=kwargs.pop('discard_collapsed',False)
+            self.collapse_tol=kwargs.pop('collapse_tol',1e-3)
+        self.n_fwd=0 # number of forward solves
+    
+    def _ensbl2array(self):
+        '''
+        Gather ensemble members as rows of a numpy array (on the root process in parallel)
+        '''
+        if self.prior.mpi_comm.size==1:
+            return np.array([self.u[j].get_local() for j in range(self.J)])
+        else:
+            return np.array([self.u[j].gather_on_zero() for j in range(self.J)])
     
     # update ensemble sates
     def update(self):
@@ -140,7 +184,11 @@ class EnK(object):
         One step update of ensemble Kalman methods
         '''
         # prediction step
-        p=np.array([self.G(self.u[j]) for j in range(self.J)]) # (J,m) where m is the data (observation) dimension
+        if self.fwd_eval is None:
+            p=np.array([self.G(self.u[j]) for j in range(self.J)]) # (J,m) where m is the data (observation) dimension
+        else:
+            p=self.fwd_eval(self._ensbl2array())
+        self.n_fwd+=self.J
         p_m=np.mean(p,axis=0,keepdims=True)
         
         # discrepancy principle
@@ -153,6 +201,14 @@ class EnK(object):
         C_pp=p_tld.T.dot(p_tld)/(self.J-1) # (m,m)
         C_up=MultiVector(self.u[0],self.data['size']) # C_up=0_{D x m}
         MvDSmatMult(self.u,p_tld/(self.J-1),C_up) # (D,m), C_up=u*p_tld/(J-1)
+        if self.loc_up is not None:
+            # Hadamard product with the sparse taper, column by column
+            for i in range(self.data['size']):
+                idx=self.loc_up.indices[self.loc_up.indptr[i]:self.loc_up.indptr[i+1]]
+                c_i=C_up[i].get_local(); c_loc=np.zeros_like(c_i)
+                c_loc[idx]=self.loc_up.data[self.loc_up.indptr[i]:self.loc_up.indptr[i+1]]*c_i[idx]
+                C_up[i].set_local(c_loc)
+        if self.loc_pp is not None: C_pp*=self.loc_pp
         alpha={'EKI':1./self.h,'EKS':self.h}[self.alg]
         while self.reg and self.alg=='EKI':
             alpha*=2
@@ -183,8 +239,38 @@ class EnK(object):
             noise-=np.mean(noise,axis=0)
             MvDSmatMult(u_,noise,self.u,True) # u+= u_*noise
         
+        # inflate ensemble anomalies (posterior inflation) so that the recorded ensemble is the one evaluated next
+        if self.infl!=1:
+            u_m=self.prior.gen_vector()
+            self.u.reduce(u_m,np.ones(self.J)/self.J)
+            for j in range(self.J):
+                self.u[j]*=self.infl; self.u[j].axpy(1-self.infl,u_m)
+        
         return err,p
     
+    def grow(self,p=None):
+        '''
+        Double the ensemble size (up to J_max) with new prior samples, discarding collapsed members if requested
+        '''
+        keep=np.ones(self.J,dtype=bool)
+        if self.discard_collapsed and p is not None:
+            # members whose forward outputs collapse onto the ensemble mean
+            p_tld=p-np.mean(p,axis=0)
+            dist=np.sqrt(np.sum(p_tld*np.linalg.solve(self.data['cov'],p_tld.T).T,axis=1)/self.data['size'])
+            keep=dist>=self.collapse_tol
+            if keep.sum()<2: keep[np.argsort(dist)[-2:]]=True
+        n_disc=self.J-keep.sum()
+        J_new=max(min(2*self.J,self.J_max),keep.sum())
+        u=MultiVector(self.u[0],J_new) # reallocate the ensemble
+        for i,j in enumerate(np.where(keep)[0]):
+            u[i].zero()
+            u[i].axpy(1.,self.u[j])
+        for i in range(keep.sum(),J_new):
+            u[i].zero()
+            u[i].axpy(1.,self.prior.sample(whiten=False))
+        print('Ensemble size changes from %d to %d with %d collapsed members discarded.' % (self.J,J_new,n_disc))
+        self.u=u; self.J=J_new
+    
     # run EnK
     def run(self,max_iter=100,SAVE=False):
         '''
@@ -194,7 +280,7 @@ class EnK(object):
         if self.h is None: self.h=1./max_iter
         # allocate space to store results
         errs=np.zeros(max_iter)
-        fwdouts=np.zeros((max_iter,self.J,self.data['size']))
+        fwdouts=[] if self.adpt_J else np.zeros((max_iter,self.J,self.data['size'])) # list of arrays as the ensemble size varies
         
         import os
         fpath=os.path.join(os.getcwd(),'result')
@@ -203,26 +289,35 @@ class EnK(object):
         ctime=time.strftime("%Y-%m-%d-%H-%M-%S")
         ensbl_fname=self.alg+'_ensbl'+str(self.J)+'_dim'+str(self.D)+'_'+ctime
 #         ensbls=df.File(os.path.join(fpath,ensbl_fname+".xdmf"))
-        ensbls=df.HDF5File(self.prior.mpi_comm,os.path.join(fpath,ensbl_fname+".h5"),"w")
-        # record the initial ensemble
         u_f=df.Function(self.prior.V)
-        for j in range(self.J):
-            u_f.vector().zero()
-            u_f.vector().axpy(1.,self.u[j])
-            ensbls.write(u_f,'iter{0}_ensbl{1}'.format(0,j))
+        if self.stream_ensbl:
+            root=self.prior.mpi_comm.rank==0
+            ensbls=EnsembleStore(os.path.join(fpath,ensbl_fname+".h5"),self.J,self.D,self.data['size'],max_iter) if root else None
+            n_0=0 # iteration at which the current store starts
+            # record the initial ensemble
+            U=self._ensbl2array()
+            if root: ensbls.write(0,U)
+        else:
+            ensbls=df.HDF5File(self.prior.mpi_comm,os.path.join(fpath,ensbl_fname+".h5"),"w")
+            # record the initial ensemble
+            for j in range(self.J):
+                u_f.vector().zero()
+                u_f.vector().axpy(1.,self.u[j])
+                ensbls.write(u_f,'iter{0}_ensbl{1}'.format(0,j))
         uest_fname=self.alg+'_uest'+'_ensbl'+str(self.J)+'_dim'+str(self.D)+'_'+ctime
         u_est=df.HDF5File(self.prior.mpi_comm,os.path.join(fpath,uest_fname+".h5"),"w")
         # start the timer
         tic=timeit.default_timer()
         r=self.r if self.r>0 else 1
+        n_grow=0
         for n in range(max_iter):
             # update the Kalman filter
-            errs[n],fwdouts[n]=self.update()
-            # record the ensemble
-            for j in range(self.J):
-                u_f.vector().zero()
-                u_f.vector().axpy(1.,self.u[j])
-                ensbls.write(u_f,'iter{0}_ensbl{1}'.format(n+1,j))
+            errs[n],p=self.update()
+            if self.adpt_J:
+                fwdouts.append(p)
+            else:
+                fwdouts[n]=p
+            if self.stream_ensbl and root: ensbls.write(n-n_0,fwdout=p)
             # estimate unknown parameters
             u_f.vector().zero()
             self.u.reduce(u_f.vector(),np.ones(self.J)/self.J)
@@ -232,15 +327,41 @@ class EnK(object):
                 print('Estimated unknown parameters: '+(min(self.D,10)*"%.4f ") % tuple(u_f.vector()[:min(self.D,10)]) )
             else:
                 print('Estimated unknown parameters: min %.4f, med %.4f, max %.4f ' % (u_f.vector().min(), np.median(u_f.vector()), u_f.vector().max()) )
-            print(self.alg+' at iteration %d, with error %.8f.\n' % (n+1,errs[n]) )
+            print(self.alg+' at iteration %d, with error %.8f, using %d forward solves.\n' % (n+1,errs[n],self.n_fwd) )
 #             print(self.alg+' at iteration %d, with error %.8f.\n' % (n+1,err_n) )
             # terminate if discrepancy principle satisfied
-            if errs[n]<=self.tau*r: break
+            stop=errs[n]<=self.tau*r
+            # grow the ensemble if the error plateaus or the ensemble collapses in data space
+            if self.adpt_J and not stop:
+                plateau=n-n_grow>=self.plateau_win and errs[n]>(1-self.plateau_tol)*errs[n-self.plateau_win]
+                collapse=self.spread_thld is not None and np.sum(np.var(p,axis=0,ddof=1))/np.trace(self.data['cov'])<self.spread_thld
+                if self.J<self.J_max and (plateau or collapse):
+                    self.grow(p); n_grow=n
+                    if self.stream_ensbl:
+                        # start a new store for the grown ensemble
+                        if root:
+                            ensbls.close()
+                            ensbls=EnsembleStore(os.path.join(fpath,self.alg+'_ensbl'+str(self.J)+'_dim'+str(self.D)+'_'+ctime+".h5"),self.J,self.D,self.data['size'],max_iter-n-1)
+                        n_0=n+1
+                elif plateau:
+                    print('Error stagnates with the maximal ensemble size %d; terminate early.' % self.J)
+                    stop=True
+            # record the ensemble
+            if self.stream_ensbl:
+                U=self._ensbl2array()
+                if root: ensbls.write(n+1-n_0,U)
+            else:
+                for j in range(self.J):
+                    u_f.vector().zero()
+                    u_f.vector().axpy(1.,self.u[j])
+                    ensbls.write(u_f,'iter{0}_ensbl{1}'.format(n+1,j))
+            if stop: break
         # stop timer
-        ensbls.close(); u_est.close()
+        if ensbls is not None: ensbls.close()
+        u_est.close()
         toc=timeit.default_timer()
         t_used=toc-tic
-        print('EnK terminates at iteration %d, with error %.4f, using time %.4f.' % (n+1,errs[n],t_used) )
+        print('EnK terminates at iteration %d, with error %.4f, using %d forward solves and time %.4f.' % (n+1,errs[n],self.n_fwd,t_used) )
         
         return_list=errs,fwdouts,n,t_used
         if SAVE:
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Backends to evaluate the forward mapping on all ensemble members
+Shiwei Lan @ ASU, 2021
+--------------------------------------
+Ensemble members are shipped as numpy arrays (rows) and only forward outputs are returned, in the order of members.
+PoolEval: a pool of worker processes, each holding its own copy of the model (e.g. Elliptic/advdiff) built once by setup.
+MPIEval: MPI ranks split into sub-communicators, each building the model on its sub-communicator and
+         evaluating a contiguous block of members; outputs are gathered on all ranks.
+--------------------
+Created Jan. 3, 2021 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import os
+import numpy as np
+import multiprocessing as mp
+
+# forward mapping in each worker process
+_G=None
+# environment variables limiting BLAS/OpenMP threads, read by the libraries when loaded
+_THREAD_VARS=('OMP_NUM_THREADS','OPENBLAS_NUM_THREADS','MKL_NUM_THREADS')
+
+def _init_worker(setup):
+    """
+    Build the forward mapping once in each worker
+    """
+    global _G
+    _G=setup()
+
+def _fwd(u):
+    return np.asarray(_G(u))
+
+class SerialEval:
+    """
+    Evaluate the forward mapping G (taking a numpy array) on ensemble members one by one
+    """
+    def __init__(self,G):
+        self.G=G
+
+    def __call__(self,U):
+        return np.array([self.G(u) for u in U])
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+class PoolEval(SerialEval):
+    """
+    Evaluate the forward mapping on ensemble members in a pool of worker processes
+    ------------------------------------------------------------------------------
+    setup: a picklable (module-level) function without arguments (e.g. functools.partial) that builds the model
+           in a worker and returns the forward mapping taking a numpy array
+    """
+    def __init__(self,setup,n_workers=None,**kwargs):
+        """
+        Initialization
+        --------------
+        n_workers: number of worker processes, default to cpu count
+        start_method: start method of processes; 'spawn' is safe with dolfin/TensorFlow
+        threads_per_worker: number of BLAS/OpenMP threads in each worker to avoid oversubscription
+        """
+        self.n_workers=mp.cpu_count() if n_workers is None else n_workers
+        start_method=kwargs.pop('start_method','spawn')
+        threads=kwargs.pop('threads_per_worker',max(1,mp.cpu_count()//self.n_workers))
+        # workers inherit the environment when started, before numpy etc. are imported in them
+        env={k:os.environ.get(k) for k in _THREAD_VARS}
+        os.environ.update({k:str(threads) for k in _THREAD_VARS})
+        try:
+            self.pool=mp.get_context(start_method).Pool(processes=self.n_workers,initializer=_init_worker,initargs=(setup,))
+        finally:
+            for k,v in env.items():
+                if v is None: os.environ.pop(k,None)
+                else: os.environ[k]=v
+
+    def __call__(self,U):
+        # pool.map keeps the order of members
+        chunk_sz=max(1,int(np.ceil(len(U)/self.n_workers)))
+        return np.array(self.pool.map(_fwd,list(U),chunksize=chunk_sz))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close(); self.pool.join()
+            self.pool=None
+
+class MPIEval(SerialEval):
+    """
+    Evaluate the forward mapping on ensemble members with MPI sub-communicators
+    ---------------------------------------------------------------------------
+    setup: function taking a (sub-)communicator and returning the forward mapping of the model built on it
+    All ranks should hold the same ensemble, e.g. by running EnK with the same random seed on each rank.
+    """
+    def __init__(self,setup,comm=None,n_groups=None):
+        """
+        Initialization
+        --------------
+        comm: mpi4py communicator to be split, default to COMM_WORLD
+        n_groups: number of sub-communicators, default to the size of comm (one rank per model)
+        """
+        from mpi4py import MPI
+        self.comm=MPI.COMM_WORLD if comm is None else comm
+        self.n_groups=self.comm.size if n_groups is None else n_groups
+        self.color=self.comm.rank%self.n_groups
+        self.subcomm=self.comm.Split(self.color,self.comm.rank)
+        self.G=setup(self.subcomm)
+
+    def __call__(self,U):
+        # contiguous blocks of members for sub-communicators
+        blocks=np.array_split(np.arange(len(U)),self.n_groups)
+        p_blk=np.array([self.G(U[j]) for j in blocks[self.color]])
+        # gather the blocks of all groups from their roots on all ranks
+        p_all=self.comm.allgather((self.color,p_blk) if self.subcomm.rank==0 else None)
+        p_all=dict(p for p in p_all if p is not None)
+        return np.concatenate([p_all[i] for i in range(self.n_groups) if len(blocks[i])>0])
+
+    def close(self):
+        self.subcomm.Free()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Streaming store of ensembles (and forward outputs) of ensemble Kalman methods
+Shiwei Lan @ ASU, 2021
+--------------------------------------
+Ensembles are stored in one HDF5 file as a chunked dataset 'ensbl' of shape (iterations, J, D), one chunk per iteration,
+written in bulk per iteration, with the forward outputs in 'fwdout' of shape (iterations, J, m) alongside.
+The vectorized reader returns training-ready arrays X (and Y) with one contiguous read.
+--------------------
+Created Jan. 4, 2021 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import h5py
+
+class EnsembleStore:
+    """
+    Writer of ensembles (J,D) and forward outputs (J,m) iteration by iteration
+    """
+    def __init__(self,fname,J,D,m=None,max_iter=None,compression=None):
+        """
+        Initialization
+        --------------
+        fname: name of HDF5 file
+        J: ensemble size; D: state dimension; m: data dimension (no forward outputs stored if None)
+        max_iter: number of iterations to preallocate; datasets grow if exceeded
+        """
+        self.f=h5py.File(fname,'w')
+        n=0 if max_iter is None else max_iter+1
+        self.ensbl=self.f.create_dataset('ensbl',shape=(n,J,D),maxshape=(None,J,D),chunks=(1,J,D),dtype='f8',compression=compression)
+        self.fwdout=None if m is None else self.f.create_dataset('fwdout',shape=(max(n-1,0),J,m),maxshape=(None,J,m),chunks=(1,J,m),dtype='f8',compression=compression)
+        self.n_ensbl=0; self.n_fwdout=0
+
+    def _put(self,dset,n,X):
+        if n>=dset.shape[0]: dset.resize(n+1,axis=0)
+        dset[n]=X
+
+    def write(self,n,U=None,fwdout=None):
+        """
+        Write ensemble U (J,D) at iteration n and/or forward outputs (J,m) evaluated on the ensemble at iteration n
+        """
+        if U is not None:
+            self._put(self.ensbl,n,U); self.n_ensbl=max(self.n_ensbl,n+1)
+        if fwdout is not None:
+            self._put(self.fwdout,n,fwdout); self.n_fwdout=max(self.n_fwdout,n+1)
+
+    def close(self):
+        if self.f:
+            # drop the preallocated but unused iterations
+            self.ensbl.resize(self.n_ensbl,axis=0)
+            if self.fwdout is not None: self.fwdout.resize(self.n_fwdout,axis=0)
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def is_ensemble_store(fname):
+    """
+    Check whether an HDF5 file is written by EnsembleStore
+    """
+    with h5py.File(fname,'r') as f:
+        return 'ensbl' in f and isinstance(f['ensbl'],h5py.Dataset)
+
+def read_ensemble(fname,max_iter=None,XY=True,transform=None):
+    """
+    Read ensembles (and forward outputs) as training data
+    -----------------------------------------------------
+    max_iter: number of iterations to read, all available if None
+    XY: if True, return X, ensembles of iterations 0,...,max_iter-1, and Y, their forward outputs;
+        otherwise return X, ensembles of iterations 1,...,max_iter (updated ensembles)
+    transform: function applied to X (rows as ensemble members), e.g. whitening or conversion to images
+    """
+    with h5py.File(fname,'r') as f:
+        ensbl=f['ensbl']
+        n_max=f['fwdout'].shape[0] if XY else ensbl.shape[0]-1
+        max_iter=n_max if max_iter is None else min(max_iter,n_max)
+        # one contiguous read
+        X=ensbl[:max_iter] if XY else ensbl[1:max_iter+1]
+        X=X.reshape((-1,ensbl.shape[2]))
+        if XY: Y=f['fwdout'][:max_iter].reshape((-1,f['fwdout'].shape[2]))
+    if transform is not None: X=transform(X)
+    return (X,Y) if XY else X
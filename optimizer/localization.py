@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Distance-based covariance localization for ensemble Kalman methods
+Shiwei Lan @ ASU, 2021
+--------------------------------------
+Gaspari-Cohn taper: 'Construction of correlation functions in two and three dimensions'
+by Gregory Gaspari and Stephen E. Cohn, Quarterly Journal of the Royal Meteorological Society, Volume 125, Issue 554, 1999
+------------------------------------------------------------------
+The compactly supported taper between dofs and observations (or between observations) is built once as a sparse matrix
+and the sample cross-covariance is localized as a Hadamard product evaluated only at its nonzeros.
+--------------------
+Created Jan. 5, 2021 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import scipy.sparse as sps
+from scipy.spatial import cKDTree
+
+def gaspari_cohn(z):
+    """
+    Gaspari-Cohn 5th order piecewise rational function of z=distance/radius, supported on [0,2)
+    """
+    z=np.abs(np.asarray(z,dtype=float))
+    f=np.zeros_like(z)
+    i=z<=1; zi=z[i]
+    f[i]=-.25*zi**5+.5*zi**4+.625*zi**3-5./3*zi**2+1
+    i=(z>1)&(z<2); zi=z[i]
+    f[i]=zi**5/12.-.5*zi**4+.625*zi**3+5./3*zi**2-5*zi+4-2./(3*zi)
+    return f
+
+def taper(coords,obs_coords,radius):
+    """
+    Sparse (D,m) Gaspari-Cohn taper between D points (e.g. dof coordinates) and m observation locations
+    -----------------------------------------------------------------------------------------------------
+    coords: (D,gdim) coordinates, e.g. from util.dolfin_gadget.get_dof_coords
+    obs_coords: (m,gdim) locations of observation components, e.g. misfit.loc, or misfit.targets tiled over observation times
+    radius: localization radius; correlations vanish beyond 2*radius
+    """
+    coords=np.asarray(coords); obs_coords=np.asarray(obs_coords)
+    # neighbours of observations within the support
+    nbrs=cKDTree(coords).query_ball_point(obs_coords,r=2*radius)
+    cols=np.repeat(np.arange(len(nbrs)),[len(n) for n in nbrs])
+    rows=np.concatenate([np.asarray(n,dtype=int) for n in nbrs]) if len(cols)>0 else np.zeros(0,dtype=int)
+    dist=np.linalg.norm(coords[rows]-obs_coords[cols],axis=1)
+    T=sps.csc_matrix((gaspari_cohn(dist/radius),(rows,cols)),shape=(coords.shape[0],obs_coords.shape[0]))
+    T.eliminate_zeros()
+    return T
+
+def loc_cov(T,U,P,chunk_sz=100000):
+    """
+    Localized sample cross-covariance T o cov(U,P) evaluated only at the nonzeros of the sparse taper T
+    ----------------------------------------------------------------------------------------------------
+    U: (J,D) ensemble; P: (J,m) forward outputs
+    """
+    J=U.shape[0]
+    U_tld=U-np.mean(U,axis=0); P_tld=P-np.mean(P,axis=0)
+    T=T.tocoo()
+    data=np.empty_like(T.data)
+    for i in range(0,T.nnz,chunk_sz):
+        k=slice(i,min(i+chunk_sz,T.nnz))
+        data[k]=T.data[k]*np.einsum('jk,jk->k',U_tld[:,T.row[k]],P_tld[:,T.col[k]])/(J-1)
+    return sps.csr_matrix((data,(T.row,T.col)),shape=T.shape)
@@ -16,6 +16,10 @@ __email__ = "slan@asu.edu; lanzithinking@outlook.com"
 
 import numpy as np
 import timeit,time
+from .checkpoint import chkpt_file,save_chkpt,load_chkpt
+from .geom_cache import GeomCache
+from util.sample_store import SampleStore
+from util.online_stats import OnlineStats
 import dolfin as df
 
 class AEinfGMC:
@@ -40,7 +44,10 @@ class AEinfGMC:
         geom_ord=[0]
         if any(s in alg_name for s in ['MALA','HMC']): geom_ord.append(1)
         if any(s in alg_name for s in ['mMALA','mHMC']): geom_ord.append(2)
-        self.geom=lambda parameter: latent_geom(parameter,geom_ord=geom_ord,**kwargs)
+        cache_size=kwargs.pop('geom_cache',10) # size of LRU cache of geometry (0 for none)
+        warm_eigs=kwargs.pop('warm_eigs',False) and 2 in geom_ord # warm-start the eigen-decomposition at a new state from the eigen-pairs of the current state
+        self.geom=lambda parameter: latent_geom(parameter,geom_ord=geom_ord,**(dict(kwargs,eigs0=getattr(self,'eigs',None)) if warm_eigs else kwargs))
+        if cache_size: self.geom=GeomCache(self.geom,cache_size)
         self.ll,self.g,_,self.eigs=self.geom(self.q)
 #         self.ll,self.g,_,self.eigs=self.model.get_geom(self.q,geom_ord,**kwargs)
         
@@ -434,12 +441,16 @@ class AEinfGMC:
         samp_fpath=os.path.join(os.getcwd(),'result')
         if not os.path.exists(samp_fpath):
             os.makedirs(samp_fpath)
-#         self.samp=df.File(os.path.join(samp_fpath,samp_fname+".xdmf"))
-        self.samp=df.HDF5File(self.model.pde.mpi_comm,os.path.join(samp_fpath,samp_fname+".h5"),"w")
+        self.samp_file=os.path.join(samp_fpath,samp_fname+".h5")
         self.loglik=np.zeros(num_samp+num_burnin)
         self.acpt=0.0 # final acceptance rate
         self.times=np.zeros(num_samp+num_burnin) # record the history of time used for each sample
         
+        # checkpoint setting
+        chkpt_intvl=kwargs.pop('chkpt_intvl',0) # save a checkpoint every chkpt_intvl iterations (0 for none)
+        resume=kwargs.pop('resume',False) # True (for the default checkpoint file) or the checkpoint file to resume from
+        chkpt_fname=kwargs.pop('chkpt_file',None) or chkpt_file(self)
+        
         # number of adaptations for step size
         if self.adpt_h:
             self.h_adpt['n_adpt']=kwargs.pop('adpt_steps',num_burnin)
@@ -447,9 +458,21 @@ class AEinfGMC:
         # online parameters
         accp=0.0 # online acceptance
         num_cons_bad=0 # number of consecutive bad proposals
-
-        beginning=timeit.default_timer()
-        for s in range(num_samp+num_burnin):
+        
+        # resume from checkpoint if requested
+        s0=0; self.chkpt_time=0.
+        if resume:
+            chkpt=load_chkpt(self,chkpt_fname if resume is True else resume)
+            s0=chkpt['s']; accp=chkpt['accp']; self.chkpt_time=chkpt['chkpt_time']
+        # samples are buffered and appended to one chunked dataset in the h5 file
+        self.samp=SampleStore(self.samp_file,self.dim,"a" if resume else "w",buf_sz=kwargs.pop('buf_sz',100),num_keep=max(0,s0-num_burnin))
+        # running summaries (mean, std, batch-means ESS) of samples, written next to them
+        ess_batch=kwargs.pop('ess_batch',50)
+        if not resume: self.stats=OnlineStats(self.dim,ess_batch)
+
+        beginning=timeit.default_timer()-(self.times[s0-1] if s0>0 else 0)
+        if s0>num_burnin: tic=beginning+(self.times[num_burnin-1] if num_burnin>0 else 0)
+        for s in range(s0,num_samp+num_burnin):
 
             if s==num_burnin:
                 # start the timer
@@ -490,14 +513,8 @@ class AEinfGMC:
             # save results
             self.loglik[s]=self.ll
             if s>=num_burnin:
-#                 self.samp << vec2fun(self.q,self.model.prior.V,name='sample_{0}'.format(s-num_burnin))
-                q_f=df.Function(self.model.prior.V)
-#                 q_f.vector()[:]=self.q
-                q_f.vector().set_local(self.q)
-                q_f.vector().apply('insert')
-#                 q_f.vector().zero()
-#                 q_f.vector().axpy(1.,self.q)
-                self.samp.write(q_f,'sample_{0}'.format(s-num_burnin))
+                self.samp.append(self.q)
+                self.stats.update(self.q)
                 self.acpt+=acpt_idx
             
             # record the time
@@ -514,13 +531,26 @@ class AEinfGMC:
                     self.h=self.h_adpt['h']
                     print('Adaptation completed; step size freezed at:  %.6f\n' % self.h_adpt['h'])
 
+            # save checkpoint at intervals
+            if chkpt_intvl and (s+1)%chkpt_intvl==0 and s+1<num_samp+num_burnin:
+                t_chkpt=timeit.default_timer()
+                self.samp.flush()
+                save_chkpt(self,chkpt_fname,s+1,accp=accp,chkpt_time=self.chkpt_time)
+                self.chkpt_time+=timeit.default_timer()-t_chkpt
+
         # stop timer
+        for k in ('loglik','logwts','times'):
+            if hasattr(self,k): self.samp.write(k,getattr(self,k))
+        self.stats.save(self.samp)
         self.samp.close()
         toc=timeit.default_timer()
         self.time=toc-tic
         self.acpt/=num_samp
         print("\nAfter %g seconds, %d samples have been collected with the final acceptance rate %0.2f \n"
               % (self.time,num_samp,self.acpt))
+        if self.chkpt_time: print('Time used for writing checkpoints: %g seconds\n' % self.chkpt_time)
+        print(self.stats,'\n')
+        if isinstance(self.geom,GeomCache): print(self.geom,'\n')
 
         # save to file
         self.save_samp()
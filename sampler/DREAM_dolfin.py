@@ -15,6 +15,11 @@ __email__ = "slan@asu.edu; lanzithinking@outlook.com"
 
 import numpy as np
 import timeit,time
+from .checkpoint import chkpt_file,save_chkpt,load_chkpt
+from .geom_cache import GeomCache
+from .fixed_post_Ga import FixedPostGa
+from util.sample_store import SampleStore
+from util.online_stats import OnlineStats
 import dolfin as df
 import sys,os
 sys.path.append( "../" )
@@ -61,13 +66,30 @@ class DREAM:
                 print('Warning: No proper AutoEncoder found for volume adjustment! No volume weights will be logged.')
                 self.log_wts=False
         self.whitened=kwargs.pop('whitened',False)
+        self.decode=kwargs.pop('decode',None) # map latent parameter to the original space (numpy array) for online summaries
+        self.stats_full=None
         
         # geometry needed
         geom_ord=[0]
         if any(s in alg_name for s in ['MALA','HMC']): geom_ord.append(1)
         if any(s in alg_name for s in ['mMALA','mHMC']): geom_ord.append(2)
-        self.geom=lambda parameter: latent_geom(parameter,geom_ord=geom_ord,whitened=self.whitened,**kwargs)
-        self.ll,self.g,_,self.eigs=self.geom(self.q)
+        cache_size=kwargs.pop('geom_cache',10) # size of LRU cache of geometry (0 for none)
+        warm_eigs=kwargs.pop('warm_eigs',False) and 2 in geom_ord # warm-start the eigen-decomposition at a new state from the eigen-pairs of the current state
+        # policy of updating the low-rank approximate posterior post_Ga for manifold algorithms: 'always' (at every state), 'never' (fixed),
+        # M (refreshed every M iterations) or 'acpt' (refreshed when acceptance drops), first computed at post_Ga_init (initial state, 'MAP' or a given parameter)
+        self.resume=kwargs.pop('resume',False) # True or the checkpoint file to resume from, where the state of fixed post_Ga is restored
+        post_Ga_refresh=kwargs.pop('post_Ga_refresh','always')
+        post_Ga_init=kwargs.pop('post_Ga_init',None)
+        refresh_kw={k:kwargs.pop(k) for k in ('acpt_drop','burnin_only') if k in kwargs}
+        self.geom=lambda parameter,geom_ord=geom_ord: latent_geom(parameter,geom_ord=geom_ord,whitened=self.whitened,**(dict(kwargs,eigs0=getattr(self,'eigs',None)) if warm_eigs else kwargs))
+        if 2 in geom_ord and post_Ga_refresh!='always':
+            geom_full=self.geom
+            self.geom=lambda parameter: geom_full(parameter,[s for s in geom_ord if s<2])
+            if cache_size: self.geom=GeomCache(self.geom,cache_size)
+            self.geom=FixedPostGa(model,self.geom,geom_full,post_Ga_refresh,adjust_grad=False,**refresh_kw) # latent geometry does not adjust the gradient
+            if not self.resume: self.geom.refresh(self.q if post_Ga_init is None else post_Ga_init)
+        elif cache_size: self.geom=GeomCache(self.geom,cache_size)
+        if not (self.resume and isinstance(self.geom,FixedPostGa)): self.ll,self.g,_,self.eigs=self.geom(self.q)
 #         self.ll,self.g,_,self.eigs=self.model.get_geom(self.q,geom_ord,**kwargs)
         
         # sampling setting
@@ -471,13 +493,17 @@ class DREAM:
         samp_fpath=os.path.join(os.getcwd(),'result')
         if not os.path.exists(samp_fpath):
             os.makedirs(samp_fpath)
-#         self.samp=df.File(os.path.join(samp_fpath,samp_fname+".xdmf"))
-        self.samp=df.HDF5File(self.model.pde.mpi_comm,os.path.join(samp_fpath,samp_fname+".h5"),"w")
+        self.samp_file=os.path.join(samp_fpath,samp_fname+".h5")
         self.loglik=np.zeros(num_samp+num_burnin)
         self.logwts=np.zeros(num_samp+num_burnin)
         self.acpt=0.0 # final acceptance rate
         self.times=np.zeros(num_samp+num_burnin) # record the history of time used for each sample
         
+        # checkpoint setting
+        chkpt_intvl=kwargs.pop('chkpt_intvl',0) # save a checkpoint every chkpt_intvl iterations (0 for none)
+        resume=kwargs.pop('resume',self.resume) # True (for the default checkpoint file) or the checkpoint file to resume from
+        chkpt_fname=kwargs.pop('chkpt_file',None) or chkpt_file(self)
+        
         # number of adaptations for step size
         if self.adpt_h:
             self.h_adpt['n_adpt']=kwargs.pop('adpt_steps',num_burnin)
@@ -485,9 +511,23 @@ class DREAM:
         # online parameters
         accp=0.0 # online acceptance
         num_cons_bad=0 # number of consecutive bad proposals
-
-        beginning=timeit.default_timer()
-        for s in range(num_samp+num_burnin):
+        
+        # resume from checkpoint if requested
+        s0=0; self.chkpt_time=0.
+        if resume:
+            chkpt=load_chkpt(self,chkpt_fname if resume is True else resume)
+            s0=chkpt['s']; accp=chkpt['accp']; self.chkpt_time=chkpt['chkpt_time']
+        # samples are buffered and appended to one chunked dataset in the h5 file
+        self.samp=SampleStore(self.samp_file,self.dim,"a" if resume else "w",buf_sz=kwargs.pop('buf_sz',100),num_keep=max(0,s0-num_burnin))
+        # running summaries (mean, std, batch-means ESS) of samples, written next to them
+        ess_batch=kwargs.pop('ess_batch',50)
+        if not resume:
+            self.stats=OnlineStats(self.dim,ess_batch)
+            if self.decode is not None: self.stats_full=OnlineStats(self.decode(self.q).size,ess_batch) # decoded, importance-weighted
+
+        beginning=timeit.default_timer()-(self.times[s0-1] if s0>0 else 0)
+        if s0>num_burnin: tic=beginning+(self.times[num_burnin-1] if num_burnin>0 else 0)
+        for s in range(s0,num_samp+num_burnin):
 
             if s==num_burnin:
                 # start the timer
@@ -520,6 +560,11 @@ class DREAM:
 
             accp+=acpt_idx
 
+            # refresh the fixed low-rank approximate posterior if needed
+            if isinstance(self.geom,FixedPostGa) and self.geom.update(s+1,acpt_idx,s<num_burnin):
+                self.geom.refresh(self.q)
+                self.ll,self.g,_,self.eigs=self.geom(self.q)
+
             # display acceptance at intervals
             if (s+1)%100==0:
                 print('\nAcceptance at %d iterations: %0.2f' % (s+1,accp/100))
@@ -529,14 +574,9 @@ class DREAM:
             self.loglik[s]=self.ll
             self.logwts[s]=logwt
             if s>=num_burnin:
-#                 self.samp << vec2fun(self.q,self.model.prior.V,name='sample_{0}'.format(s-num_burnin))
-                q_f=df.Function(self.model.prior.V)
-#                 q_f.vector()[:]=self.q
-                q_f.vector().set_local(self.q)
-                q_f.vector().apply('insert')
-#                 q_f.vector().zero()
-#                 q_f.vector().axpy(1.,self.q)
-                self.samp.write(q_f,'sample_{0}'.format(s-num_burnin))
+                self.samp.append(self.q)
+                self.stats.update(self.q)
+                if self.stats_full is not None: self.stats_full.update(self.decode(self.q),logwt)
                 self.acpt+=acpt_idx
             
             # record the time
@@ -553,13 +593,27 @@ class DREAM:
                     self.h=self.h_adpt['h']
                     print('Adaptation completed; step size freezed at:  %.6f\n' % self.h_adpt['h'])
 
+            # save checkpoint at intervals
+            if chkpt_intvl and (s+1)%chkpt_intvl==0 and s+1<num_samp+num_burnin:
+                t_chkpt=timeit.default_timer()
+                self.samp.flush()
+                save_chkpt(self,chkpt_fname,s+1,accp=accp,chkpt_time=self.chkpt_time)
+                self.chkpt_time+=timeit.default_timer()-t_chkpt
+
         # stop timer
+        for k in ('loglik','logwts','times'):
+            if hasattr(self,k): self.samp.write(k,getattr(self,k))
+        self.stats.save(self.samp)
+        if self.stats_full is not None: self.stats_full.save(self.samp,'full_')
         self.samp.close()
         toc=timeit.default_timer()
         self.time=toc-tic
         self.acpt/=num_samp
         print("\nAfter %g seconds, %d samples have been collected with the final acceptance rate %0.2f \n"
               % (self.time,num_samp,self.acpt))
+        if self.chkpt_time: print('Time used for writing checkpoints: %g seconds\n' % self.chkpt_time)
+        print(self.stats,'\n')
+        if isinstance(self.geom,(GeomCache,FixedPostGa)): print(self.geom,'\n')
 
         # save to file
         self.save_samp()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+"""
+Lockstep batch of chains for infinite dimensional MCMC samplers (geoinfMC, einfGMC, DREAM)
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+K chains advance together: proposals are made on (K,dim) arrays and the geometry of all chains
+is obtained in one batched call, e.g. one forward/gradient pass of the emulator on a batch of size K,
+while Metropolis tests, step sizes and their adaptation are kept separately for each chain.
+--------------------
+Created Dec. 22, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import timeit,time
+from .checkpoint import chkpt_file,save_chkpt,load_chkpt
+
+class batchMC:
+    """
+    Lockstep batch-of-chains version of pCN, infMALA and infHMC, also under emulative (e-) and DREAM frameworks
+    -------------------------------------------------------------------------------------------------------------
+    geom: batched geometry function taking parameters of shape (K,dim) and returning loglik (K,) and gradient (K,dim),
+          e.g. emul_geom/latent_geom of the linear problem; if None, model.get_geom is used.
+    After the class is instantiated with arguments, call sample to collect MCMC samples which will be stored in 'result' folder.
+    """
+    def __init__(self,parameter_init,model,geom,step_size,step_num,alg_name,adpt_h=False,**kwargs):
+        """
+        Initialization
+        """
+        # parameters
+        self.q=np.array(parameter_init,ndmin=2) # (K,dim)
+        self.num_chains,self.dim=self.q.shape
+        self.model=model
+
+        target_acpt=kwargs.pop('target_acpt',0.65)
+        self.whitened=kwargs.pop('whitened',False)
+        self.vol_wts=kwargs.pop('vol_wts',False)
+        if self.vol_wts:
+            self.AE=kwargs.pop('AE',None)
+            if self.AE is None:
+                print('Warning: No proper AutoEncoder found for volume adjustment! No volume weights will be logged.')
+                self.vol_wts=False
+
+        # base algorithm
+        self.alg_name = alg_name
+        self._alg=alg_name.replace('DREAM','')
+        if self._alg.startswith('e'): self._alg=self._alg[1:]
+        if self._alg not in ('pCN','infMALA','infHMC'):
+            raise ValueError(self.alg_name+' not available in batch mode!')
+
+        # geometry needed
+        geom_ord=[0]
+        if any(s in alg_name for s in ['MALA','HMC']): geom_ord.append(1)
+        if geom is None:
+            self.geom=lambda parameter: model.get_geom(parameter,geom_ord=geom_ord,**kwargs)
+        else:
+            self.geom=lambda parameter: geom(parameter,geom_ord=geom_ord,whitened=self.whitened,**kwargs)
+        self.ll,self.g=self._get_geom(self.q)
+
+        # sampling setting
+        self.h=np.resize(np.array(step_size,dtype=float),self.num_chains) # step size for each chain
+        self.L=step_num
+        if 'HMC' not in alg_name: self.L=1
+
+        # optional setting for adapting step size
+        self.adpt_h=adpt_h
+        if self.adpt_h:
+            h_adpt={}
+            h_adpt['h']=self.h.copy()
+            h_adpt['mu']=np.log(10*h_adpt['h'])
+            h_adpt['loghn']=np.zeros(self.num_chains)
+            h_adpt['An']=np.zeros(self.num_chains)
+            h_adpt['gamma']=0.05
+            h_adpt['n0']=10
+            h_adpt['kappa']=0.75
+            h_adpt['a0']=target_acpt
+            self.h_adpt=h_adpt
+
+    def _get_geom(self,q):
+        """
+        get loglik (K,) and gradient (K,dim) of all chains in one batched call
+        """
+        ll,g=self.geom(q)[:2]
+        ll=np.reshape(ll,self.num_chains)
+        if g is not None: g=np.reshape(g,(self.num_chains,self.dim))
+        return ll,g
+
+    def _natgrad(self,g):
+        """
+        natural gradient C g for all chains
+        """
+        return g if self.whitened else g.dot(self.model.prior['cov'].T)
+
+    def _logvol(self,q,coding):
+        """
+        log-volume adjustment of the autoencoder for all chains
+        """
+        if not hasattr(self.AE,'batch_logvol'):
+            from .DREAM import logvol
+            return np.array([logvol(q_k,self.AE,coding) for q_k in q])
+        if 'Conv' in type(self.AE).__name__ and self.AE.activations['latent'] is None:
+            # map each chain to an image as in DREAM.logvol
+            from .DREAM import chop,vec2img
+            q=np.stack([chop(vec2img(q_k)) for q_k in q])[:,:,:,None]
+        input={'encode':self.AE.decode(q),'decode':q}[coding]
+        return np.reshape(self.AE.batch_logvol(input,coding),self.num_chains)
+
+    def randv(self):
+        """
+        sample v ~ N(0,C) for all chains
+        """
+        if self.whitened:
+            v = np.random.randn(self.num_chains,self.dim)
+        else:
+            try:
+                v = self.model.prior['sample'](num_samp=self.num_chains)
+            except TypeError:
+                v = np.stack([self.model.prior['sample']() for k in range(self.num_chains)])
+        return np.reshape(v,(self.num_chains,self.dim))
+
+    def _MHstep(self,logr,q,ll,g=None):
+        """
+        Metropolis test for each chain
+        """
+        acpt=np.isfinite(logr)
+        acpt[acpt]=np.log(np.random.uniform(size=self.num_chains))[acpt]<np.minimum(0,logr[acpt])
+        self.q[acpt]=q[acpt]; self.ll[acpt]=ll[acpt]
+        if g is not None: self.g[acpt]=g[acpt]
+        return acpt
+
+    def pCN(self):
+        """
+        preconditioned Crank-Nicolson in lockstep
+        """
+        logwt=np.zeros(self.num_chains)
+        h=self.h[:,None]
+
+        # sample velocity
+        v=self.randv()
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(self.q,'encode')
+
+        # generate proposal according to Crank-Nicolson scheme
+        q = ((1-h/4)*self.q + np.sqrt(h)*v)/(1+h/4)
+
+        # update geometry
+        ll,_=self._get_geom(q)
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(q,'decode')
+
+        # Metropolis test
+        logr=ll-self.ll+(logwt if self.vol_wts=='adjust' else 0)
+        acpt=self._MHstep(logr,q,ll)
+        if self.vol_wts=='record': logwt[~acpt]=0
+
+        # return accept indicator
+        return acpt,logr,logwt
+
+    def infMALA(self):
+        """
+        infinite dimensional Metropolis Adjusted Langevin Algorithm in lockstep
+        """
+        logwt=np.zeros(self.num_chains)
+        h=self.h[:,None]; rth=np.sqrt(h)
+
+        # sample velocity
+        v=self.randv()
+
+        # natural gradient
+        ng=self._natgrad(self.g)
+
+        # update velocity
+        v+=rth/2*ng
+
+        # current energy
+        E_cur = -self.ll - self.h**.5/2*np.sum(self.g*v,axis=1) + self.h/8*np.sum(self.g*ng,axis=1)
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(self.q,'encode')
+
+        # generate proposal according to Langevin dynamics
+        q = ((1-h/4)*self.q + rth*v)/(1+h/4)
+
+        # update velocity
+        v = (-(1-h/4)*v + rth*self.q)/(1+h/4)
+
+        # update geometry
+        ll,g=self._get_geom(q)
+
+        # natural gradient
+        ng=self._natgrad(g)
+
+        # new energy
+        E_prp = -ll - self.h**.5/2*np.sum(g*v,axis=1) + self.h/8*np.sum(g*ng,axis=1)
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(q,'decode')
+
+        # Metropolis test
+        logr=-E_prp+E_cur+(logwt if self.vol_wts=='adjust' else 0)
+        acpt=self._MHstep(logr,q,ll,g)
+        if self.vol_wts=='record': logwt[~acpt]=0
+
+        # return accept indicator
+        return acpt,logr,logwt
+
+    def infHMC(self):
+        """
+        infinite dimensional Hamiltonian Monte Carlo in lockstep
+        """
+        logwt=np.zeros(self.num_chains)
+        # initialization
+        q=self.q.copy()
+        h=self.h[:,None]; rth=np.sqrt(h) # make the scale comparable to MALA
+        cos_=np.cos(rth); sin_=np.sin(rth);
+
+        # sample velocity
+        v=self.randv()
+
+        # natural gradient
+        ng=self._natgrad(self.g)
+
+        # accumulate the power of force
+        pw = self.h**.5/2*np.sum(self.g*v,axis=1)
+
+        # current energy
+        E_cur = -self.ll - self.h/8*np.sum(self.g*ng,axis=1)
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(q,'encode')
+
+        # the same number of leapfrog steps for all chains to keep them in lockstep
+        randL=np.int(np.ceil(np.random.uniform(0,self.L)))
+
+        for l in range(randL):
+            # a half step for velocity
+            v+=rth/2*ng
+
+            # a full step for position
+            q_=q.copy()
+            q = cos_*q_ + sin_*v
+            v = -sin_*q_ + cos_*v
+
+            # update geometry
+            ll,g=self._get_geom(q)
+            ng=self._natgrad(g)
+
+            # another half step for velocity
+            v+=rth/2*ng
+
+            # accumulate the power of force
+            if l!=randL-1: pw+=self.h**.5*np.sum(g*v,axis=1)
+
+        # accumulate the power of force
+        pw += self.h**.5/2*np.sum(g*v,axis=1)
+
+        # new energy
+        E_prp = -ll - self.h/8*np.sum(g*ng,axis=1)
+
+        # correct volume if requested
+        if self.vol_wts: logwt+=self._logvol(q,'decode')
+
+        # Metropolis test
+        logr=-E_prp+E_cur-pw+(logwt if self.vol_wts=='adjust' else 0)
+        acpt=self._MHstep(logr,q,ll,g)
+        if self.vol_wts=='record': logwt[~acpt]=0
+
+        # return accept indicator
+        return acpt,logr,logwt
+
+    def _dual_avg(self,iter,an):
+        """
+        dual-averaging to adapt step sizes of all chains
+        """
+        hn_adpt=self.h_adpt
+        hn_adpt['An']=(1.-1./(iter+hn_adpt['n0']))*hn_adpt['An'] + (hn_adpt['a0']-an)/(iter+hn_adpt['n0'])
+        logh=hn_adpt['mu'] - np.sqrt(iter)/hn_adpt['gamma']*hn_adpt['An']
+        hn_adpt['loghn']=pow(iter,-hn_adpt['kappa'])*logh + (1.-pow(iter,-hn_adpt['kappa']))*hn_adpt['loghn']
+        hn_adpt['h']=np.exp(logh)
+        return hn_adpt
+
+    # sample with given method
+    def sample(self,num_samp,num_burnin,num_retry_bad=0,**kwargs):
+        """
+        sample with given MCMC method
+        """
+        sampler = getattr(self, self._alg)
+        print('\nRunning '+self.alg_name+' with %d chains in lockstep now...\n' % self.num_chains)
+
+        # allocate space to store results
+        self.samp=np.zeros((self.num_chains,num_samp,self.dim))
+        self.loglik=np.zeros((self.num_chains,num_samp+num_burnin))
+        self.logwts=np.zeros((self.num_chains,num_samp+num_burnin))
+        self.acpt=np.zeros(self.num_chains) # final acceptance rates
+        self.times=np.zeros(num_samp+num_burnin) # record the history of time used for each (batch of) sample
+
+        # checkpoint setting
+        chkpt_intvl=kwargs.pop('chkpt_intvl',0) # save a checkpoint every chkpt_intvl iterations (0 for none)
+        resume=kwargs.pop('resume',False) # True (for the default checkpoint file) or the checkpoint file to resume from
+        chkpt_fname=kwargs.pop('chkpt_file',None) or chkpt_file(self)
+        
+        # number of adaptations for step size
+        if self.adpt_h:
+            self.h_adpt['n_adpt']=kwargs.pop('adpt_steps',num_burnin)
+
+        # online parameters
+        accp=0.0 # online acceptance
+        num_cons_bad=0 # number of consecutive bad proposals
+        
+        # resume from checkpoint if requested
+        s0=0; self.chkpt_time=0.
+        if resume:
+            chkpt=load_chkpt(self,chkpt_fname if resume is True else resume)
+            s0=chkpt['s']; accp=chkpt['accp']; self.chkpt_time=chkpt['chkpt_time']
+
+        beginning=timeit.default_timer()-(self.times[s0-1] if s0>0 else 0)
+        if s0>num_burnin: tic=beginning+(self.times[num_burnin-1] if num_burnin>0 else 0)
+        for s in range(s0,num_samp+num_burnin):
+
+            if s==num_burnin:
+                # start the timer
+                tic=timeit.default_timer()
+                print('\nBurn-in completed; recording samples now...\n')
+
+            # generate MCMC samples of all chains with given sampler
+            while True:
+                try:
+                    acpt_idx,logr,logwt=sampler()
+                except RuntimeError as e:
+                    print(e)
+                    if num_retry_bad==0:
+                        acpt_idx=np.zeros(self.num_chains,dtype=bool); logr=np.full(self.num_chains,-np.inf); logwt=0
+                        print('Bad proposal encountered! Passing... bias introduced.')
+                        break # reject bad proposal: bias introduced
+                    else:
+                        num_cons_bad+=1
+                        if num_cons_bad<num_retry_bad:
+                            print('Bad proposal encountered! Retrying...')
+                            continue # retry until a valid proposal is made
+                        else:
+                            acpt_idx=np.zeros(self.num_chains,dtype=bool); logr=np.full(self.num_chains,-np.inf); logwt=0
+                            num_cons_bad=0
+                            print(str(num_retry_bad)+' consecutive bad proposals encountered! Passing...')
+                            break # reject it and keep going
+                else:
+                    num_cons_bad=0
+                    break
+
+            accp+=np.mean(acpt_idx)
+
+            # display acceptance at intervals
+            if (s+1)%100==0:
+                print('\nAverage acceptance of %d chains at %d iterations: %0.2f' % (self.num_chains,s+1,accp/100))
+                accp=0.0
+
+            # save results
+            self.loglik[:,s]=self.ll
+            self.logwts[:,s]=logwt
+            if s>=num_burnin:
+                self.samp[:,s-num_burnin]=self.q
+                self.acpt+=acpt_idx
+
+            # record the time
+            self.times[s]=timeit.default_timer()-beginning
+
+            # adapt step sizes if needed
+            if self.adpt_h:
+                if s<self.h_adpt['n_adpt']:
+                    self.h_adpt=self._dual_avg(s+1,np.exp(np.minimum(0,logr)))
+                    self.h=self.h_adpt['h']
+                    print('New step sizes: %s; \t New averaged step sizes: %s\n' %(np.array2string(self.h_adpt['h'],precision=2),np.array2string(np.exp(self.h_adpt['loghn']),precision=6)))
+                if s==self.h_adpt['n_adpt']:
+                    self.h_adpt['h']=np.exp(self.h_adpt['loghn'])
+                    self.h=self.h_adpt['h']
+                    print('Adaptation completed; step sizes freezed at:  %s\n' % np.array2string(self.h_adpt['h'],precision=6))
+
+            # save checkpoint at intervals
+            if chkpt_intvl and (s+1)%chkpt_intvl==0 and s+1<num_samp+num_burnin:
+                t_chkpt=timeit.default_timer()
+                save_chkpt(self,chkpt_fname,s+1,accp=accp,chkpt_time=self.chkpt_time)
+                self.chkpt_time+=timeit.default_timer()-t_chkpt
+
+        # stop timer
+        toc=timeit.default_timer()
+        self.time=toc-tic
+        self.acpt/=num_samp
+        print("\nAfter %g seconds, %d samples of each of %d chains have been collected with the final acceptance rates %s \n"
+              % (self.time,num_samp,self.num_chains,np.array2string(self.acpt,precision=2)))
+        if self.chkpt_time: print('Time used for writing checkpoints: %g seconds\n' % self.chkpt_time)
+
+        # save to file
+        self.save_samp()
+
+    # save samples
+    def save_samp(self):
+        import os,errno
+        import pickle
+        # create folder
+        cwd=os.getcwd()
+        self.savepath=os.path.join(cwd,'result')
+        try:
+            os.makedirs(self.savepath)
+        except OSError as exc:
+            if exc.errno == errno.EEXIST:
+                pass
+            else:
+                raise
+        # name file
+        ctime=time.strftime("%Y-%m-%d-%H-%M-%S")
+        self.filename=self.alg_name+'_dim'+str(self.dim)+'_'+str(self.num_chains)+'chains_'+ctime
+        # dump data
+        f=open(os.path.join(self.savepath,self.filename+'.pckl'),'wb')
+        res2save=[self.h,self.L,self.alg_name,self.samp,self.loglik,self.logwts,self.acpt,self.time,self.times]
+        if self.adpt_h:
+            res2save.append(self.h_adpt)
+        pickle.dump(res2save,f)
+        f.close()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Checkpoint/resume for long MCMC runs
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+The sampler state (current q/ll/g/eigs, random state, step size and its dual-averaging state,
+iteration counter and partial records) is periodically pickled so that sample(..., resume=True)
+continues exactly where a run stopped.
+Works with both numpy arrays and dolfin vectors; MultiVectors of eigen-vectors are stored column-wise and the low-rank
+approximate posterior is rebuilt from the restored eigen-pairs (or recomputed at the restored state) on resume.
+--------------------
+Created Dec. 24, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import os
+import numpy as np
+import pickle
+
+# attributes of samplers to be checkpointed
+STATE_ATTR=('q','ll','g','eigs','h','h_adpt','samp','loglik','logwts','acpt','times','samp_file','fll','DA_stats','stats','stats_full')
+
+class _MultiVec:
+    """
+    columns of a (hIPPYlib) MultiVector stored as a numpy array for pickling
+    """
+    def __init__(self,cols):
+        self.cols=cols
+
+def _to_local(x):
+    """
+    convert dolfin vectors (and MultiVectors) into numpy arrays for pickling
+    """
+    if hasattr(x,'nvec'): return _MultiVec(np.stack([x[i].get_local() for i in range(x.nvec())],axis=1))
+    if hasattr(x,'get_local'): return x.get_local()
+    if isinstance(x,(tuple,list)): return type(x)(_to_local(x_i) for x_i in x)
+    if isinstance(x,dict): return {k:_to_local(v) for k,v in x.items()}
+    return x
+
+def _set_local(x,v):
+    """
+    set values v to (dolfin vector) x in place if possible
+    """
+    if hasattr(x,'set_local'):
+        x.set_local(v); x.apply('insert')
+        return x
+    return v
+
+def _from_local(v,tmpl=None,vec=None):
+    """
+    rebuild MultiVectors from their columns, using the class of MultiVector tmpl (hIPPYlib's by default) and template vector vec
+    """
+    if isinstance(v,_MultiVec):
+        if hasattr(tmpl,'nvec'):
+            MV=type(tmpl); vec=tmpl[0]
+        else:
+            from hippylib import MultiVector as MV
+        x=MV(vec,v.cols.shape[1])
+        for i in range(v.cols.shape[1]):
+            x[i].set_local(v.cols[:,i]); x[i].apply('insert')
+        return x
+    if isinstance(v,(tuple,list)):
+        tmpl=tmpl if isinstance(tmpl,(tuple,list)) and len(tmpl)==len(v) else [tmpl]*len(v)
+        return type(v)(_from_local(v_i,t_i,vec) for v_i,t_i in zip(v,tmpl))
+    if isinstance(v,dict):
+        tmpl=tmpl if isinstance(tmpl,dict) else {}
+        return {k:_from_local(v_k,tmpl.get(k),vec) for k,v_k in v.items()}
+    return v
+
+def rebuild_post_Ga(post_Ga,eigs):
+    """
+    rebuild the low-rank approximate posterior post_Ga with eigen-pairs eigs; None if post_Ga cannot be rebuilt
+    """
+    if post_Ga is None or eigs is None or isinstance(post_Ga,dict): return None
+    if hasattr(post_Ga,'d') and hasattr(post_Ga,'U'): # hIPPYlib GaussianLRPosterior
+        return type(post_Ga)(post_Ga.prior,eigs[0],eigs[1])
+    if hasattr(getattr(post_Ga,'Hlr',None),'eigs'): # _GA_posterior_lr
+        return type(post_Ga)(post_Ga.prior,eigs)
+    return None
+
+def chkpt_file(sampler):
+    """
+    default name of checkpoint file
+    """
+    fpath=os.path.join(os.getcwd(),'result')
+    if not os.path.exists(fpath): os.makedirs(fpath)
+    return os.path.join(fpath,sampler.alg_name+'_dim'+str(sampler.dim)+'_chkpt.pckl')
+
+def save_chkpt(sampler,fname,s,**kwargs):
+    """
+    save the sampler state after finishing s iterations
+    """
+    state={'s':s}
+    for k in STATE_ATTR:
+        v=getattr(sampler,k,None)
+        if k=='samp' and not isinstance(v,np.ndarray): continue # dolfin samplers write samples to their own files
+        if v is not None: state[k]=_to_local(v)
+    # fixed low-rank approximate posterior of manifold algorithms
+    if hasattr(sampler.geom,'get_state'): state['post_Ga_state']=_to_local(sampler.geom.get_state())
+    state['rng']=np.random.get_state()
+    state.update(kwargs)
+    # write to a temporary file first so that a crash in writing does not ruin the last checkpoint
+    with open(fname+'.tmp','wb') as f:
+        pickle.dump(state,f)
+    os.replace(fname+'.tmp',fname)
+
+def load_chkpt(sampler,fname):
+    """
+    restore the sampler state and return the remaining items (iteration counter etc.)
+    """
+    with open(fname,'rb') as f:
+        state=pickle.load(f)
+    for k in STATE_ATTR:
+        if k not in state: continue
+        v=state.pop(k)
+        if k in ('q','g') and hasattr(getattr(sampler,k,None),'set_local'):
+            _set_local(getattr(sampler,k),v)
+        else:
+            setattr(sampler,k,_from_local(v,getattr(sampler,k,None),sampler.q))
+    # restore the fixed low-rank approximate posterior, or rebuild that with the checkpointed eigen-pairs for manifold algorithms
+    if 'post_Ga_state' in state:
+        geom_state=state.pop('post_Ga_state')
+        q_ref=sampler.q.copy()
+        geom_state['q_ref']=_set_local(q_ref,geom_state['q_ref'])
+        geom_state=_from_local(geom_state,{'eigs':getattr(sampler.geom,'eigs',None)},sampler.q)
+        sampler.geom.set_state(geom_state)
+        # geometry up to the gradient at the checkpointed state with the restored post_Ga
+        sampler.ll,sampler.g,_,sampler.eigs=sampler.geom(sampler.q)
+    elif any(s in sampler.alg_name for s in ['mMALA','mHMC']):
+        post_Ga=rebuild_post_Ga(getattr(sampler.model,'post_Ga',None),sampler.eigs)
+        if post_Ga is None:
+            # recompute the geometry (and post_Ga) at the checkpointed state
+            sampler.ll,sampler.g,_,sampler.eigs=sampler.geom(sampler.q)
+        else:
+            sampler.model.post_Ga=post_Ga
+    np.random.set_state(state.pop('rng'))
+    print('Resumed from checkpoint '+fname+' at iteration %d.' % state['s'])
+    return state
@@ -16,6 +16,9 @@ __email__ = "slan@asu.edu; lanzithinking@outlook.com"
 
 import numpy as np
 import timeit,time
+from .checkpoint import chkpt_file,save_chkpt,load_chkpt
+from .geom_cache import GeomCache
+from .fixed_post_Ga import FixedPostGa
 
 class einfGMC:
     """
@@ -33,13 +36,35 @@ class einfGMC:
         self.model=model
         
         target_acpt=kwargs.pop('target_acpt',0.65)
+        # delayed acceptance: proposals accepted with emulated geometry are further tested with full geometry
+        full_geom=kwargs.pop('full_geom',None)
+        self.DA=full_geom is not None
         # geometry needed
         geom_ord=[0]
         if any(s in alg_name for s in ['MALA','HMC']): geom_ord.append(1)
         if any(s in alg_name for s in ['mMALA','mHMC']): geom_ord.append(2)
-        self.geom=lambda parameter: emul_geom(parameter,geom_ord=geom_ord,**kwargs)
-        self.ll,self.g,_,self.eigs=self.geom(self.q)
+        cache_size=kwargs.pop('geom_cache',10) # size of LRU cache of geometry (0 for none)
+        # policy of updating the low-rank approximate posterior post_Ga for manifold algorithms: 'always' (at every state), 'never' (fixed),
+        # M (refreshed every M iterations) or 'acpt' (refreshed when acceptance drops), first computed at post_Ga_init (initial state, 'MAP' or a given parameter)
+        self.resume=kwargs.pop('resume',False) # True or the checkpoint file to resume from, where the state of fixed post_Ga is restored
+        post_Ga_refresh=kwargs.pop('post_Ga_refresh','always')
+        post_Ga_init=kwargs.pop('post_Ga_init',None)
+        refresh_kw={k:kwargs.pop(k) for k in ('acpt_drop','burnin_only') if k in kwargs}
+        self.geom=lambda parameter,geom_ord=geom_ord: emul_geom(parameter,geom_ord=geom_ord,**kwargs)
+        if 2 in geom_ord and post_Ga_refresh!='always':
+            geom_full=self.geom
+            self.geom=lambda parameter: geom_full(parameter,[s for s in geom_ord if s<2])
+            if cache_size: self.geom=GeomCache(self.geom,cache_size)
+            self.geom=FixedPostGa(model,self.geom,geom_full,post_Ga_refresh,whitened=kwargs.get('whitened',False),**refresh_kw)
+            if not self.resume: self.geom.refresh(self.q if post_Ga_init is None else post_Ga_init)
+        elif cache_size: self.geom=GeomCache(self.geom,cache_size)
+        if not (self.resume and isinstance(self.geom,FixedPostGa)): self.ll,self.g,_,self.eigs=self.geom(self.q)
 #         self.ll,self.g,_,self.eigs=self.model.get_geom(self.q,geom_ord,**kwargs)
+        if self.DA:
+            whitened=kwargs.get('whitened',False)
+            self.full_ll=lambda parameter: full_geom(parameter,geom_ord=[0],whitened=whitened)[0] # only loglik is needed in the second stage, on the same (whitened) parameter as the emulated one
+            self.fll=self.full_ll(self.q)
+            self.DA_stats={'n_prop':0,'n_full':0,'n_acpt':0} # numbers of proposals, full evaluations and final acceptances
 
         # sampling setting
         self.h=step_size
@@ -326,6 +351,33 @@ class einfGMC:
         # return accept indicator
         return acpt,logr
     
+    def _delayed_acpt(self,stage1):
+        """
+        delayed acceptance by Christen and Fox (2005): the emulative sampler serves as the first stage;
+        its accepted proposals are corrected with full loglik so that the exact posterior is targeted
+        """
+        def sampler():
+            # current state
+            q,ll,g,eigs=self.q,self.ll,self.g,self.eigs
+            # first stage with emulated geometry
+            acpt,logr=stage1()
+            self.DA_stats['n_prop']+=1
+            if acpt:
+                # second stage with full geometry
+                fll=self.full_ll(self.q)
+                self.DA_stats['n_full']+=1
+                logr2=fll-self.fll-(self.ll-ll)
+                if np.isfinite(logr2) and np.log(np.random.uniform())<min(0,logr2):
+                    self.fll=fll
+                    self.DA_stats['n_acpt']+=1
+                else:
+                    # restore the state
+                    self.q=q; self.ll=ll; self.g=g; self.eigs=eigs;
+                    acpt=False
+                logr=min(0,logr)+min(0,logr2) # log of overall acceptance probability
+            return acpt,logr
+        return sampler
+    
     def _init_h(self):
         """
         find a reasonable initial step size
@@ -365,7 +417,8 @@ class einfGMC:
         except AttributeError:
             print(self.alg_name, 'not found!')
         else:
-            print('\nRunning '+self.alg_name+' now...\n')
+            print('\nRunning '+self.alg_name+(' with delayed acceptance' if self.DA else '')+' now...\n')
+        if self.DA: sampler=self._delayed_acpt(sampler)
 
         # allocate space to store results
         self.samp=np.zeros((num_samp,self.dim))
@@ -373,6 +426,11 @@ class einfGMC:
         self.acpt=0.0 # final acceptance rate
         self.times=np.zeros(num_samp+num_burnin) # record the history of time used for each sample
         
+        # checkpoint setting
+        chkpt_intvl=kwargs.pop('chkpt_intvl',0) # save a checkpoint every chkpt_intvl iterations (0 for none)
+        resume=kwargs.pop('resume',self.resume) # True (for the default checkpoint file) or the checkpoint file to resume from
+        chkpt_fname=kwargs.pop('chkpt_file',None) or chkpt_file(self)
+        
         # number of adaptations for step size
         if self.adpt_h:
             self.h_adpt['n_adpt']=kwargs.pop('adpt_steps',num_burnin)
@@ -380,9 +438,16 @@ class einfGMC:
         # online parameters
         accp=0.0 # online acceptance
         num_cons_bad=0 # number of consecutive bad proposals
+        
+        # resume from checkpoint if requested
+        s0=0; self.chkpt_time=0.
+        if resume:
+            chkpt=load_chkpt(self,chkpt_fname if resume is True else resume)
+            s0=chkpt['s']; accp=chkpt['accp']; self.chkpt_time=chkpt['chkpt_time']
 
-        beginning=timeit.default_timer()
-        for s in range(num_samp+num_burnin):
+        beginning=timeit.default_timer()-(self.times[s0-1] if s0>0 else 0)
+        if s0>num_burnin: tic=beginning+(self.times[num_burnin-1] if num_burnin>0 else 0)
+        for s in range(s0,num_samp+num_burnin):
 
             if s==num_burnin:
                 # start the timer
@@ -415,6 +480,11 @@ class einfGMC:
 
             accp+=acpt_idx
 
+            # refresh the fixed low-rank approximate posterior if needed
+            if isinstance(self.geom,FixedPostGa) and self.geom.update(s+1,acpt_idx,s<num_burnin):
+                self.geom.refresh(self.q)
+                self.ll,self.g,_,self.eigs=self.geom(self.q)
+
             # display acceptance at intervals
             if (s+1)%100==0:
                 print('\nAcceptance at %d iterations: %0.2f' % (s+1,accp/100))
@@ -440,12 +510,24 @@ class einfGMC:
                     self.h=self.h_adpt['h']
                     print('Adaptation completed; step size freezed at:  %.6f\n' % self.h_adpt['h'])
 
+            # save checkpoint at intervals
+            if chkpt_intvl and (s+1)%chkpt_intvl==0 and s+1<num_samp+num_burnin:
+                t_chkpt=timeit.default_timer()
+                save_chkpt(self,chkpt_fname,s+1,accp=accp,chkpt_time=self.chkpt_time)
+                self.chkpt_time+=timeit.default_timer()-t_chkpt
+
         # stop timer
         toc=timeit.default_timer()
         self.time=toc-tic
         self.acpt/=num_samp
         print("\nAfter %g seconds, %d samples have been collected with the final acceptance rate %0.2f \n"
               % (self.time,num_samp,self.acpt))
+        if self.chkpt_time: print('Time used for writing checkpoints: %g seconds\n' % self.chkpt_time)
+        if isinstance(self.geom,(GeomCache,FixedPostGa)): print(self.geom,'\n')
+        if self.DA:
+            n_saved=self.DA_stats['n_prop']-self.DA_stats['n_full']
+            print('Delayed acceptance: %d of %d proposals screened out by the emulator, saving %.1f%% of full geometry evaluations.\n'
+                  % (n_saved,self.DA_stats['n_prop'],100.*n_saved/max(1,self.DA_stats['n_prop'])))
 
         # save to file
         self.save_samp()
@@ -472,6 +554,8 @@ class einfGMC:
         res2save=[self.h,self.L,self.alg_name,self.samp,self.loglik,self.acpt,self.time,self.times]
         if self.adpt_h:
             res2save.append(self.h_adpt)
+        if self.DA:
+            res2save.append(self.DA_stats)
         pickle.dump(res2save,f)
         f.close()
 #         # load data
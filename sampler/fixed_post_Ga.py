@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Fixed (periodically refreshed) low-rank Gaussian posterior approximation for manifold MCMC samplers
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Instead of updating the eigen-pairs of the low-rank approximate posterior post_Ga at every proposal,
+post_Ga is computed once (e.g. at the MAP) and only refreshed according to a policy:
+never, every M iterations, or when the acceptance rate drops.
+Between refreshes the manifold algorithms use a state-independent preconditioner, so only geometry up to
+the gradient is computed at each state, and the -0.5*log det terms cancel in the acceptance ratio.
+--------------------
+Created Jan. 2, 2021 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+from .checkpoint import rebuild_post_Ga
+
+class FixedPostGa:
+    """
+    Geometry function parameter -> (ll,g,metact,eigs) with the low-rank approximate posterior post_Ga fixed between refreshes
+    ------------------------------------------------------------------------------------------------------------------------
+    The gradient is adjusted with the fixed post_Ga as in model.get_geom (model.adjust_grad), and the fixed eigen-pairs are returned,
+    so that the energies of the manifold algorithms give the acceptance ratio of the fixed-preconditioner proposal.
+    """
+    def __init__(self,model,geom,geom_full,refresh='never',acpt_drop=.5,win_sz=100,burnin_only=True,whitened=False,adjust_grad=True):
+        """
+        Initialization
+        --------------
+        model: model holding post_Ga, which is updated by geom_full
+        geom: geometry function without eigen-decomposition (geom_ord<=1), possibly cached
+        geom_full: geometry function with eigen-decomposition (geom_ord including 2)
+        refresh: 'never', M (every M iterations) or 'acpt' (when the acceptance in a window of win_sz iterations
+                 drops below (1-acpt_drop) of that in the first window after the last refresh)
+        burnin_only: refresh during burn-in only so that samples are collected with a fixed preconditioner
+        whitened: whether the parameter is whitened, passed to model.adjust_grad
+        adjust_grad: whether to adjust the gradient with post_Ga, as geom_full does
+        """
+        self.model=model
+        self.geom=geom
+        self.geom_full=geom_full
+        self.refresh_plcy=refresh
+        self.acpt_drop=acpt_drop
+        self.win_sz=win_sz
+        self.burnin_only=burnin_only
+        self.whitened=whitened
+        self.adjust_grad=adjust_grad
+        self.n_refresh=0
+        self._acpt_win=0; self._acpt_ref=None
+
+    def refresh(self,parameter):
+        """
+        (Re)compute the eigen-pairs and post_Ga at parameter ('MAP' for the MAP given by model.get_MAP)
+        """
+        if isinstance(parameter,str) and parameter=='MAP':
+            parameter=self.model.get_MAP()
+            if hasattr(parameter,'vector'): parameter=parameter.vector() # dolfin function
+        _,_,_,self.eigs=self.geom_full(parameter)
+        self.post_Ga=self.model.post_Ga
+        self.q_ref=parameter.copy()
+        self.n_refresh+=1
+        self._acpt_win=0; self._acpt_ref=None
+
+    def __call__(self,parameter):
+        ll,g,metact,_=self.geom(parameter)
+        # keep post_Ga fixed
+        self.model.post_Ga=self.post_Ga
+        if self.adjust_grad:
+            if hasattr(self.model,'adjust_grad'):
+                # the same adjustment as in model.get_geom
+                g=self.model.adjust_grad(parameter,g.copy(),self.post_Ga,whitened=self.whitened)
+            elif isinstance(self.post_Ga,dict):
+                g=g+self.post_Ga['Hlr'].dot(parameter)
+            else:
+                Hq=self.model.prior.gen_vector()
+                self.post_Ga.Hlr.mult(parameter,Hq)
+                g=g.copy(); g.axpy(1.,Hq)
+        return ll,g,metact,self.eigs
+
+    def get_state(self):
+        """
+        State to be checkpointed: eigen-pairs, parameter of the last refresh, refresh counter and acceptance window
+        """
+        return {'eigs':self.eigs,'q_ref':self.q_ref,'n_refresh':self.n_refresh,'acpt_win':self._acpt_win,'acpt_ref':self._acpt_ref}
+
+    def set_state(self,state):
+        """
+        Restore the state given by get_state: post_Ga is rebuilt from the eigen-pairs if possible, otherwise recomputed at
+        the parameter of the last refresh
+        """
+        post_Ga=rebuild_post_Ga(getattr(self,'post_Ga',getattr(self.model,'post_Ga',None)),state['eigs'])
+        if post_Ga is None:
+            self.refresh(state['q_ref'])
+        else:
+            self.eigs=state['eigs']; self.q_ref=state['q_ref']
+            self.post_Ga=self.model.post_Ga=post_Ga
+        self.n_refresh=state['n_refresh']; self._acpt_win=state['acpt_win']; self._acpt_ref=state['acpt_ref']
+
+    def update(self,n,acpt,burnin=True):
+        """
+        Decide whether to refresh after n iterations with the latest acceptance indicator acpt
+        """
+        if self.burnin_only and not burnin: return False
+        if self.refresh_plcy=='acpt':
+            self._acpt_win+=acpt
+            if n%self.win_sz==0:
+                acpt_rate=self._acpt_win/self.win_sz; self._acpt_win=0
+                if self._acpt_ref is None:
+                    self._acpt_ref=acpt_rate
+                elif acpt_rate<(1-self.acpt_drop)*self._acpt_ref:
+                    print('Acceptance dropped from %0.2f to %0.2f; refreshing the low-rank posterior approximation...' % (self._acpt_ref,acpt_rate))
+                    return True
+            return False
+        elif isinstance(self.refresh_plcy,(int,np.integer)) and self.refresh_plcy>0:
+            return n%self.refresh_plcy==0
+        return False
+
+    def __repr__(self):
+        return 'fixed low-rank posterior approximation: computed %d times (refresh policy %s)' % (self.n_refresh,self.refresh_plcy)+('; '+repr(self.geom) if hasattr(self.geom,'cache') else '')
+
+def check_fixed(model,parameter,**kwargs):
+    """
+    Check that the gradient with post_Ga fixed ('never') at the one computed at parameter coincides with that of updating post_Ga ('always')
+    kwargs: keyword arguments of model.get_geom, e.g. k, the number of eigen-pairs
+    """
+    geom_full=lambda q,geom_ord=[0,1,2]: model.get_geom(q,geom_ord=geom_ord,**kwargs)
+    _,g_always,_,eigs=geom_full(parameter)
+    fixed=FixedPostGa(model,lambda q: geom_full(q,[0,1]),geom_full,whitened=kwargs.get('whitened',False))
+    fixed.post_Ga=model.post_Ga; fixed.eigs=eigs
+    _,g_never,_,_=fixed(parameter)
+    norm=lambda v: v.norm('l2') if hasattr(v,'norm') else np.linalg.norm(v)
+    rdiff=norm(g_never-g_always)/norm(g_always)
+    print('Relative difference of the gradients with fixed and updated post_Ga: %.2e' % rdiff)
+    return rdiff
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+LRU cache of geometric quantities for MCMC samplers
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Geometry (loglik, gradient, metric action, eigen-pairs) of recently visited states is kept,
+keyed by a hash of the parameter vector, so that repeated or restored states
+(e.g. chain restarts, step-size search) do not trigger another PDE/adjoint solve.
+--------------------
+Created Dec. 28, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import hashlib
+from collections import OrderedDict
+
+class GeomCache:
+    """
+    Least-recently-used cache wrapped around a geometry function parameter -> (ll,g,metact,eigs)
+    -------------------------------------------------------------------------------------------
+    The cached outputs are returned as they are, so they should not be modified in place.
+    """
+    def __init__(self,geom,max_size=10):
+        self.geom=geom
+        self.max_size=max_size
+        self.cache=OrderedDict()
+        self.hits=0
+        self.misses=0
+
+    def _key(self,parameter):
+        """
+        hash of the parameter (numpy array or dolfin vector)
+        """
+        a=np.ascontiguousarray(parameter.get_local() if hasattr(parameter,'get_local') else parameter)
+        return hashlib.sha1(a.view(np.uint8)).hexdigest()+str(a.shape)
+
+    def __call__(self,parameter):
+        key=self._key(parameter)
+        if key in self.cache:
+            self.hits+=1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses+=1
+        out=self.geom(parameter)
+        self.cache[key]=out
+        if len(self.cache)>self.max_size: self.cache.popitem(last=False)
+        return out
+
+    def clear(self):
+        self.cache.clear()
+
+    def __repr__(self):
+        return 'geometry cache: %d hits, %d misses (size %d of %d)' % (self.hits,self.misses,len(self.cache),self.max_size)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Multi-chain runner for (DREAM/emulative/geometric) infinite-dimensional MCMC algorithms
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Independent chains are run in separate processes, each with its own random stream.
+Any sampler class with method sample(num_samp,num_burnin) can be used, e.g. DREAM, DREAM_dolfin, einfGMC, geoinfMC.
+The results of all chains are merged into one record in the 'result' folder.
+--------------------
+Created Dec. 20, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import os,sys
+import numpy as np
+import timeit,time
+import multiprocessing as mp
+
+def _run_chain(args):
+    """
+    Run one chain in a worker process
+    ---------------------------------
+    setup: a picklable (module-level) function that builds the sampler given chain_id
+    """
+    setup,chain_id,seed,num_samp,num_burnin,kwargs=args
+    # independent random stream for this chain
+    np.random.seed(seed)
+    if 'tensorflow' in sys.modules:
+        sys.modules['tensorflow'].random.set_seed(seed)
+    # build the sampler
+    sampler=setup(chain_id)
+    # run chain in its own folder so that files of different chains do not collide
+    cwd=os.getcwd()
+    chain_dir=os.path.join(cwd,'result','chain'+str(chain_id))
+    if not os.path.exists(chain_dir): os.makedirs(chain_dir)
+    os.chdir(chain_dir)
+    try:
+        print('Chain %d starts with seed %d...' % (chain_id,seed))
+        sampler.sample(num_samp,num_burnin,**kwargs)
+    finally:
+        os.chdir(cwd)
+    # collect results
+    res={'chain_id':chain_id,'seed':seed}
+    for k in ('h','L','alg_name','dim','samp','loglik','logwts','acpt','time','times','h_adpt','savepath','filename'):
+        v=getattr(sampler,k,None)
+        if k=='samp' and not isinstance(v,np.ndarray): continue # samples of dolfin samplers are stored in their own h5 files
+        if v is not None: res[k]=v
+    return res
+
+class MultiChain:
+    """
+    Multi-chain runner for MCMC samplers
+    ------------------------------------
+    After the class is instantiated with arguments, call sample to run num_chains independent chains in parallel;
+    merged results will be stored in 'result' folder, with those of individual chains in 'result/chain<i>'.
+    """
+    def __init__(self,setup,num_chains=4,seed=2020,n_jobs=None,**kwargs):
+        """
+        Initialization
+        --------------
+        setup: a picklable (module-level) function taking chain_id and returning an instantiated sampler
+        num_chains: number of independent chains
+        seed: master seed from which independent seeds of chains are spawned
+        n_jobs: number of worker processes, default to min(num_chains, cpu count)
+        start_method: start method of processes; 'spawn' is safe with dolfin/TensorFlow
+        threads_per_chain: number of BLAS/OpenMP threads in each worker to avoid oversubscription
+        """
+        self.setup=setup
+        self.num_chains=num_chains
+        self.n_jobs=min(num_chains,mp.cpu_count()) if n_jobs is None else n_jobs
+        self.start_method=kwargs.pop('start_method','spawn')
+        self.threads_per_chain=kwargs.pop('threads_per_chain',max(1,mp.cpu_count()//self.n_jobs))
+        # independent seeds
+        self.seeds=[int(ss.generate_state(1)[0]) for ss in np.random.SeedSequence(seed).spawn(self.num_chains)]
+
+    def sample(self,num_samp,num_burnin,**kwargs):
+        """
+        Run chains in parallel and merge their results
+        """
+        args=[(self.setup,i,self.seeds[i],num_samp,num_burnin,kwargs) for i in range(self.num_chains)]
+        # limit threads of numerical libraries in each worker
+        thread_vars=('OMP_NUM_THREADS','OPENBLAS_NUM_THREADS','MKL_NUM_THREADS')
+        env_old={k:os.environ.get(k) for k in thread_vars}
+        for k in thread_vars: os.environ[k]=str(self.threads_per_chain)
+
+        beginning=timeit.default_timer()
+        try:
+            if self.n_jobs>1:
+                ctx=mp.get_context(self.start_method)
+                with ctx.Pool(processes=self.n_jobs,maxtasksperchild=1) as pool:
+                    results=pool.map(_run_chain,args,chunksize=1)
+            else:
+                results=[_run_chain(arg) for arg in args]
+        finally:
+            for k,v in env_old.items():
+                if v is None: os.environ.pop(k,None)
+                else: os.environ[k]=v
+        self.wall_time=timeit.default_timer()-beginning
+
+        # merge results
+        results.sort(key=lambda res:res['chain_id'])
+        self.chains=results
+        self.alg_name=results[0].get('alg_name','MCMC')
+        self.dim=results[0].get('dim',0)
+        self.h=np.array([res['h'] for res in results])
+        self.L=results[0].get('L',1)
+        self.loglik=np.stack([res['loglik'] for res in results])
+        self.logwts=np.stack([res['logwts'] for res in results]) if all('logwts' in res for res in results) else None
+        self.acpt=np.array([res['acpt'] for res in results])
+        self.time=np.array([res['time'] for res in results])
+        self.times=np.stack([res['times'] for res in results])
+        self.samp=np.stack([res['samp'] for res in results]) if all('samp' in res for res in results) else None
+        self.samp_files=[os.path.join(res['savepath'],res['filename']) for res in results if 'filename' in res]
+        print("\nAfter %g seconds (wall clock), %d chains of %d samples have been collected with acceptance rates %s \n"
+              % (self.wall_time,self.num_chains,num_samp,np.array2string(self.acpt,precision=2)))
+
+        # save to file
+        self.save_samp()
+
+    # save samples
+    def save_samp(self):
+        import errno
+        import pickle
+        # create folder
+        cwd=os.getcwd()
+        self.savepath=os.path.join(cwd,'result')
+        try:
+            os.makedirs(self.savepath)
+        except OSError as exc:
+            if exc.errno == errno.EEXIST:
+                pass
+            else:
+                raise
+        # name file
+        ctime=time.strftime("%Y-%m-%d-%H-%M-%S")
+        self.filename=self.alg_name+'_dim'+str(self.dim)+'_'+str(self.num_chains)+'chains_'+ctime
+        # dump data
+        f=open(os.path.join(self.savepath,self.filename+'.pckl'),'wb')
+        res2save=[self.h,self.L,self.alg_name,self.samp,self.loglik,self.logwts,self.acpt,self.time,self.times,self.seeds,self.wall_time,self.samp_files]
+        pickle.dump(res2save,f)
+        f.close()
@@ -97,6 +97,22 @@ def eigen_xct(V,A,B=None,k=100,spect='LM',**kwargs):
         np.savetxt(os.path.join(os.getcwd(),'prior_'+spect+'eigv_k'+str(k)+'.txt'),eigv,delimiter=',')
         return (eigv,eigf),eigf_dofs
 
+def _blockact(A,X):
+    """
+    Action of operator A on the columns of X.
+    A can be a numpy array, an operator with block action A.matmat (e.g. multi-RHS PDE solves),
+    or a function acting on one vector at a time.
+    """
+    if type(A) is np.ndarray:
+        AX=A.dot(X)
+    elif hasattr(A,'matmat'):
+        AX=np.asarray(A.matmat(X))
+    else:
+        AX=np.zeros(X.shape)
+        for i in range(X.shape[1]):
+            AX[:,i]=A(X[:,i])
+    return AX
+
 def _eigen_randproj(Omega,Y):
     """
     Eigen-decomposition (1pass) of A based on random projection Y=A *Omega
@@ -128,7 +144,7 @@ def eigen_RA_rank(A,dim=None,k=20,p=10):
     if dim is None:
         dim=A.shape[0]
     Omega=np.random.randn(dim,k+p)
-    Y=A.dot(Omega) if type(A) is np.ndarray else np.array([A(r) for r in Omega.T]).T
+    Y=_blockact(A,Omega)
     eigv,eigf_vec=_eigen_randproj(Omega,Y)
     eigv=eigv[:k]
     eigf_vec=eigf_vec[:,:k]
@@ -147,7 +163,7 @@ def eigen_RA_prec(A,dim=None,threshold=0.01,increment_k=20,p=10):
     if dim is None:
         dim=A.shape[0]
     Omega=np.random.randn(dim,increment_k+p)
-    Y=A.dot(Omega) if type(A) is np.ndarray else np.array([A(r) for r in Omega.T]).T
+    Y=_blockact(A,Omega)
     eigv=np.zeros(0); eigf_vec=np.zeros((dim,0))
     num_eigs=0
     while num_eigs<dim+np.float_(increment_k)/2:
@@ -187,7 +203,7 @@ def _geigen_randproj(Omega,Y_bar,Y,B):
     """
     #-------- begin pre-CholQR(Y,B) -------#
     Z,_=np.linalg.qr(Y)
-    BZ=B.dot(Z) if type(B) is np.ndarray else np.array([B(r) for r in Z.T]).T
+    BZ=_blockact(B,Z)
     R=np.linalg.cholesky(Z.T.dot(BZ))
     Q=np.linalg.solve(R,Z.T).T
     #-------- end pre-CholQR(Y,B) -------#
@@ -216,15 +232,8 @@ def geigen_RA_rank(A,B,invB,dim=None,k=20,p=10):
     if dim is None:
         dim=A.shape[0]
     Omega=np.random.randn(dim,k+p)
-    if all([type(x) is np.ndarray for x in (A,invB)]):
-        Y_bar=A.dot(Omega)
-        Y=invB.dot(Y_bar)
-    else:
-        Y_bar=np.zeros((dim,k+p))
-        Y=np.zeros((dim,k+p))
-        for i in range(k+p):
-            Y_bar[:,i]=A(Omega[:,i])
-            Y[:,i]=invB(Y_bar[:,i])
+    Y_bar=_blockact(A,Omega)
+    Y=_blockact(invB,Y_bar)
     eigv,eigf_vec=_geigen_randproj(Omega,Y_bar,Y,B)
     eigv=eigv[:k]
     eigf_vec=eigf_vec[:,:k]
@@ -243,15 +252,8 @@ def geigen_RA_prec(A,B,invB,dim=None,threshold=0.01,increment_k=20,p=10):
     if dim is None:
         dim=A.shape[0]
     Omega=np.random.randn(dim,increment_k+p)
-    if all([type(x) is np.ndarray for x in (A,invB)]):
-        Y_bar=A.dot(Omega)
-        Y=invB.dot(Y_bar)
-    else:
-        Y_bar=np.zeros((dim,increment_k+p))
-        Y=np.zeros((dim,increment_k+p))
-        for i in range(increment_k+p):
-            Y_bar[:,i]=A(Omega[:,i])
-            Y[:,i]=invB(Y_bar[:,i])
+    Y_bar=_blockact(A,Omega)
+    Y=_blockact(invB,Y_bar)
     eigv=np.zeros(0); eigf_vec=np.zeros((dim,0))
     num_eigs=0
     BOmega=None
@@ -267,20 +269,57 @@ def geigen_RA_prec(A,B,invB,dim=None,threshold=0.01,increment_k=20,p=10):
             break
         else:
             if BOmega is None:
-                BOmega=B.dot(Omega) if type(B) is np.ndarray else np.array([B(r) for r in Omega.T]).T
+                BOmega=_blockact(B,Omega)
             Y-=(eigf_vec_k*eigv_k).dot(eigf_vec_k.T).dot(BOmega)
-            Y_bar=np.array([B(Y[:,i]) for i in range(increment_k+p)]).T
+            Y_bar=_blockact(B,Y)
         num_eigs+=increment_k
     eigs = eigv,eigf_vec
     
     return eigs
 
+def geigen_RA_warm(A,B,invB,dim=None,k=20,p=10,eigs0=None,q=3,tol=0.1):
+    """
+    Get partial generalized eigen-pairs of pencile (A,B) for fixed rank, warm-started from eigen-pairs eigs0 of a nearby pencile,
+    e.g. the one at the current state of MCMC.
+    The random sketch of geigen_RA_rank is replaced with the previous (B-orthonormal) eigen-vectors and q (<p) fresh random directions,
+    so k+q instead of k+p actions of A are needed.
+    The recycled subspace is checked by the relative residual of the previous eigen-vectors at their Rayleigh quotients,
+    sqrt(sum_i |A u_i - rho_i B u_i|^2_{invB}) / sqrt(sum_i rho_i^2), using the computed actions only;
+    the eigen-pairs are recomputed from scratch with geigen_RA_rank if it exceeds tol.
+    """
+    if dim is None:
+        dim=A.shape[0]
+    if eigs0 is None or eigs0[1].shape[1]<k:
+        return geigen_RA_rank(A,B,invB,dim,k,p)
+    U0=eigs0[1][:,:k]
+    Omega=np.hstack([U0,np.random.randn(dim,q)])
+    Y_bar=_blockact(A,Omega)
+    Y=_blockact(invB,Y_bar)
+    # residual check of the recycled eigen-vectors
+    rho=np.sum(U0*Y_bar[:,:k],axis=0)
+    R_bar=Y_bar[:,:k]-_blockact(B,U0)*rho
+    R=Y[:,:k]-U0*rho
+    err=np.sqrt(max(np.sum(R_bar*R),0)/np.sum(rho**2))
+    if err>tol:
+        return geigen_RA_rank(A,B,invB,dim,k,p)
+    eigv,eigf_vec=_geigen_randproj(Omega,Y_bar,Y,B)
+    eigv=eigv[:k]
+    eigf_vec=eigf_vec[:,:k]
+    eigs = eigv,eigf_vec
+    
+    return eigs
+
 def geigen_RA(A,B,invB,dim=None,**kwargs):
     """
     Get partial generalized eigen-pairs of pencile (A,B).
+    Fixed rank solutions are warm-started from eigen-pairs eigs0 if provided.
     """
+    eigs0=kwargs.pop('eigs0',None)
     if 'k' in kwargs:
-        eigs = geigen_RA_rank(A,B,invB,dim,**kwargs)
+        if eigs0 is None:
+            eigs = geigen_RA_rank(A,B,invB,dim,**kwargs)
+        else:
+            eigs = geigen_RA_warm(A,B,invB,dim,eigs0=eigs0,**kwargs)
     elif 'threshold' in kwargs:
         eigs = geigen_RA_prec(A,B,invB,dim,**kwargs)
     else:
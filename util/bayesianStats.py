@@ -6,13 +6,15 @@
 
 """ Calculate Bayesian statistics sucj as Heighst Posterior Density (HPD) and
 Effective Sample Size (Beast interpretation).
+Autocorrelations of all coordinates are computed at once via FFT;
+split R-hat is provided for multiple chains.
 """
 
 from __future__ import division
 
 import numpy
 
-__all__ = ["hpd", "effectiveSampleSize"]
+__all__ = ["hpd", "autocovariance", "integratedAutocorrTime", "effectiveSampleSize", "splitRhat"]
 
 def hpd(data, level) :
   """ The Highest Posterior Density (credible) interval of C{data} at level C{level}
@@ -39,8 +41,74 @@ def hpd(data, level) :
   return (d[i], d[i+nIn-1])
 
 
+def autocovariance(data, maxLag = None) :
+  """ Autocovariances gamma[lag] = sum_t x_t x_{t+lag} / (samples-lag) of centered C{data}
+  for lags 0,...,maxLag-1, computed for all columns of a (samples x dim) array at once by FFT."""
+  data = numpy.asarray(data, dtype = float)
+  samples = data.shape[0]
+  if maxLag is None :
+    maxLag = samples
+  
+  normalizedData = data - data.mean(axis = 0)
+  # zero padding to avoid circular wrap-around
+  nFFT = 1 << int(numpy.ceil(numpy.log2(2*samples)))
+  f = numpy.fft.rfft(normalizedData, n = nFFT, axis = 0)
+  acov = numpy.fft.irfft(f * f.conjugate(), n = nFFT, axis = 0)[:maxLag]
+  
+  return acov / (samples - numpy.arange(maxLag)).reshape((-1,) + (1,)*(data.ndim-1))
+
+def integratedAutocorrTime(data, stepSize = 1) :
+  """ Integrated autocorrelation time (of each column of C{data}), as computed by BEAST Tracer:
+  the autocovariance is summed in pairs of consecutive lags up to the first non-positive pair."""
+  samples = len(data)
+
+  assert samples > 1,"no stats for short sequences"
+  
+  maxLag = min(samples//3, 1000)
+  
+  gammaStat = autocovariance(data, maxLag)
+  
+  # sums of pairs (gamma[lag-1]+gamma[lag]) at even lags, kept until the first non-positive one
+  nPairs = (maxLag-1)//2
+  pairStat = gammaStat[1:2*nPairs:2] + gammaStat[2:2*nPairs+1:2]
+  keep = numpy.cumprod(pairStat > 0, axis = 0)
+  varStat = gammaStat[0] + 2.0*numpy.sum(pairStat * keep, axis = 0)
+  
+  # auto correlation time
+  act = stepSize * varStat / gammaStat[0]
+
+  return act
+
 def effectiveSampleSize(data, stepSize = 1) :
-  """ Effective sample size, as computed by BEAST Tracer."""
+  """ Effective sample size, as computed by BEAST Tracer.
+  For a (samples x dim) array, the ESS of all columns are returned."""
+  samples = len(data)
+  
+  # auto correlation time
+  act = integratedAutocorrTime(data, stepSize)
+
+  # effective sample size
+  ess = (stepSize * samples) / act
+
+  return ess
+
+def splitRhat(chains) :
+  """ Split potential scale reduction factor (R-hat) of C{chains}, a (chains x samples [x dim]) array:
+  each chain is split in halves and the between/within-chain variances of all halves are compared."""
+  chains = numpy.asarray(chains, dtype = float)
+  half = chains.shape[1]//2
+  
+  splits = numpy.concatenate((chains[:,:half], chains[:,-half:]), axis = 0)
+  
+  chainMean = splits.mean(axis = 1)
+  B = half * chainMean.var(axis = 0, ddof = 1)
+  W = splits.var(axis = 1, ddof = 1).mean(axis = 0)
+  varPlus = (half - 1) / half * W + B / half
+  
+  return numpy.sqrt(varPlus / W)
+
+def _effectiveSampleSize_direct(data, stepSize = 1) :
+  """ Effective sample size, as computed by BEAST Tracer, lag by lag (for reference)."""
   samples = len(data)
 
   assert len(data) > 1,"no stats for short sequences"
@@ -85,4 +153,26 @@ def effectiveSampleSize(data, stepSize = 1) :
   # effective sample size
   ess = (stepSize * samples) / act
 
-  return ess
\ No newline at end of file
+  return ess
+
+if __name__ == '__main__' :
+  import timeit
+  numpy.random.seed(2020)
+  # AR(1) chains of different correlations
+  samples, dim = 5000, 1681
+  rho = numpy.linspace(0, .95, dim)
+  data = numpy.zeros((samples, dim))
+  for t in range(1, samples) :
+    data[t] = rho * data[t-1] + numpy.random.randn(dim)
+  
+  t_start = timeit.default_timer()
+  ess_fft = effectiveSampleSize(data)
+  t_fft = timeit.default_timer() - t_start
+  t_start = timeit.default_timer()
+  ess_direct = numpy.array([_effectiveSampleSize_direct(data[:,i]) for i in range(0, dim, 40)])
+  t_direct = (timeit.default_timer() - t_start) * dim / len(ess_direct)
+  print('Max relative difference of ESS: %.2e' % numpy.max(abs(ess_fft[::40]/ess_direct-1)))
+  print('Time of ESS for %d x %d samples: %.2f seconds (FFT) vs %.2f seconds (lag by lag, extrapolated)' % (samples, dim, t_fft, t_direct))
+  # split R-hat
+  chains = numpy.stack([data[:samples//2], data[samples//2:]])
+  print('Split R-hat: min %.4f, max %.4f' % (splitRhat(chains).min(), splitRhat(chains).max()))
@@ -192,4 +192,51 @@ def vinPn(v, V):
         f = df.Function(V)
         f.interpolate(f_P1)
         vec = f.vector()
-    return vec
\ No newline at end of file
+    return vec
+# functions for block (multi-RHS) operations
+def mat_blockmult(M,X,transp=False):
+    """
+    Multiply an assembled matrix M (or its transpose) with the columns of numpy array X.
+    """
+    x = df.Vector(); y = df.Vector()
+    M.init_vector(x,0 if transp else 1)
+    M.init_vector(y,1 if transp else 0)
+    Y = np.zeros((y.local_size(),X.shape[1]))
+    for i in range(X.shape[1]):
+        x.set_local(X[:,i]); x.apply('insert')
+        if transp:
+            M.transpmult(x,y)
+        else:
+            M.mult(x,y)
+        Y[:,i] = y.get_local()
+    return Y
+
+def solve_blockrhs(solver,B,transp=False):
+    """
+    Solve with a factorized operator (PETScLUSolver) for multiple right hand sides, the columns of numpy array B, at once.
+    Batched triangular solves (MatMatSolve) on the existing factorization are used if petsc4py is available,
+    otherwise the columns are solved one by one, still reusing the factorization.
+    """
+    X = np.zeros(B.shape)
+    try:
+        from petsc4py import PETSc
+        ksp = solver.ksp(); ksp.setUp()
+        F = ksp.getPC().getFactorMatrix()
+        matsolve = F.matSolveTranspose if transp else F.matSolve
+        B_mat = PETSc.Mat().createDense(B.shape,comm=F.getComm()); B_mat.setUp()
+        B_mat.setValues(range(B.shape[0]),range(B.shape[1]),np.ascontiguousarray(B))
+        B_mat.assemble()
+        X_mat = B_mat.duplicate()
+        matsolve(B_mat,X_mat)
+        X[:] = X_mat.getDenseArray()
+    except (ImportError,AttributeError,RuntimeError):
+        x = df.Vector(df.MPI.comm_world,B.shape[0])
+        b = df.Vector(df.MPI.comm_world,B.shape[0])
+        for i in range(B.shape[1]):
+            b.set_local(B[:,i]); b.apply('insert')
+            if transp:
+                solver.solve_transpose(x,b)
+            else:
+                solver.solve(x,b)
+            X[:,i] = x.get_local()
+    return X
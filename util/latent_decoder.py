@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Batched latent-to-full transformer for post-processing DREAM samples
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Latent samples are streamed from disk in chunks and each chunk is decoded with one call of the autoencoder.
+The (linear) conversions between dolfin vectors and network inputs/outputs, e.g. vec2img/img2vec with chop/pad,
+are precomputed once as index maps (or sparse matrices), so no dolfin function is created per sample.
+--------------------
+Created Dec. 31, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import scipy.sparse as sps
+import h5py
+
+def _linmap(f,n):
+    """
+    Precompute a linear map f of n-vectors as an index map (idx,mask) with f(x)=x[idx]*mask if it only re-orders/masks entries,
+    otherwise as a sparse matrix by probing f with unit vectors
+    """
+    y=np.asarray(f(np.arange(1.,n+1)))
+    shape=y.shape; y=y.flatten()
+    idx=np.rint(y).astype('int')-1
+    mask=(idx>=0)&(idx<n)&np.isclose(y,idx+1)
+    idx[~mask]=0
+    # check with a random vector
+    x=np.random.RandomState(2020).randn(n)
+    if np.allclose(np.asarray(f(x)).flatten(),x[idx]*mask): return shape,(idx,mask)
+    print('Not a re-ordering map; probing it with %d unit vectors...' % n)
+    A=sps.hstack([sps.csc_matrix(np.asarray(f(e)).reshape((-1,1))) for e in np.eye(n)])
+    return shape,A.tocsr()
+
+def _apply(m,X):
+    """
+    Apply a precomputed map to rows of X
+    """
+    if isinstance(m,tuple):
+        idx,mask=m
+        return X[:,idx]*mask
+    else:
+        return m.dot(X.T).T
+
+def summarize(samples,wts=None,chunk_sz=500,transform=None,num_samp=None):
+    """
+    (Weighted) mean and std of (transformed) samples processed in chunks
+    --------------------------------------------------------------------
+    samples: name of HDF5 file with dataset 'samples' (streamed from disk), or array of samples
+    wts: weights of samples, uniform if None
+    transform: function applied to each chunk (rows as samples) before accumulation
+    """
+    if isinstance(samples,str):
+        f=h5py.File(samples,'r')
+        dset=f['samples']
+    else:
+        f=None
+        dset=samples
+    num_samp=dset.shape[0] if num_samp is None else min(num_samp,dset.shape[0])
+    wts=np.ones(num_samp) if wts is None else np.asarray(wts)[:num_samp]
+    wts=wts/wts.sum()
+    mean=0; sq=0
+    prog=np.ceil(num_samp*(.1+np.arange(0,1,.1)))
+    for i in range(0,num_samp,chunk_sz):
+        j=min(i+chunk_sz,num_samp)
+        X=np.asarray(dset[i:j])
+        if transform is not None: X=transform(X)
+        mean+=wts[i:j].dot(X)
+        sq+=wts[i:j].dot(X**2)
+        if any((i<prog)&(prog<=j)):
+            print('{0:.0f}% has been completed.'.format(float(j)/num_samp*100))
+    if f is not None: f.close()
+    std=np.sqrt(np.maximum(sq-mean**2,0))
+    return mean,std
+
+class LatentDecoder:
+    """
+    Decoder of latent samples (rows) into full parameters (rows in dolfin dof order) in batches
+    """
+    def __init__(self,autoencoder,lat_dim,lat2in=None,out2full=None):
+        """
+        Initialization
+        --------------
+        autoencoder: (trained) autoencoder with method decode working on batches
+        lat_dim: dimension of latent parameter
+        lat2in: (linear) map from a latent vector to one decoder input, e.g. lambda v: chop(vec2img(v))[:,:,None]
+        out2full: (linear) map from one decoder output to a full vector, e.g. lambda y: img2vec(pad(y)).get_local()
+        """
+        self.autoencoder=autoencoder
+        self.lat_dim=lat_dim
+        # precompute index maps
+        if lat2in is None: lat2in=lambda v: v
+        self.in_shape,self.in_map=_linmap(lat2in,self.lat_dim)
+        self.out_shape=self.autoencoder.decode(np.zeros((1,)+self.in_shape)).shape[1:]
+        if out2full is None: out2full=lambda y: y.flatten()
+        self.full_shape,self.out_map=_linmap(lambda y: out2full(y.reshape(self.out_shape)),int(np.prod(self.out_shape)))
+
+    def decode(self,U):
+        """
+        Decode latent samples U (num_samp x lat_dim) with one call of the autoencoder
+        """
+        U=np.atleast_2d(U)
+        X=_apply(self.in_map,U).reshape((-1,)+self.in_shape)
+        Y=self.autoencoder.decode(X).reshape((X.shape[0],-1))
+        return _apply(self.out_map,Y)
+
+    def summarize(self,samples,wts=None,chunk_sz=500,pre=None,post=None,num_samp=None):
+        """
+        (Weighted) mean and std of decoded latent samples, read and decoded in chunks
+        pre/post: functions applied to each chunk before/after decoding, e.g. un-whitening
+        """
+        def transform(U):
+            if pre is not None: U=pre(U)
+            X=self.decode(U)
+            if post is not None: X=post(X)
+            return X
+        return summarize(samples,wts,chunk_sz,transform,num_samp)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Online (streaming) summaries of MCMC samples
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Running (importance-weighted) mean and variance are updated sample by sample with Welford's (West's) algorithm,
+and the effective sample size is tracked with batch means, so that posterior mean/std fields are available
+at the end of sampling without another pass over the stored samples.
+--------------------
+Created Dec. 30, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+
+class OnlineStats:
+    """
+    Running summaries of samples (numpy arrays or dolfin vectors)
+    """
+    def __init__(self,dim,batch_sz=50):
+        """
+        Initialization
+        --------------
+        dim: dimension of each sample
+        batch_sz: size of batches whose means are used to estimate ESS
+        """
+        self.dim=dim
+        self.batch_sz=batch_sz
+        self.n=0
+        # weighted mean and variance, with the total weight in log scale
+        self.logW=-np.inf
+        self.mean=np.zeros(self.dim)
+        self.var=np.zeros(self.dim)
+        # unweighted mean and sum of squared deviations
+        self._mean_u=np.zeros(self.dim)
+        self._M2_u=np.zeros(self.dim)
+        # batch means
+        self.n_bat=0
+        self._bat_sum=np.zeros(self.dim)
+        self._bm_mean=np.zeros(self.dim)
+        self._bm_M2=np.zeros(self.dim)
+
+    def update(self,x,logw=0.):
+        """
+        Update the summaries with a new sample x of (log) importance weight logw
+        """
+        x=x.get_local() if hasattr(x,'get_local') else np.asarray(x)
+        self.n+=1
+        # weighted mean and variance
+        logW=np.logaddexp(self.logW,logw)
+        r=np.exp(logw-logW) # relative weight of the new sample
+        delta=x-self.mean
+        self.mean+=r*delta
+        self.var=(1-r)*(self.var+r*delta**2)
+        self.logW=logW
+        # unweighted mean and variance
+        delta=x-self._mean_u
+        self._mean_u+=delta/self.n
+        self._M2_u+=delta*(x-self._mean_u)
+        # batch means
+        self._bat_sum+=x
+        if self.n%self.batch_sz==0:
+            bat_mean=self._bat_sum/self.batch_sz
+            self._bat_sum[:]=0
+            self.n_bat+=1
+            delta=bat_mean-self._bm_mean
+            self._bm_mean+=delta/self.n_bat
+            self._bm_M2+=delta*(bat_mean-self._bm_mean)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def ess(self):
+        """
+        Batch-means estimate of effective sample size: n * sample variance / (batch size * variance of batch means)
+        """
+        if self.n_bat<2:
+            return np.full(self.dim,np.nan)
+        var_u=self._M2_u/(self.n-1)
+        var_bm=self.batch_sz*self._bm_M2/(self.n_bat-1)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.where(var_bm>0,self.n*var_u/var_bm,np.nan)
+
+    def save(self,store,prefix=''):
+        """
+        Write mean, std and ESS with a store that has method write(name,value), e.g. SampleStore
+        """
+        store.write(prefix+'mean',self.mean)
+        store.write(prefix+'std',self.std)
+        store.write(prefix+'ess',self.ess())
+
+    def __repr__(self):
+        ess=self.ess()
+        if np.all(np.isnan(ess)):
+            return 'online summaries of %d samples' % self.n
+        return 'online summaries of %d samples: batch-means ESS (min, median, max) = (%.1f, %.1f, %.1f)' % ((self.n,)+tuple(np.nanpercentile(ess,[0,50,100])))
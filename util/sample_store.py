@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Streaming, chunked store of MCMC samples
+Shiwei Lan @ ASU, 2020
+--------------------------------------
+Samples are appended to a single chunked, extendible 2-D dataset 'samples' (num_samp x dim) in an HDF5 file,
+buffered in memory and flushed every buf_sz samples. Other records (loglik, logwts, times, etc.) sit alongside
+as separate datasets in the same file. The whole (or a slice of the) sample array is read back in one go.
+--------------------
+Created Dec. 26, 2020 @ ASU
+"""
+__author__ = "Shiwei Lan"
+__copyright__ = "Copyright 2020, The NN-MCMC project"
+__license__ = "GPL"
+__version__ = "0.1"
+__maintainer__ = "Shiwei Lan"
+__email__ = "slan@asu.edu; lanzithinking@outlook.com"
+
+import numpy as np
+import h5py
+
+class SampleStore:
+    """
+    Buffered writer of samples to a chunked, extendible HDF5 dataset
+    """
+    def __init__(self,fname,dim,mode='w',buf_sz=100,**kwargs):
+        """
+        Initialization
+        --------------
+        fname: name of the HDF5 file
+        dim: dimension of each sample
+        mode: 'w' to create a new store or 'a' to append to an existing one
+        buf_sz: number of samples buffered before they are written
+        num_keep: (mode 'a') number of stored samples to keep, the rest are discarded, e.g. when resuming from a checkpoint
+        """
+        self.fname=fname
+        self.dim=dim
+        self.buf_sz=buf_sz
+        self.file=h5py.File(self.fname,mode)
+        if 'samples' in self.file:
+            self.dset=self.file['samples']
+            if self.dset.shape[1]!=self.dim: raise ValueError('Dimension of stored samples not matching!')
+            num_keep=kwargs.pop('num_keep',None)
+            if num_keep is not None and num_keep<self.dset.shape[0]: self.dset.resize(num_keep,axis=0)
+        else:
+            chunk_sz=kwargs.pop('chunk_sz',self.buf_sz)
+            self.dset=self.file.create_dataset('samples',shape=(0,self.dim),maxshape=(None,self.dim),
+                                               chunks=(max(1,min(chunk_sz,int(2**20/8/self.dim))),self.dim),dtype=kwargs.pop('dtype','f8'))
+        self.buf=np.zeros((self.buf_sz,self.dim),dtype=self.dset.dtype)
+        self.n_buf=0
+
+    def __len__(self):
+        return self.dset.shape[0]+self.n_buf
+
+    def append(self,x):
+        """
+        Append one sample (numpy array or dolfin vector)
+        """
+        self.buf[self.n_buf]=x.get_local() if hasattr(x,'get_local') else x
+        self.n_buf+=1
+        if self.n_buf==self.buf_sz: self.flush()
+
+    def flush(self):
+        """
+        Write buffered samples to file
+        """
+        if self.n_buf>0:
+            n=self.dset.shape[0]
+            self.dset.resize(n+self.n_buf,axis=0)
+            self.dset[n:]=self.buf[:self.n_buf]
+            self.n_buf=0
+        self.file.flush()
+
+    def write(self,name,value):
+        """
+        Write (or overwrite) a whole record alongside samples, e.g. loglik, logwts, times
+        """
+        if name in self.file: del self.file[name]
+        self.file.create_dataset(name,data=np.asarray(value))
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+def load_samples(fname,start=0,stop=None,name='samples'):
+    """
+    Bulk read of (a slice of) stored samples or other records
+    """
+    with h5py.File(fname,'r') as f:
+        samp=f[name][start:stop]
+    return samp
@@ -79,6 +79,26 @@ def csr_trim0(mat_sps,threshold=1e-10):
     mat_sps.eliminate_zeros()
 #     return mat_sps
 
+## Build sparse exponential kernel matrix by neighbor search ##
+
+def sparse_expker(coords,sigma=1.,s=1.,threshold=1e-10,chunk_sz=1000):
+    """
+    Sparse kernel matrix K with K_ij = sigma^2 exp(-||x_i-x_j||/(2s)), keeping only entries >= threshold.
+    Neighbors within the cut-off distance are found by radius search on a KD-tree, in chunks of rows,
+    so the dense pairwise distance matrix is never formed: memory and time are O(N * neighbors).
+    """
+    from scipy.spatial import cKDTree
+    N=coords.shape[0]
+    r=2*s*np.log(sigma**2/threshold) # entries beyond distance r are below the threshold
+    tree=cKDTree(coords)
+    K_blks=[]
+    for start in range(0,N,chunk_sz):
+        coords_blk=coords[start:start+chunk_sz]
+        ijv=cKDTree(coords_blk).sparse_distance_matrix(tree,max(r,0),output_type='ndarray')
+        K_blks.append(sps.csr_matrix((sigma**2*np.exp(-ijv['v']/(2*s)),(ijv['i'],ijv['j'])),shape=(coords_blk.shape[0],N)))
+    K=sps.vstack(K_blks,format='csr')
+    csr_trim0(K,threshold)
+    return K
 
 ## Save / load scipy sparse csr_matrix in portable data format ##
 # http://stackoverflow.com/questions/8955448/save-load-scipy-sparse-csr-matrix-in-portable-data-format ##